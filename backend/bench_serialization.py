@@ -0,0 +1,84 @@
+import argparse
+import json
+import time
+import zlib
+from fastapi.encoders import jsonable_encoder
+from models import PromptTestCase, RunPromptResponse
+from serialization import dumps
+from compression import available_encodings, brotli, zstandard
+
+try:
+    from orjson import loads
+except ImportError:  # orjson là tuỳ chọn
+    from json import loads
+
+
+def make_response(num_cases: int) -> RunPromptResponse:
+    """Suite giả lập: input / output tiếng Việt dài cỡ một câu trả lời thật"""
+    test_cases = [
+        PromptTestCase(
+            input=f"Đánh giá phát âm của học viên cho câu số {i}: 'Tôi đang học tiếng Anh mỗi ngày' " * 3,
+            expected_output="Phát âm chuẩn, ngữ điệu tự nhiên, cần chú ý âm cuối /s/ và trọng âm từ. " * 4,
+            prompt_output="Phát âm khá chuẩn, ngữ điệu tự nhiên, chú ý âm cuối /s/ và trọng âm câu. " * 4,
+            is_correct=i % 3 != 0,
+            similarity_score=0.87
+        )
+        for i in range(num_cases)
+    ]
+    return RunPromptResponse(test_cases=test_cases, total_time=12.5)
+
+
+def default_path(response: RunPromptResponse) -> bytes:
+    # Đường mặc định của FastAPI: validate lại theo response_model, jsonable_encoder, json.dumps
+    validated = RunPromptResponse.model_validate(response.model_dump())
+    return json.dumps(jsonable_encoder(validated), ensure_ascii=False, allow_nan=False,
+                      indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def decompress(name: str, data: bytes) -> bytes:
+    """Giải nén bằng decoder của chính encoding (như phía client)"""
+    if name == "gzip":
+        return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+    if name == "br":
+        return brotli.decompress(data)
+    if name == "zstd":
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    raise ValueError(f"Unknown encoding: {name}")
+
+
+def timeit(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(sizes, repeat: int) -> None:
+    for size in sizes:
+        response = make_response(size)
+        baseline = timeit(lambda: default_path(response), repeat)
+        fast = timeit(lambda: dumps(response), repeat)
+        body = dumps(response)
+        # Output của fast encoder phải decode ra đúng payload của đường mặc định
+        assert loads(body) == jsonable_encoder(response)
+        print(f"\n{size} cases, {len(body) / 1e6:.2f} MB JSON")
+        print(f"  default encoder : {baseline * 1000:8.1f} ms")
+        print(f"  fast encoder    : {fast * 1000:8.1f} ms  ({baseline / fast:.1f}x)")
+        for name, encoder_cls in available_encodings().items():
+            def compress():
+                encoder = encoder_cls()
+                return encoder.compress(body) + encoder.finish()
+            elapsed = timeit(compress, repeat)
+            compressed = compress()
+            assert decompress(name, compressed) == body
+            print(f"  {name:<16}: {elapsed * 1000:8.1f} ms  (ratio {len(body) / len(compressed):.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmark serialize + nén response của suite")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    run(args.sizes, args.repeat)
@@ -0,0 +1,117 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DISCONNECT_POLL_INTERVAL = 0.5
+
+
+class RunCancelledError(Exception):
+    """Run bị huỷ vì không còn ai chờ kết quả (client ngắt kết nối)"""
+
+
+class CancellationToken:
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason = ""
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    def raise_if_cancelled(self) -> None:
+        if self._event.is_set():
+            raise RunCancelledError(self.reason)
+
+    def sleep(self, seconds: float) -> None:
+        """time.sleep nhưng thức dậy ngay khi token bị huỷ"""
+        if self._event.wait(seconds):
+            raise RunCancelledError(self.reason)
+
+    def wait_for(self, future: concurrent.futures.Future, poll_interval: float = 0.05):
+        """Chờ kết quả của future, bỏ chờ ngay khi token bị huỷ"""
+        while True:
+            try:
+                return future.result(timeout=poll_interval)
+            except concurrent.futures.TimeoutError:
+                if self._event.is_set():
+                    future.cancel()
+                    raise RunCancelledError(self.reason)
+
+
+_current_token: contextvars.ContextVar[Optional[CancellationToken]] = contextvars.ContextVar(
+    "cancellation_token", default=None
+)
+
+
+def current_token() -> Optional[CancellationToken]:
+    return _current_token.get()
+
+
+def check_cancelled() -> None:
+    """Raise RunCancelledError nếu run hiện tại đã bị huỷ"""
+    token = _current_token.get()
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+def sleep(seconds: float) -> None:
+    """Sleep có thể bị huỷ (dùng cho backoff giữa các lần retry)"""
+    token = _current_token.get()
+    if token is None:
+        time.sleep(seconds)
+    else:
+        token.sleep(seconds)
+
+
+@contextmanager
+def use_token(token: CancellationToken):
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+
+
+def _run_with_token(token: CancellationToken, func: Callable, args, kwargs):
+    with use_token(token):
+        return func(*args, **kwargs)
+
+
+async def run_with_token(token: CancellationToken, func: Callable, *args, **kwargs):
+    """Chạy func (sync) trong threadpool với token của run (dùng khi một run gồm nhiều bước)"""
+    return await run_in_threadpool(_run_with_token, token, func, args, kwargs)
+
+
+async def run_until_disconnected(request: Request, func: Callable, *args, **kwargs):
+    """Chạy func (sync) trong threadpool, huỷ run khi HTTP client ngắt kết nối"""
+    token = CancellationToken()
+    task = asyncio.ensure_future(run_in_threadpool(_run_with_token, token, func, args, kwargs))
+
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                logger.info(f"Client disconnected from {request.url.path}, cancelling run")
+                token.cancel("client disconnected")
+                raise RunCancelledError(token.reason)
+    except asyncio.CancelledError:
+        # Server huỷ handler (ví dụ shutdown): dừng luôn các model call còn lại
+        token.cancel("request cancelled")
+        raise
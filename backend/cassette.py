@@ -0,0 +1,216 @@
+import glob
+import gzip
+import hashlib
+import importlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from functools import lru_cache
+from typing import Any, Deque, Dict, List, Optional, Type
+from openai.types.chat import ChatCompletion
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# off | record | replay
+CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", "off").lower()
+CASSETTE_PATH = os.getenv("LLM_CASSETTE_PATH", "cassettes/model_traffic.jsonl.gz")
+# 1.0 = replay đúng latency gốc, 0 = trả ngay (đo overhead của chính backend)
+CASSETTE_LATENCY_SCALE = float(os.getenv("LLM_CASSETTE_LATENCY_SCALE", "1.0"))
+
+
+class CassetteMissError(Exception):
+    """Request không có trong cassette khi replay"""
+
+
+class CassetteReplayError(Exception):
+    """Lỗi gốc đã được ghi lại trong cassette, được phát lại khi replay.
+
+    Lỗi replay là subclass của cả kiểu lỗi gốc (openai.RateLimitError...) nếu import được,
+    nên retry / circuit breaker xử lý giống lúc record.
+    """
+
+
+@lru_cache(maxsize=None)
+def _replay_error_class(error_type: Optional[str]) -> Type[Exception]:
+    if error_type:
+        module_name, _, name = error_type.rpartition(".")
+        try:
+            original = getattr(importlib.import_module(module_name), name)
+        except (ImportError, AttributeError, ValueError):
+            original = None
+        if isinstance(original, type) and issubclass(original, Exception):
+            return type(name, (original, CassetteReplayError), {})
+    return CassetteReplayError
+
+
+def replay_error(entry: Dict) -> Exception:
+    """Dựng lại lỗi đã ghi; không gọi __init__ của lỗi gốc (openai cần request / response thật)"""
+    cls = _replay_error_class(entry.get("error_type"))
+    error = cls.__new__(cls)
+    Exception.__init__(error, entry["error"])
+    error.message = entry["error"]
+    if entry.get("status_code") is not None:
+        error.status_code = entry["status_code"]
+    return error
+
+
+def cassette_files(path: str) -> List[str]:
+    """File của cassette: path (cassette đã gộp) và các file {path}.{pid} ghi bởi từng process"""
+    pattern = re.compile(re.escape(path) + r"\.\d+$")
+    files = [name for name in glob.glob(glob.escape(path) + ".*") if pattern.match(name)]
+    return ([path] if os.path.exists(path) else []) + sorted(files)
+
+
+def read_entries(name: str) -> List[Dict]:
+    """Record trong một file cassette. File của process chết giữa chừng không có trailer gzip
+    (hoặc dòng cuối ghi dở): giữ các record đọc được trước đoạn hỏng."""
+    entries = []
+    try:
+        with gzip.open(name, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entries.append(json.loads(line))
+    except (EOFError, gzip.BadGzipFile, json.JSONDecodeError) as e:
+        logger.warning(f"Cassette file {name} is truncated ({str(e)}), "
+                       f"replaying the {len(entries)} record(s) before it")
+    return entries
+
+
+def request_key(model: str, messages: List[Dict], params: Dict) -> str:
+    payload = json.dumps({"model": model, "messages": messages, **params}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Completions:
+    def __init__(self, cassette: "CassetteClient"):
+        self._cassette = cassette
+
+    def create(self, model: str, messages: List[Dict], **params):
+        return self._cassette.create(model, messages, params)
+
+
+class _Chat:
+    def __init__(self, cassette: "CassetteClient"):
+        self.completions = _Completions(cassette)
+
+
+class CassetteClient:
+    """Bọc OpenAI client: record ghi mọi request/response (kèm timing) vào file
+    JSONL nén gzip; replay trả lại response đã ghi với latency gốc (có thể scale).
+
+    Mỗi process ghi file riêng {path}.{pid} (nhiều worker append chung một file gzip làm hỏng
+    file); replay gộp mọi file của cassette theo thời điểm bắt đầu call.
+    """
+
+    def __init__(self, mode: str, path: str, client=None, latency_scale: float = CASSETTE_LATENCY_SCALE):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.mode = mode
+        self.path = path
+        self.latency_scale = latency_scale
+        self._client = client
+        self._lock = threading.Lock()
+        # pid -> file đang ghi; file kế thừa qua fork được giữ lại, không close (close sẽ ghi
+        # trailer gzip vào file của process cha)
+        self._files: Dict[int, Any] = {}
+        self._entries: Dict[str, Deque[Dict]] = defaultdict(deque)
+        self.chat = _Chat(self)
+
+        if mode == "record":
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        else:
+            self._load()
+
+    def _load(self) -> None:
+        files = cassette_files(self.path)
+        if not files:
+            raise FileNotFoundError(f"No cassette recorded at {self.path}")
+        entries = []
+        for name in files:
+            entries.extend(read_entries(name))
+        # Request giống nhau từ nhiều process được replay theo thứ tự đã gửi
+        entries.sort(key=lambda entry: entry.get("started_at", 0))
+        for entry in entries:
+            self._entries[entry["key"]].append(entry)
+        logger.info(f"Loaded {len(entries)} recorded model call(s) from {len(files)} file(s) of {self.path}")
+
+    def __getattr__(self, name: str) -> Any:
+        # Các API khác (models.list...) đi thẳng tới client thật
+        if self._client is None:
+            raise AttributeError(f"{name} is not available in cassette replay mode")
+        return getattr(self._client, name)
+
+    def create(self, model: str, messages: List[Dict], params: Dict):
+        key = request_key(model, messages, params)
+        if self.mode == "replay":
+            return self._replay(key)
+
+        started_at = time.time()
+        entry = {
+            "key": key,
+            "request": {"model": model, "messages": messages, **params},
+            "started_at": started_at
+        }
+        try:
+            completion = self._client.chat.completions.create(model=model, messages=messages, **params)
+        except Exception as e:
+            entry.update(
+                latency=time.time() - started_at,
+                error=f"{type(e).__name__}: {str(e)}",
+                error_type=f"{type(e).__module__}.{type(e).__qualname__}",
+                status_code=getattr(e, "status_code", None)
+            )
+            self._write(entry)
+            raise
+        entry.update(latency=time.time() - started_at, response=completion.model_dump(mode="json"))
+        self._write(entry)
+        return completion
+
+    def _write(self, entry: Dict) -> None:
+        line = json.dumps(entry, ensure_ascii=False)
+        pid = os.getpid()
+        with self._lock:
+            f = self._files.get(pid)
+            if f is None:
+                # gzip cho phép append nhiều member vào cùng một file (process chạy lại cùng pid)
+                f = self._files[pid] = gzip.open(f"{self.path}.{pid}", "at", encoding="utf-8")
+            f.write(line + "\n")
+            f.flush()
+
+    def _replay(self, key: str):
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                raise CassetteMissError(f"No recorded response for request {key[:12]}")
+            # Request giống hệt nhau được trả lần lượt; bản ghi cuối cùng được dùng lại
+            entry = entries.popleft() if len(entries) > 1 else entries[0]
+
+        if self.latency_scale > 0:
+            time.sleep(entry["latency"] * self.latency_scale)
+        if "error" in entry:
+            raise replay_error(entry)
+        return ChatCompletion.model_validate(entry["response"])
+
+    def close(self) -> None:
+        with self._lock:
+            f = self._files.pop(os.getpid(), None)
+            if f is not None:
+                f.close()
+        if self._client is not None:
+            self._client.close()
+
+
+def wrap_client(client=None, mode: Optional[str] = None, path: Optional[str] = None):
+    """Bọc client theo LLM_CASSETTE_MODE; mode "off" trả về client gốc"""
+    mode = (mode or CASSETTE_MODE).lower()
+    if mode == "off":
+        return client
+    logger.info(f"Model traffic cassette in {mode} mode: {path or CASSETTE_PATH}")
+    return CassetteClient(mode, path or CASSETTE_PATH, client)
@@ -0,0 +1,265 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+import openai
+from starlette.datastructures import MutableHeaders
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BREAKER_ENABLED = os.getenv("BREAKER_ENABLED", "true").lower() == "true"
+# Tỷ lệ lỗi trong cửa sổ BREAKER_WINDOW giây (tối thiểu BREAKER_MIN_REQUESTS call) để mở breaker
+BREAKER_WINDOW = float(os.getenv("BREAKER_WINDOW", "30"))
+BREAKER_MIN_REQUESTS = int(os.getenv("BREAKER_MIN_REQUESTS", "10"))
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+# Thời gian breaker mở trước khi cho call thăm dò (half-open)
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+BREAKER_HALF_OPEN_PROBES = int(os.getenv("BREAKER_HALF_OPEN_PROBES", "1"))
+# Model dự phòng khi breaker của model chính đang mở (rỗng = fail fast)
+FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL", "")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Lỗi cho thấy backend không khoẻ; lỗi do request (400, 401, ...) không tính
+OUTAGE_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+    openai.RateLimitError,
+    TimeoutError,
+    ConnectionError,
+)
+
+
+class CircuitOpenError(Exception):
+    """Breaker của model đang mở: call bị từ chối ngay, không gửi tới backend"""
+
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(f"Circuit open for {model}, retry after {retry_after:.0f}s")
+        self.model = model
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Breaker của một model: closed -> open khi tỷ lệ lỗi vượt ngưỡng, sau
+    BREAKER_OPEN_SECONDS cho một số call thăm dò (half-open); thăm dò thành công thì
+    đóng lại, lỗi thì mở tiếp."""
+
+    def __init__(self, name: str, window: float = BREAKER_WINDOW, min_requests: int = BREAKER_MIN_REQUESTS,
+                 error_rate: float = BREAKER_ERROR_RATE, open_seconds: float = BREAKER_OPEN_SECONDS,
+                 half_open_probes: int = BREAKER_HALF_OPEN_PROBES):
+        self.name = name
+        self.window = window
+        self.min_requests = min_requests
+        self.error_rate = error_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self._lock = threading.Lock()
+        self._outcomes: deque = deque()  # (timestamp, ok)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self.rejected = 0
+        self.trips = 0
+
+    def _trim(self, now: float) -> None:
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            self._outcomes.popleft()
+
+    def _open(self, now: float) -> None:
+        self._state = OPEN
+        self._opened_at = now
+        self._probes = 0
+        self.trips += 1
+        logger.warning(f"Circuit breaker for {self.name} opened")
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.time() - self._opened_at >= self.open_seconds:
+                return HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Có được gửi call không; ở half-open chỉ cho tối đa half_open_probes call"""
+        now = time.time()
+        with self._lock:
+            if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+                self._state = HALF_OPEN
+                self._probes = 0
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probes < self.half_open_probes:
+                self._probes += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def retry_after(self) -> float:
+        with self._lock:
+            return max(0.0, self._opened_at + self.open_seconds - time.time())
+
+    def record_success(self) -> None:
+        now = time.time()
+        with self._lock:
+            if self._state == HALF_OPEN:
+                logger.info(f"Circuit breaker for {self.name} closed after successful probe")
+                self._state = CLOSED
+                self._outcomes.clear()
+            self._outcomes.append((now, True))
+            self._trim(now)
+
+    def record_failure(self) -> None:
+        now = time.time()
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._open(now)
+                return
+            self._outcomes.append((now, False))
+            self._trim(now)
+            if self._state == CLOSED and len(self._outcomes) >= self.min_requests:
+                failures = sum(1 for _, ok in self._outcomes if not ok)
+                if failures / len(self._outcomes) >= self.error_rate:
+                    self._open(now)
+
+    def record_ignored(self) -> None:
+        """Call kết thúc mà không nói được gì về backend (huỷ, lỗi request): trả slot thăm dò"""
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def snapshot(self) -> Dict:
+        state = self.state
+        with self._lock:
+            total = len(self._outcomes)
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            return {
+                "state": state,
+                "window_requests": total,
+                "window_error_rate": failures / total if total else 0.0,
+                "trips": self.trips,
+                "rejected": self.rejected
+            }
+
+
+class BreakerRegistry:
+    """Một breaker cho mỗi model (backend); chọn model dự phòng khi breaker mở"""
+
+    def __init__(self, fallback_model: str = FALLBACK_MODEL, **breaker_options):
+        self.fallback_model = fallback_model
+        self.breaker_options = breaker_options
+        self._lock = threading.Lock()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, model: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(model)
+            if breaker is None:
+                breaker = self._breakers[model] = CircuitBreaker(model, **self.breaker_options)
+            return breaker
+
+    def route(self, model: str) -> str:
+        """Model sẽ nhận call: model gốc, model dự phòng (đánh dấu degraded), hoặc CircuitOpenError"""
+        if not BREAKER_ENABLED:
+            return model
+        breaker = self.get(model)
+        if breaker.allow():
+            return model
+        fallback = self.fallback_model
+        if fallback and fallback != model and self.get(fallback).allow():
+            mark_degraded(f"fallback_model:{model}->{fallback}")
+            return fallback
+        mark_degraded(f"circuit_open:{model}")
+        raise CircuitOpenError(model, breaker.retry_after())
+
+    def record(self, model: str, error: Optional[BaseException] = None) -> None:
+        if not BREAKER_ENABLED:
+            return
+        breaker = self.get(model)
+        if error is None:
+            breaker.record_success()
+        elif isinstance(error, OUTAGE_ERRORS):
+            breaker.record_failure()
+        else:
+            breaker.record_ignored()
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {name: breaker.snapshot() for name, breaker in breakers.items()}
+
+
+breakers = BreakerRegistry()
+
+
+# Lý do degraded của request hiện tại (fallback model, breaker mở, output dự phòng)
+_current_degradation: contextvars.ContextVar[Optional[List[str]]] = contextvars.ContextVar(
+    "degradation", default=None
+)
+
+
+def mark_degraded(reason: str) -> None:
+    reasons = _current_degradation.get()
+    if reasons is not None and reason not in reasons:
+        reasons.append(reason)
+
+
+def degraded_reasons() -> Optional[List[str]]:
+    """Lý do degraded của request hiện tại, None nếu response bình thường"""
+    reasons = _current_degradation.get()
+    return list(reasons) if reasons else None
+
+
+@contextmanager
+def track_degradation():
+    reasons: List[str] = []
+    reset = _current_degradation.set(reasons)
+    try:
+        yield reasons
+    finally:
+        _current_degradation.reset(reset)
+
+
+@contextmanager
+def degradation_scope():
+    """Lý do degraded phát sinh trong khối lệnh (cả khi không nằm trong request).
+
+    Lý do vẫn được chuyển lên request bao ngoài (nếu có) khi khối lệnh kết thúc.
+    """
+    outer = _current_degradation.get()
+    with track_degradation() as reasons:
+        try:
+            yield reasons
+        finally:
+            if outer is not None:
+                outer.extend(reason for reason in reasons if reason not in outer)
+
+
+class DegradationMiddleware:
+    """ASGI middleware gom lý do degraded của request, trả trong header `x-degraded`"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with track_degradation() as reasons:
+            async def send_with_degradation(message):
+                if message["type"] == "http.response.start" and reasons:
+                    message = dict(message)
+                    message["headers"] = list(message.get("headers", []))
+                    headers = MutableHeaders(scope=message)
+                    headers["x-degraded"] = ",".join(reasons)
+                await send(message)
+
+            await self.app(scope, receive, send_with_degradation)
@@ -0,0 +1,18 @@
+from collections import Counter
+from typing import List, Tuple
+
+
+def normalize_output(text: str) -> str:
+    """Chuẩn hoá output trước khi so khớp giữa các sample (bỏ khác biệt khoảng trắng)"""
+    return " ".join(text.split())
+
+
+def majority_vote(samples: List[str]) -> Tuple[str, float]:
+    """Trả về (sample chiếm đa số, tỷ lệ sample đồng ý với nó)"""
+    if not samples:
+        return "", 0.0
+    normalized = [normalize_output(sample) for sample in samples]
+    counts = Counter(normalized)
+    # Counter giữ thứ tự xuất hiện nên khi hoà, output xuất hiện trước thắng
+    majority_key, majority_count = counts.most_common(1)[0]
+    return samples[normalized.index(majority_key)], majority_count / len(samples)
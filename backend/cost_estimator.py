@@ -0,0 +1,114 @@
+import json
+import logging
+import math
+from functools import lru_cache
+from typing import List, Optional
+from models import PromptTestCase, CostEstimate
+from run_prompt import PACKING_INSTRUCTION, PACKED_MAX_TOKENS_PER_ITEM, PACKED_ITEM_OVERHEAD_TOKENS
+from usage_tracker import price_for
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken là tuỳ chọn, fallback về ước lượng theo byte
+    tiktoken = None
+
+# Token phụ của chat format: mỗi message + phần mở đầu của câu trả lời
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_OVERHEAD_TOKENS = 3
+# Output ước lượng cho case chưa có expected_output
+DEFAULT_OUTPUT_TOKENS = 256
+# Tiếng Việt có dấu: ~4 byte UTF-8 mỗi token với tokenizer của OpenAI
+APPROX_BYTES_PER_TOKEN = 4
+
+
+# Encoding dùng khi tiktoken không có mapping cho model (ví dụ bản cũ chưa biết gpt-4o)
+FALLBACK_ENCODING = "cl100k_base"
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str):
+    """Encoding tiktoken của model, None nếu không dựng được (khi đó dùng ước lượng theo byte)"""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        pass
+    try:
+        return tiktoken.get_encoding(FALLBACK_ENCODING)
+    except (KeyError, ValueError, OSError) as e:
+        # ValueError: encoding không có trong bản tiktoken đã cài; OSError: không tải được file BPE
+        logger.warning(f"No tiktoken encoding for {model}, using approximate token counts: {str(e)}")
+        return None
+
+
+def _encoding_for(model: str):
+    return _encoding(model) if tiktoken is not None else None
+
+
+def tokenizer_name(model: str) -> str:
+    return "tiktoken" if _encoding_for(model) is not None else "approx"
+
+
+def count_tokens(text: str, model: str) -> int:
+    if not text:
+        return 0
+    encoding = _encoding_for(model)
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return math.ceil(len(text.encode("utf-8")) / APPROX_BYTES_PER_TOKEN)
+
+
+def estimate_run(prompt: str, test_cases: List[PromptTestCase], model: str, pack_size: int = 1,
+                 num_samples: int = 1, max_output_tokens: Optional[int] = None,
+                 output_caps: Optional[List[int]] = None) -> CostEstimate:
+    """Ước lượng số request, token và chi phí của một run trước khi chạy.
+
+    Output của mỗi case được ước lượng bằng độ dài expected_output (mỗi sample một
+    completion), không vượt max_output_tokens và cap của case (output_caps, theo vị trí
+    case, từ OutputBudget.cap_for); chi phí là cận trên vì không tính token được prompt cache.
+    """
+    prompt_tokens = 0
+    completion_tokens = 0
+    requests = 0
+
+    def output_tokens(case: PromptTestCase, index: int) -> int:
+        tokens = count_tokens(case.expected_output, model) or DEFAULT_OUTPUT_TOKENS
+        if max_output_tokens:
+            tokens = min(tokens, max_output_tokens)
+        if output_caps and index < len(output_caps):
+            tokens = min(tokens, output_caps[index])
+        return tokens
+
+    if pack_size > 1 and num_samples == 1:
+        system_tokens = count_tokens(prompt + PACKING_INSTRUCTION, model)
+        for i in range(0, len(test_cases), pack_size):
+            batch = test_cases[i:i + pack_size]
+            requests += 1
+            prompt_tokens += system_tokens + 2 * MESSAGE_OVERHEAD_TOKENS + REPLY_OVERHEAD_TOKENS + sum(
+                count_tokens(json.dumps(case.input, ensure_ascii=False), model) + PACKED_ITEM_OVERHEAD_TOKENS
+                for case in batch
+            )
+            completion_tokens += sum(
+                min(output_tokens(case, i + offset), PACKED_MAX_TOKENS_PER_ITEM) + PACKED_ITEM_OVERHEAD_TOKENS
+                for offset, case in enumerate(batch)
+            )
+    else:
+        system_tokens = count_tokens(prompt, model)
+        for i, case in enumerate(test_cases):
+            requests += 1
+            prompt_tokens += (system_tokens + count_tokens(case.input, model)
+                              + 2 * MESSAGE_OVERHEAD_TOKENS + REPLY_OVERHEAD_TOKENS)
+            completion_tokens += output_tokens(case, i) * max(1, num_samples)
+
+    price = price_for(model)
+    return CostEstimate(
+        model=model,
+        requests=requests,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+        cost=round((prompt_tokens * price["input"] + completion_tokens * price["output"]) / 1_000_000, 6),
+        tokenizer=tokenizer_name(model)
+    )
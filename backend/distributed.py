@@ -0,0 +1,154 @@
+import logging
+import os
+import socket
+import threading
+import uuid
+from typing import Any, Dict, List, Optional
+from models import PromptTestCase, DistributedRunStatus, OutputBudgetStats
+from output_budget import OutputBudget, merge_stats
+from work_queue import WorkQueue, Task, DONE, FAILED, LEASED, PENDING, MAX_ATTEMPTS
+from cancellation import RunCancelledError
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DISTRIBUTED_CHUNK_SIZE = int(os.getenv("DISTRIBUTED_CHUNK_SIZE", "50"))
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "1.0"))
+
+
+class Coordinator:
+    """Chia run thành các chunk PromptTestCase, đẩy vào queue và gom kết quả.
+
+    Kết quả được merge theo chunk_id nên việc một chunk được chạy nhiều lần
+    (at-least-once) không làm trùng hay lệch thứ tự test case. Chunk quá số lần thử
+    được trả lại nguyên case với error thay vì bị bỏ.
+    """
+
+    def __init__(self, queue: WorkQueue):
+        self.queue = queue
+
+    def submit(self, prompt: str, test_cases: List[PromptTestCase],
+               chunk_size: int = DISTRIBUTED_CHUNK_SIZE, output_budget: Optional[OutputBudget] = None,
+               **options) -> str:
+        """output_budget được lập trên cả suite; mỗi chunk nhận cap của các case của nó"""
+        run_id = uuid.uuid4().hex
+        chunk_size = max(1, chunk_size)
+        chunks = [
+            {
+                "prompt": prompt,
+                "options": {
+                    **options,
+                    "output_budget": output_budget.chunk_options(i, i + chunk_size) if output_budget else None
+                },
+                "test_cases": [case.model_dump() for case in test_cases[i:i + chunk_size]]
+            }
+            for i in range(0, len(test_cases), chunk_size)
+        ]
+        self.queue.publish(run_id, chunks)
+        logger.info(f"Published run {run_id} as {len(chunks)} chunk(s)")
+        return run_id
+
+    def status(self, run_id: str, include_results: bool = True) -> DistributedRunStatus:
+        counts = self.queue.progress(run_id)
+        total = sum(counts.values())
+        if total == 0:
+            raise KeyError(run_id)
+        done = counts[DONE] + counts[FAILED] == total
+        test_cases = None
+        budget_stats = None
+        if done and include_results:
+            chunks = self.queue.results(run_id)
+            budget_stats = merge_stats([
+                OutputBudgetStats.model_validate(chunk["output_budget"])
+                for chunk in chunks.values() if chunk.get("output_budget")
+            ])
+            error = f"Chunk failed after {MAX_ATTEMPTS} attempts"
+            for chunk_id, payload in self.queue.failed(run_id).items():
+                chunks[chunk_id] = {
+                    "test_cases": [{**case, "error": error} for case in payload["test_cases"]]
+                }
+            test_cases = [
+                PromptTestCase.model_validate(case)
+                for chunk_id in sorted(chunks)
+                for case in chunks[chunk_id]["test_cases"]
+            ]
+        return DistributedRunStatus(
+            run_id=run_id,
+            total_chunks=total,
+            pending_chunks=counts[PENDING],
+            running_chunks=counts[LEASED],
+            completed_chunks=counts[DONE],
+            failed_chunks=counts[FAILED],
+            done=done,
+            test_cases=test_cases,
+            output_budget=budget_stats
+        )
+
+
+class Worker:
+    """Lấy chunk từ queue, chạy qua PromptTestRunner (+ evaluator) và ghi kết quả về"""
+
+    def __init__(self, queue: WorkQueue, runner, evaluator=None, worker_id: Optional[str] = None):
+        self.queue = queue
+        self.runner = runner
+        self.evaluator = evaluator
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.processed = 0
+        self.duplicates = 0
+
+    def execute(self, task: Task) -> Dict[str, Any]:
+        payload = task.payload
+        options = payload.get("options", {})
+        test_cases = [PromptTestCase.model_validate(case) for case in payload["test_cases"]]
+        budget_options = options.get("output_budget")
+        output_budget = OutputBudget.from_options(budget_options) if budget_options else None
+        self.runner.run_with_testcases(
+            payload["prompt"],
+            test_cases,
+            pack_size=options.get("pack_size", 1),
+            num_samples=options.get("num_samples", 1),
+            temperature=options.get("temperature", 0.0),
+            output_budget=output_budget
+        )
+        if self.evaluator is not None and options.get("evaluate", True):
+            self.evaluator.evaluate_testcases(
+                test_cases,
+                mode=options.get("mode", "text"),
+                required_keys=options.get("required_keys")
+            )
+        return {
+            "worker": self.worker_id,
+            "test_cases": [case.model_dump() for case in test_cases],
+            "output_budget": output_budget.stats().model_dump() if output_budget else None
+        }
+
+    def process_one(self) -> bool:
+        """Xử lý một chunk; trả False nếu queue đang rỗng"""
+        task = self.queue.claim(self.worker_id)
+        if task is None:
+            return False
+        logger.info(f"Worker {self.worker_id} running chunk {task.chunk_id} of run {task.run_id} "
+                    f"(attempt {task.attempt})")
+        try:
+            result = self.execute(task)
+        except RunCancelledError:
+            self.queue.release(task)
+            raise
+        except Exception as e:
+            # Trả chunk lại queue để worker khác (hoặc lần sau) thử lại
+            logger.error(f"Chunk {task.chunk_id} of run {task.run_id} failed: {str(e)}", exc_info=True)
+            self.queue.release(task)
+            return True
+        if self.queue.complete(task, result):
+            self.processed += 1
+        else:
+            self.duplicates += 1
+            logger.info(f"Chunk {task.chunk_id} of run {task.run_id} was already completed, result ignored")
+        return True
+
+    def run_forever(self, stop: Optional[threading.Event] = None) -> None:
+        stop = stop or threading.Event()
+        logger.info(f"Worker {self.worker_id} started")
+        while not stop.is_set():
+            if not self.process_one():
+                stop.wait(WORKER_POLL_INTERVAL)
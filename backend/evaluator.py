@@ -2,10 +2,12 @@ import logging
 import os
 import time
 from typing import List, Dict, Tuple
-import openai
-import httpx
 from models import PromptTestCase
+from run_prompt import DEFAULT_MAX_TOKENS
+from cancellation import RunCancelledError, sleep as cancellable_sleep
+import llm_client
 import concurrent.futures
+import contextvars
 import threading
 from difflib import SequenceMatcher
 
@@ -14,25 +16,15 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class PromptEvaluator:
-    def __init__(self, max_workers: int = 4, batch_size: int = 4):
+    def __init__(self, max_workers: int = 4, batch_size: int = 4, max_tokens: int = DEFAULT_MAX_TOKENS):
         self.max_workers = max_workers
         self.batch_size = batch_size
-        
-        # Khởi tạo OpenAI client với httpx client
-        api_key = os.getenv('OPENAI_API_KEY')
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY environment variable is not set")
-            
-        http_client = httpx.Client(
-            base_url="https://api.openai.com/v1",
-            timeout=60.0,
-            follow_redirects=True
-        )
-        
-        self.client = openai.OpenAI(
-            api_key=api_key,
-            http_client=http_client
-        )
+        self.max_tokens = max_tokens
+
+    @property
+    def client(self):
+        # OpenAI client dùng chung của worker, khởi tạo lười ở lần gọi đầu tiên
+        return llm_client.get_client()
 
     def calculate_similarity(self, text1: str, text2: str) -> float:
         """Tính độ tương đồng giữa 2 text"""
@@ -61,11 +53,10 @@ class PromptEvaluator:
                     {"role": "user", "content": test_case.input}
                 ]
                 
-                completion = self.client.chat.completions.create(
-                    model="gpt-4o-mini",
+                completion = llm_client.chat_completion(
                     messages=messages,
                     temperature=0,
-                    max_tokens=2048
+                    max_tokens=self.max_tokens
                 )
                 
                 prompt_output = completion.choices[0].message.content.strip()
@@ -94,11 +85,13 @@ class PromptEvaluator:
                 
                 return is_correct, response_time, similarity
                 
+            except RunCancelledError:
+                raise
             except Exception as e:
                 try_count += 1
                 logger.warning(f"Attempt {try_count} failed: {str(e)}")
                 if try_count < 3:
-                    time.sleep(try_count * 2)
+                    cancellable_sleep(try_count * 2)
                     
         return False, 0.0, 0.0
 
@@ -130,8 +123,9 @@ class PromptEvaluator:
         
         # Process batches in parallel
         with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # copy_context để các thread giữ cancellation token của run hiện tại
             futures = [
-                executor.submit(self.process_batch, prompt, batch) 
+                executor.submit(contextvars.copy_context().run, self.process_batch, prompt, batch) 
                 for batch in batches
             ]
             
@@ -139,6 +133,10 @@ class PromptEvaluator:
                 try:
                     batch_results = future.result()
                     all_results.extend(batch_results)
+                except RunCancelledError:
+                    for pending in futures:
+                        pending.cancel()
+                    raise
                 except Exception as e:
                     logger.error(f"Error processing batch {i}: {str(e)}")
                     failed_batches.append(i)
@@ -0,0 +1,192 @@
+import logging
+import math
+import os
+import re
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from models import PromptTestCase, FailureCluster, FailureClusters
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Số chiều của vector hashed TF-IDF (feature hashing có dấu: giữ xấp xỉ cosine giữa các case)
+CLUSTER_FEATURE_DIM = int(os.getenv("CLUSTER_FEATURE_DIM", "256"))
+CLUSTER_MAX_K = int(os.getenv("CLUSTER_MAX_K", "20"))
+CLUSTER_BATCH_SIZE = 1024
+CLUSTER_ITERATIONS = 100
+CLUSTER_TOP_TERMS = 5
+CLUSTER_SAMPLE_SIZE = 10  # Số vị trí case ví dụ trả về mỗi cluster
+# Số case xử lý mỗi lần khi dựng ma trận / gán cluster, giới hạn bộ nhớ tạm
+_CHUNK_ROWS = 8192
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+INPUT_PREFIX = "i:"
+OUTPUT_PREFIX = "o:"
+EMPTY_OUTPUT = "o:<empty>"
+
+
+def _tokens(case: PromptTestCase) -> List[str]:
+    """Token của input và output, tách namespace để "input nói về X" khác "output nói X" """
+    tokens = [INPUT_PREFIX + token for token in _TOKEN_RE.findall(case.input.lower())]
+    output_tokens = _TOKEN_RE.findall(case.prompt_output.lower())
+    if not output_tokens:
+        tokens.append(EMPTY_OUTPUT)
+    tokens.extend(OUTPUT_PREFIX + token for token in output_tokens)
+    return tokens
+
+
+def _vectorize(cases: List[PromptTestCase], dim: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, List[str]]:
+    """Hashed TF-IDF (L2-normalized): (X, rows, token_ids, weights, vocabulary)"""
+    vocabulary: Dict[str, int] = {}
+    rows: List[int] = []
+    token_ids: List[int] = []
+    for row, case in enumerate(cases):
+        for token in _tokens(case):
+            token_ids.append(vocabulary.setdefault(token, len(vocabulary)))
+        rows.extend([row] * (len(token_ids) - len(rows)))
+    n, v = len(cases), len(vocabulary)
+    rows_arr = np.asarray(rows, dtype=np.int64)
+    tokens_arr = np.asarray(token_ids, dtype=np.int64)
+
+    # Gộp token trùng trong một case: (case, token) -> term frequency
+    pairs, tf = np.unique(rows_arr * v + tokens_arr, return_counts=True)
+    rows_arr, tokens_arr = pairs // v, pairs % v
+    df = np.bincount(tokens_arr, minlength=v)
+    idf = np.log((1 + n) / (1 + df)) + 1.0
+    weights = (1.0 + np.log(tf)) * idf[tokens_arr]
+
+    vocab_list = list(vocabulary)
+    # crc32 thay cho hash() của Python (bị salt theo process): bucket ổn định giữa các lần chạy
+    hashes = np.fromiter((zlib.crc32(token.encode("utf-8")) for token in vocab_list), dtype=np.int64, count=v)
+    buckets = hashes % dim
+    signs = np.where((hashes >> 31) & 1, -1.0, 1.0)
+
+    X = np.zeros((n, dim), dtype=np.float32)
+    for start in range(0, n, _CHUNK_ROWS):
+        stop = min(n, start + _CHUNK_ROWS)
+        lo, hi = np.searchsorted(rows_arr, [start, stop])
+        flat = (rows_arr[lo:hi] - start) * dim + buckets[tokens_arr[lo:hi]]
+        values = signs[tokens_arr[lo:hi]] * weights[lo:hi]
+        X[start:stop] = np.bincount(flat, weights=values, minlength=(stop - start) * dim).reshape(-1, dim)
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    X /= np.maximum(norms, 1e-12)
+    return X, rows_arr, tokens_arr, weights, vocab_list
+
+
+def _init_centers(X: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    """k-means++ trên một mẫu của X"""
+    sample = X[rng.choice(len(X), size=min(len(X), max(20 * k, 2000)), replace=False)]
+    centers = [sample[rng.integers(len(sample))]]
+    distances = 1.0 - sample @ centers[0]
+    for _ in range(1, k):
+        distances = np.maximum(distances, 0.0)
+        total = distances.sum()
+        index = rng.choice(len(sample), p=distances / total) if total > 0 else rng.integers(len(sample))
+        centers.append(sample[index])
+        distances = np.minimum(distances, 1.0 - sample @ sample[index])
+    return np.stack(centers).astype(np.float32)
+
+
+def _assign(X: np.ndarray, centers: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    labels = np.empty(len(X), dtype=np.int64)
+    scores = np.empty(len(X), dtype=np.float32)
+    for start in range(0, len(X), _CHUNK_ROWS):
+        similarity = X[start:start + _CHUNK_ROWS] @ centers.T
+        labels[start:start + _CHUNK_ROWS] = similarity.argmax(axis=1)
+        scores[start:start + _CHUNK_ROWS] = similarity.max(axis=1)
+    return labels, scores
+
+
+def minibatch_kmeans(X: np.ndarray, k: int, seed: int = 0, batch_size: int = CLUSTER_BATCH_SIZE,
+                     iterations: int = CLUSTER_ITERATIONS) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Spherical mini-batch k-means (cosine) trên các hàng đã chuẩn hoá: (centers, labels, scores)"""
+    rng = np.random.default_rng(seed)
+    centers = _init_centers(X, k, rng)
+    counts = np.zeros(k, dtype=np.float64)
+    for _ in range(iterations):
+        batch = X[rng.integers(len(X), size=min(batch_size, len(X)))]
+        labels = (batch @ centers.T).argmax(axis=1)
+        batch_counts = np.bincount(labels, minlength=k).astype(np.float64)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, batch)
+        updated = batch_counts > 0
+        counts += batch_counts
+        # Learning rate 1 / số điểm đã gán cho center (Sculley 2010), cập nhật cả batch một lần
+        centers[updated] += (
+            (sums[updated] - batch_counts[updated, None] * centers[updated]) / counts[updated, None]
+        ).astype(np.float32)
+        centers /= np.maximum(np.linalg.norm(centers, axis=1, keepdims=True), 1e-12)
+    labels, scores = _assign(X, centers)
+    return centers, labels, scores
+
+
+def default_k(failures: int) -> int:
+    return max(1, min(CLUSTER_MAX_K, int(math.sqrt(failures / 2))))
+
+
+def _top_terms(weights: np.ndarray, vocabulary: List[str], prefix: str) -> List[str]:
+    terms = []
+    for token_id in np.argsort(weights)[::-1]:
+        if weights[token_id] <= 0:
+            break
+        token = vocabulary[token_id]
+        if token.startswith(prefix):
+            terms.append(token[len(prefix):])
+            if len(terms) == CLUSTER_TOP_TERMS:
+                break
+    return terms
+
+
+def cluster_failures(test_cases: List[PromptTestCase], positions: Optional[List[int]] = None,
+                     k: Optional[int] = None, seed: int = 0, total_cases: Optional[int] = None,
+                     dim: int = CLUSTER_FEATURE_DIM) -> FailureClusters:
+    """Gom các case sai (is_correct=False) thành cluster theo input + output.
+
+    positions: vị trí của từng case trong run (mặc định thứ tự trong list). Mỗi cluster có
+    số case, term đặc trưng của input / output (theo tổng TF-IDF trong cluster) và case
+    gần centroid nhất làm ví dụ.
+    """
+    start = time.time()
+    positions = positions if positions is not None else list(range(len(test_cases)))
+    failed = [(position, case) for position, case in zip(positions, test_cases) if not case.is_correct]
+    total = total_cases if total_cases is not None else len(test_cases)
+    if not failed:
+        return FailureClusters(total_cases=total, failures=0, clusters=[], elapsed=time.time() - start)
+
+    failed_positions = [position for position, _ in failed]
+    cases = [case for _, case in failed]
+    X, rows, token_ids, weights, vocabulary = _vectorize(cases, dim)
+    k = max(1, min(k or default_k(len(cases)), len(cases)))
+    _, labels, scores = minibatch_kmeans(X, k, seed=seed)
+
+    # Tổng TF-IDF của từng token trong từng cluster: term đặc trưng của cluster
+    term_weights = np.bincount(labels[rows] * len(vocabulary) + token_ids, weights=weights,
+                               minlength=k * len(vocabulary)).reshape(k, len(vocabulary))
+    cluster_sizes = np.bincount(labels, minlength=k)
+
+    clusters = []
+    for cluster in np.argsort(cluster_sizes)[::-1]:
+        size = int(cluster_sizes[cluster])
+        if size == 0:
+            continue
+        members = np.flatnonzero(labels == cluster)
+        representative = int(members[scores[members].argmax()])
+        clusters.append(FailureCluster(
+            size=size,
+            share=size / len(cases),
+            input_terms=_top_terms(term_weights[cluster], vocabulary, INPUT_PREFIX),
+            output_terms=_top_terms(term_weights[cluster], vocabulary, OUTPUT_PREFIX),
+            empty_outputs=int(sum(1 for index in members if not cases[index].prompt_output.strip())),
+            avg_similarity=float(np.mean([cases[index].similarity_score for index in members])),
+            representative=cases[representative],
+            representative_position=failed_positions[representative],
+            positions=[failed_positions[index] for index in members[:CLUSTER_SAMPLE_SIZE]]
+        ))
+    for cluster_id, cluster in enumerate(clusters):
+        cluster.cluster_id = cluster_id
+
+    elapsed = time.time() - start
+    logger.info(f"Clustered {len(cases)} failure(s) into {len(clusters)} cluster(s) in {elapsed:.2f}s")
+    return FailureClusters(total_cases=total, failures=len(cases), clusters=clusters, elapsed=elapsed)
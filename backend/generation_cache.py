@@ -0,0 +1,158 @@
+import hashlib
+import importlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Số kết quả generate (prompt / bộ test case) giữ lại, LRU
+GENERATION_CACHE_SIZE = int(os.getenv("GENERATION_CACHE_SIZE", "256"))
+# Quá hạn thì generate lại dù cùng seed (0 = không hết hạn)
+GENERATION_CACHE_TTL = float(os.getenv("GENERATION_CACHE_TTL", "86400"))
+# File SQLite dùng chung giữa các gunicorn worker (và các máy chung ổ đĩa)
+GENERATION_CACHE_PATH = os.getenv("GENERATION_CACHE_PATH", "generation_cache.db")
+
+
+def cache_key(kind: str, messages: List[Dict], seed: int, model: str, params: Dict[str, Any]) -> str:
+    """Hash của (loại generate, messages đã dựng từ input, seed, model, tham số sampling)"""
+    payload = json.dumps(
+        {"kind": kind, "messages": messages, "seed": seed, "model": model, "params": params},
+        sort_keys=True, ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _encode(value: Any) -> str:
+    """JSON của giá trị cache; list pydantic model (bộ test case) giữ lại tên class để dựng lại"""
+    if isinstance(value, list) and value and all(hasattr(item, "model_dump") for item in value):
+        cls = type(value[0])
+        return json.dumps({"model": f"{cls.__module__}.{cls.__qualname__}",
+                           "items": [item.model_dump() for item in value]}, ensure_ascii=False)
+    return json.dumps({"value": value}, ensure_ascii=False)
+
+
+def _decode(data: str) -> Any:
+    payload = json.loads(data)
+    if "model" not in payload:
+        return payload["value"]
+    module_name, _, name = payload["model"].rpartition(".")
+    cls = getattr(importlib.import_module(module_name), name)
+    return [cls.model_validate(item) for item in payload["items"]]
+
+
+class GenerationCache:
+    """Cache kết quả generate có seed: cùng cấu hình Step 1 thì trả ngay, không gọi model.
+
+    Chỉ dùng khi request có seed (chế độ reproducible); regenerate bỏ qua lookup và
+    ghi đè entry. Entry nằm trong một file SQLite (WAL) nên mọi worker thấy cùng một
+    cache và invalidate / clear có hiệu lực ngay cho tất cả. Giá trị được serialize khi
+    ghi nên caller sửa test case (chạy, đánh giá) không làm bẩn cache.
+    hits / misses / evictions là số đếm của process hiện tại.
+    """
+
+    def __init__(self, max_size: int = GENERATION_CACHE_SIZE, ttl: float = GENERATION_CACHE_TTL,
+                 path: str = GENERATION_CACHE_PATH):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self._initialized: Optional[str] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # Mỗi thao tác một connection: an toàn giữa các thread và process
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            if self._initialized != self.path:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS generations (
+                        key TEXT PRIMARY KEY,
+                        created_at REAL NOT NULL,
+                        used_at REAL NOT NULL,
+                        value TEXT NOT NULL
+                    )
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS generations_used_at ON generations (used_at)")
+                self._initialized = self.path
+            yield conn
+        finally:
+            conn.close()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT created_at, value FROM generations WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl and now - row[0] > self.ttl:
+                conn.execute("DELETE FROM generations WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self._count("misses")
+                return None
+            conn.execute("UPDATE generations SET used_at = ? WHERE key = ?", (now, key))
+        self._count("hits")
+        return _decode(row[1])
+
+    def put(self, key: str, value: Any) -> None:
+        data = _encode(value)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT OR REPLACE INTO generations (key, created_at, used_at, value) VALUES (?, ?, ?, ?)",
+                (key, now, now, data)
+            )
+            # LRU: bỏ các entry lâu không dùng nhất khi vượt max_size
+            evicted = conn.execute(
+                """DELETE FROM generations WHERE key IN (
+                       SELECT key FROM generations ORDER BY used_at DESC, rowid DESC LIMIT -1 OFFSET ?
+                   )""",
+                (self.max_size,)
+            ).rowcount
+            conn.execute("COMMIT")
+        if evicted:
+            with self._lock:
+                self.evictions += evicted
+
+    def invalidate(self, key: str) -> bool:
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM generations WHERE key = ?", (key,)).rowcount == 1
+
+    def clear(self) -> int:
+        with self._connect() as conn:
+            count = conn.execute("DELETE FROM generations").rowcount
+        logger.info(f"Cleared {count} cached generation(s)")
+        return count
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM generations").fetchone()[0]
+        with self._lock:
+            return {
+                "entries": entries,
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+
+generation_cache = GenerationCache()
@@ -0,0 +1,36 @@
+# Gunicorn config cho production: nhiều worker uvicorn, app được preload trong master
+import multiprocessing
+import os
+import time
+
+bind = f"0.0.0.0:{os.getenv('PORT', '25043')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Mặc định mỗi core một worker, có thể override bằng WEB_CONCURRENCY
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+# Scheduler của từng worker chia giới hạn model call (MODEL_MAX_CONCURRENCY...) theo số worker
+os.environ["WEB_CONCURRENCY"] = str(workers)
+
+# Import main.py một lần trong master rồi fork (copy-on-write), worker khởi động nhanh hơn
+preload_app = True
+
+# Thời gian chờ worker drain các run đang chạy khi nhận SIGTERM
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "120"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "300"))
+keepalive = 5
+
+accesslog = "-"
+errorlog = "-"
+
+_master_start = time.time()
+
+
+def when_ready(server):
+    server.log.info(f"Master ready, app preloaded in {time.time() - _master_start:.3f}s")
+
+
+def post_fork(server, worker):
+    # Không dùng lại client/connection pool của master trong worker
+    import llm_client
+    llm_client.reset_client()
+    server.log.info(f"Worker {worker.pid} forked")
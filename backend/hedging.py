@@ -0,0 +1,139 @@
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+from cancellation import CancellationToken, RunCancelledError
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+# Gửi request dự phòng khi call chậm hơn percentile này của các call gần đây
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+# Tối đa bao nhiêu phần call được phép hedge (giới hạn chi phí phát sinh)
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", "0.05"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "1.0"))
+# Chưa đủ mẫu latency thì dùng ngưỡng mặc định này
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "15.0"))
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 500
+POLL_INTERVAL = 0.05
+
+
+class HedgingPolicy:
+    """Hedged requests cho call idempotent (temperature=0): call nào vượt ngưỡng
+    latency sẽ được gửi thêm một bản sao, kết quả về trước được dùng."""
+
+    def __init__(self, enabled: bool = HEDGE_ENABLED, percentile: float = HEDGE_PERCENTILE,
+                 budget: float = HEDGE_BUDGET, min_delay: float = HEDGE_MIN_DELAY,
+                 default_delay: float = HEDGE_DEFAULT_DELAY):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.budget = budget
+        self.min_delay = min_delay
+        self.default_delay = default_delay
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.budget_denied = 0
+
+    def applies(self, params: Dict) -> bool:
+        """Chỉ hedge call deterministic (temperature=0, một sample)"""
+        return self.enabled and params.get("temperature") == 0 and params.get("n", 1) == 1
+
+    def record_latency(self, latency: float) -> None:
+        with self._lock:
+            self._latencies.append(latency)
+
+    def hedge_delay(self) -> float:
+        with self._lock:
+            if len(self._latencies) < HEDGE_MIN_SAMPLES:
+                return self.default_delay
+            latencies = sorted(self._latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * self.percentile / 100))
+        return max(self.min_delay, latencies[index])
+
+    def _take_budget(self) -> bool:
+        with self._lock:
+            if self.hedged + 1 > self.budget * self.calls:
+                self.budget_denied += 1
+                return False
+            self.hedged += 1
+            return True
+
+    def run(self, primary: concurrent.futures.Future,
+            launch_hedge: Callable[[], Optional[concurrent.futures.Future]],
+            token: Optional[CancellationToken] = None,
+            on_discarded: Optional[Callable[[concurrent.futures.Future], None]] = None):
+        """Chờ primary; quá ngưỡng thì gọi launch_hedge() và lấy kết quả về trước.
+
+        on_discarded(future) được gọi khi bản bị bỏ (thua, hoặc run bị huỷ) kết thúc, để
+        caller tính usage của nó.
+        """
+        def discard(futures) -> None:
+            for future in futures:
+                future.cancel()
+                if on_discarded is not None:
+                    future.add_done_callback(on_discarded)
+
+        with self._lock:
+            self.calls += 1
+        deadline = time.time() + self.hedge_delay()
+        pending = [primary]
+        hedge = None
+        hedge_attempted = False
+
+        while True:
+            done, not_done = concurrent.futures.wait(
+                pending, timeout=POLL_INTERVAL, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    discard(not_done)
+                    return future.result()
+            if done and not not_done:
+                # Tất cả đều lỗi: trả lỗi của primary nếu có
+                failed = primary if primary in done else next(iter(done))
+                raise failed.exception()
+            pending = list(not_done)
+
+            if token is not None and token.cancelled:
+                discard(pending)
+                raise RunCancelledError(token.reason)
+
+            if not hedge_attempted and time.time() >= deadline:
+                hedge_attempted = True
+                if self._take_budget():
+                    hedge = launch_hedge()
+                    if hedge is None:
+                        with self._lock:
+                            self.hedged -= 1
+                    else:
+                        logger.info("Model call exceeded hedge threshold, sending hedge request")
+                        pending.append(hedge)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            calls, hedged, wins = self.calls, self.hedged, self.hedge_wins
+            denied = self.budget_denied
+        return {
+            "enabled": self.enabled,
+            "threshold": self.hedge_delay(),
+            "calls": calls,
+            "hedged": hedged,
+            "hedge_rate": hedged / calls if calls else 0.0,
+            "hedge_wins": wins,
+            "win_rate": wins / hedged if hedged else 0.0,
+            "budget_denied": denied
+        }
+
+
+hedging_policy = HedgingPolicy()
@@ -0,0 +1,119 @@
+import json
+import re
+from difflib import SequenceMatcher
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import orjson
+
+    def _loads(text: str) -> Any:
+        return orjson.loads(text)
+except ImportError:  # orjson là tuỳ chọn, fallback về json chuẩn
+    def _loads(text: str) -> Any:
+        return json.loads(text)
+
+_FENCE_RE = re.compile(r"^```(?:json)?\s*(.*?)\s*```$", re.DOTALL)
+_PATH_PART_RE = re.compile(r"([^.\[\]]+)|\[(\d+)\]")
+_MISSING = object()
+
+
+def parse_json_output(text: str) -> Tuple[bool, Any]:
+    """Parse output của model thành JSON (bỏ ```json fence nếu có)"""
+    if not text:
+        return False, None
+    text = text.strip()
+    fenced = _FENCE_RE.match(text)
+    if fenced:
+        text = fenced.group(1)
+    if not text or text[0] not in "{[":
+        return False, None
+    try:
+        return True, _loads(text)
+    except ValueError:
+        return False, None
+
+
+@lru_cache(maxsize=4096)
+def parse_expected_output(text: str) -> Tuple[bool, Any]:
+    """Như parse_json_output nhưng cache theo text (expected_output lặp lại qua các run)"""
+    return parse_json_output(text)
+
+
+def _leaf_score(expected: Any, actual: Any) -> float:
+    if expected == actual:
+        return 1.0
+    if isinstance(expected, bool) or isinstance(actual, bool):
+        return 0.0
+    if isinstance(expected, (int, float)) and isinstance(actual, (int, float)):
+        scale = max(abs(expected), abs(actual))
+        return max(0.0, 1.0 - abs(expected - actual) / scale) if scale else 1.0
+    if isinstance(expected, str) and isinstance(actual, str):
+        return SequenceMatcher(None, expected, actual).ratio()
+    return 0.0
+
+
+def _compare(expected: Any, actual: Any, path: str, scores: Dict[str, float]) -> None:
+    if isinstance(expected, dict):
+        if not isinstance(actual, dict):
+            actual = {}
+        if not expected:
+            scores[path or "$"] = 1.0 if not actual else 0.0
+        for key, value in expected.items():
+            child = f"{path}.{key}" if path else key
+            if key not in actual:
+                scores[child] = 0.0
+            else:
+                _compare(value, actual[key], child, scores)
+        # Key thừa trong output cũng bị tính là sai, như phần tử thừa của list
+        for key in actual:
+            if key not in expected:
+                scores[f"{path}.{key}" if path else key] = 0.0
+    elif isinstance(expected, list):
+        if not isinstance(actual, list):
+            actual = []
+        if not expected:
+            scores[path or "$"] = 1.0 if not actual else 0.0
+        for i, value in enumerate(expected):
+            child = f"{path}[{i}]"
+            if i >= len(actual):
+                scores[child] = 0.0
+            else:
+                _compare(value, actual[i], child, scores)
+        # Phần tử thừa trong output cũng bị tính là sai
+        for i in range(len(expected), len(actual)):
+            scores[f"{path}[{i}]"] = 0.0
+    else:
+        scores[path or "$"] = _leaf_score(expected, actual)
+
+
+def _lookup(document: Any, path: str) -> Any:
+    """Lấy giá trị theo path: key cách nhau bởi dấu chấm, index list dạng `items[0]` hoặc `items.0`"""
+    node = document
+    for key, index in _PATH_PART_RE.findall(path):
+        if isinstance(node, dict) and key in node:
+            node = node[key]
+        elif isinstance(node, list) and (index or key.isdigit()) and int(index or key) < len(node):
+            node = node[int(index or key)]
+        else:
+            return _MISSING
+    return node
+
+
+def compare_json(expected: Any, actual: Any,
+                 required_keys: Optional[List[str]] = None) -> Tuple[float, Dict[str, float], List[str]]:
+    """So sánh hai JSON theo từng field.
+
+    Trả về (score trung bình trên các field của expected và field / phần tử thừa
+    của actual, score theo path, danh sách required key bị thiếu trong actual).
+    Required key có thể trỏ vào list (`items[0].name`). Nếu không truyền
+    required_keys, mọi key top-level của expected đều là bắt buộc.
+    """
+    scores: Dict[str, float] = {}
+    _compare(expected, actual, "", scores)
+    score = sum(scores.values()) / len(scores) if scores else 1.0
+
+    if required_keys is None:
+        required_keys = list(expected) if isinstance(expected, dict) else []
+    missing = [key for key in required_keys if _lookup(actual, key) is _MISSING]
+    return score, scores, missing
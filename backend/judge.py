@@ -0,0 +1,185 @@
+import concurrent.futures
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from models import JudgeStats
+from cancellation import RunCancelledError
+import llm_client
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+JUDGE_MODEL = os.getenv("JUDGE_MODEL", llm_client.DEFAULT_MODEL)
+# Số cặp (expected, actual) chấm trong một request judge
+JUDGE_BATCH_SIZE = int(os.getenv("JUDGE_BATCH_SIZE", "40"))
+JUDGE_CONCURRENCY = int(os.getenv("JUDGE_CONCURRENCY", "8"))
+JUDGE_CACHE_SIZE = int(os.getenv("JUDGE_CACHE_SIZE", "100000"))
+JUDGE_MAX_TOKENS_PER_ITEM = 120
+
+# Rubric cố định (đặt đầu system message để dùng được prompt cache); tiêu chí riêng của
+# suite được nối vào sau
+JUDGE_RUBRIC = """You are a strict evaluator of model outputs.
+The user message is a JSON object {"items": [{"index": <int>, "input": <string>, "expected": <string>, "actual": <string>}, ...]}.
+For every item, decide whether "actual" is an acceptable answer to "input" given the reference answer "expected".
+Judge meaning, not wording: paraphrases, different formatting and extra politeness are fine; missing,
+contradicting or invented facts are not. Language must match the expected answer.
+
+Score each item with this rubric:
+- 1.0: same meaning and complete
+- 0.75: same meaning, minor omission or imprecision
+- 0.5: partially correct, an important part is missing or wrong
+- 0.25: mostly wrong, only loosely related
+- 0.0: wrong, empty or unrelated
+
+Respond ONLY with a JSON object of the form:
+{"verdicts": [{"index": <same index as the item>, "score": <rubric score>, "correct": <true if score >= 0.75>, "reason": <one short sentence>}]}
+Return exactly one verdict per item."""
+
+
+class Verdict(NamedTuple):
+    score: float
+    correct: bool
+    reason: str
+
+
+class JudgePair(NamedTuple):
+    input: str
+    expected: str
+    actual: str
+
+
+class LLMJudge:
+    """Chấm ngữ nghĩa nhiều cặp (expected, actual) trong mỗi request judge.
+
+    Các batch chạy song song (mỗi call vẫn đi qua scheduler), verdict được cache theo
+    hash của cặp + tiêu chí + model nên cặp không đổi không bao giờ bị chấm lại.
+    Cặp judge không trả verdict (lỗi, thiếu index) trả None để caller fallback.
+    """
+
+    def __init__(self, model: str = JUDGE_MODEL, batch_size: int = JUDGE_BATCH_SIZE,
+                 max_concurrency: int = JUDGE_CONCURRENCY, cache_size: int = JUDGE_CACHE_SIZE):
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self.max_concurrency = max_concurrency
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, Verdict]" = OrderedDict()
+
+    def key(self, pair: JudgePair, criteria: Optional[str] = None) -> str:
+        payload = json.dumps([self.model, criteria or "", *pair], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _cached(self, key: str) -> Optional[Verdict]:
+        with self._lock:
+            verdict = self._cache.get(key)
+            if verdict is not None:
+                self._cache.move_to_end(key)
+            return verdict
+
+    def _store(self, key: str, verdict: Verdict) -> None:
+        with self._lock:
+            self._cache[key] = verdict
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _judge_batch(self, pairs: List[JudgePair], criteria: Optional[str]) -> List[Optional[Verdict]]:
+        verdicts: List[Optional[Verdict]] = [None] * len(pairs)
+        system = JUDGE_RUBRIC + (f"\n\nAdditional criteria for this suite:\n{criteria}" if criteria else "")
+        messages = [
+            {"role": "system", "content": system},
+            {"role": "user", "content": json.dumps(
+                {"items": [
+                    {"index": i, "input": pair.input, "expected": pair.expected, "actual": pair.actual}
+                    for i, pair in enumerate(pairs)
+                ]},
+                ensure_ascii=False
+            )}
+        ]
+        try:
+            completion = llm_client.chat_completion(
+                messages=messages,
+                model=self.model,
+                temperature=0,
+                max_tokens=JUDGE_MAX_TOKENS_PER_ITEM * len(pairs),
+                response_format={"type": "json_object"}
+            )
+            answers = json.loads(completion.choices[0].message.content).get("verdicts", [])
+        except RunCancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Judge request failed for {len(pairs)} pair(s): {str(e)}")
+            return verdicts
+
+        for answer in answers:
+            index = answer.get("index") if isinstance(answer, dict) else None
+            if not isinstance(index, int) or not 0 <= index < len(pairs) or verdicts[index] is not None:
+                continue
+            try:
+                score = min(1.0, max(0.0, float(answer.get("score"))))
+            except (TypeError, ValueError):
+                continue
+            correct = answer.get("correct")
+            verdicts[index] = Verdict(
+                score=score,
+                correct=correct if isinstance(correct, bool) else score >= 0.75,
+                reason=str(answer.get("reason") or "")
+            )
+        return verdicts
+
+    def judge(self, pairs: List[JudgePair], criteria: Optional[str] = None,
+              stats: Optional[JudgeStats] = None) -> List[Optional[Verdict]]:
+        """Verdict cho từng cặp (None nếu judge không chấm được cặp đó)"""
+        keys = [self.key(pair, criteria) for pair in pairs]
+        verdicts: Dict[str, Optional[Verdict]] = {}
+        pending: Dict[str, JudgePair] = {}
+        for key, pair in zip(keys, pairs):
+            if key in verdicts or key in pending:
+                continue
+            cached = self._cached(key)
+            if cached is not None:
+                verdicts[key] = cached
+            else:
+                pending[key] = pair
+
+        cached_count = sum(1 for key in keys if key in verdicts)
+        pending_keys = list(pending)
+        batches: List[Tuple[List[str], List[JudgePair]]] = [
+            (pending_keys[i:i + self.batch_size], [pending[key] for key in pending_keys[i:i + self.batch_size]])
+            for i in range(0, len(pending_keys), self.batch_size)
+        ]
+        if batches:
+            logger.info(f"Judging {len(pending_keys)} pair(s) in {len(batches)} request(s), "
+                        f"{cached_count} cached")
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                futures = [
+                    (batch_keys, executor.submit(contextvars.copy_context().run,
+                                                 self._judge_batch, batch_pairs, criteria))
+                    for batch_keys, batch_pairs in batches
+                ]
+                try:
+                    for batch_keys, future in futures:
+                        for key, verdict in zip(batch_keys, future.result()):
+                            verdicts[key] = verdict
+                            if verdict is not None:
+                                self._store(key, verdict)
+                except RunCancelledError:
+                    for _, future in futures:
+                        future.cancel()
+                    raise
+
+        results = [verdicts.get(key) for key in keys]
+        if stats is not None:
+            stats.requests += len(batches)
+            stats.judged += sum(1 for key in keys if key in pending and verdicts.get(key) is not None)
+            stats.cached += cached_count
+            stats.failed += sum(1 for verdict in results if verdict is None)
+        return results
+
+
+llm_judge = LLMJudge()
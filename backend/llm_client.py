@@ -0,0 +1,273 @@
+import concurrent.futures
+import contextvars
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+import openai
+import httpx
+import httpcore
+from cancellation import current_token
+from scheduler import scheduler
+from hedging import hedging_policy
+from usage_tracker import current_usage
+from circuit_breaker import breakers
+import cassette
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+DEFAULT_MODEL = "gpt-4o-mini"
+DEFAULT_TIMEOUT = 60.0
+MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+# Call đang chờ response kiểm tra cancellation token sau mỗi khoảng này
+CANCEL_POLL_INTERVAL = 0.25
+
+# Mỗi worker process giữ một client (và một connection pool) riêng.
+# Client được tạo lười ở lần gọi đầu tiên để app có thể preload trong master
+# process mà không cần OPENAI_API_KEY và không chia sẻ socket qua fork.
+_lock = threading.Lock()
+_client = None
+_client_pid: Optional[int] = None
+_call_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+_executor_pid: Optional[int] = None
+
+
+class _CancellableStream(httpcore.NetworkStream):
+    """Socket tới OpenAI bỏ dở được: khi token của run bị huỷ, read() / write() raise
+    RunCancelledError, httpcore đóng connection nên backend dừng generate luôn."""
+
+    def __init__(self, stream: httpcore.NetworkStream):
+        self._stream = stream
+
+    def read(self, max_bytes: int, timeout: Optional[float] = None) -> bytes:
+        token = current_token()
+        if token is None:
+            return self._stream.read(max_bytes, timeout)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            token.raise_if_cancelled()
+            wait = CANCEL_POLL_INTERVAL if deadline is None else min(CANCEL_POLL_INTERVAL, deadline - time.monotonic())
+            try:
+                return self._stream.read(max_bytes, max(wait, 0.0))
+            except httpcore.ReadTimeout:
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise
+
+    def write(self, buffer: bytes, timeout: Optional[float] = None) -> None:
+        # Run đã huỷ (kể cả lần retry của SDK sau đó) thì không gửi request
+        token = current_token()
+        if token is not None:
+            token.raise_if_cancelled()
+        self._stream.write(buffer, timeout)
+
+    def close(self) -> None:
+        self._stream.close()
+
+    def start_tls(self, ssl_context, server_hostname: Optional[str] = None,
+                  timeout: Optional[float] = None) -> httpcore.NetworkStream:
+        return _CancellableStream(self._stream.start_tls(ssl_context, server_hostname, timeout))
+
+    def get_extra_info(self, info: str):
+        return self._stream.get_extra_info(info)
+
+
+class _CancellableBackend(httpcore.NetworkBackend):
+    def __init__(self, backend: httpcore.NetworkBackend):
+        self._backend = backend
+
+    def connect_tcp(self, *args, **kwargs) -> httpcore.NetworkStream:
+        return _CancellableStream(self._backend.connect_tcp(*args, **kwargs))
+
+    def connect_unix_socket(self, *args, **kwargs) -> httpcore.NetworkStream:
+        return _CancellableStream(self._backend.connect_unix_socket(*args, **kwargs))
+
+    def sleep(self, seconds: float) -> None:
+        self._backend.sleep(seconds)
+
+
+def create_http_client(base_url: str = OPENAI_BASE_URL, timeout: float = DEFAULT_TIMEOUT,
+                       max_connections: int = MAX_CONNECTIONS) -> httpx.Client:
+    """httpx client có connection pool; call chạy với cancellation token bị huỷ giữa chừng
+    thì connection của nó bị đóng thay vì chờ response tới hết"""
+    transport = httpx.HTTPTransport(
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    )
+    # httpx chưa cho truyền network backend: bọc backend của pool httpcore bên dưới
+    transport._pool._network_backend = _CancellableBackend(transport._pool._network_backend)
+    return httpx.Client(base_url=base_url, timeout=timeout, follow_redirects=True, transport=transport)
+
+
+def get_client():
+    """Trả về OpenAI client dùng chung của process hiện tại.
+
+    Khi bật LLM_CASSETTE_MODE, client được bọc bởi cassette (record/replay);
+    replay không gọi mạng nên không cần OPENAI_API_KEY.
+    """
+    global _client, _client_pid
+
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    with _lock:
+        if _client is None or _client_pid != pid:
+            if cassette.CASSETTE_MODE == "replay":
+                _client = cassette.wrap_client()
+                _client_pid = pid
+                return _client
+
+            api_key = os.getenv('OPENAI_API_KEY')
+            if not api_key:
+                raise ValueError("OPENAI_API_KEY environment variable is not set")
+
+            http_client = create_http_client()
+
+            _client = cassette.wrap_client(openai.OpenAI(
+                api_key=api_key,
+                http_client=http_client
+            ))
+            _client_pid = pid
+            logger.info(f"Initialized OpenAI client for process {pid}")
+
+    return _client
+
+
+def _get_call_executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _call_executor, _executor_pid
+
+    pid = os.getpid()
+    with _lock:
+        # Theo pid của chính executor (không phải của client): thread không sống qua fork
+        if _call_executor is None or _executor_pid != pid:
+            _call_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=MAX_CONNECTIONS,
+                thread_name_prefix="openai-call"
+            )
+            _executor_pid = pid
+    return _call_executor
+
+
+def _submit(client, workload, model: str, messages: List[Dict], params: Dict) -> concurrent.futures.Future:
+    """Gửi call vào executor; slot scheduler được trả khi HTTP call thật sự kết thúc.
+
+    Call chạy trong context của caller để socket thấy cancellation token của run.
+    """
+    start_time = time.time()
+    try:
+        future = _get_call_executor().submit(
+            contextvars.copy_context().run,
+            client.chat.completions.create,
+            model=model,
+            messages=messages,
+            **params
+        )
+    except BaseException:
+        scheduler.release(workload)
+        raise
+
+    def on_done(done: concurrent.futures.Future) -> None:
+        scheduler.release(workload)
+        if hedging_policy.applies(params) and not done.cancelled() and done.exception() is None:
+            hedging_policy.record_latency(time.time() - start_time)
+
+    future.add_done_callback(on_done)
+    return future
+
+
+def chat_completion(messages: List[Dict], model: str = DEFAULT_MODEL, **params):
+    """Gọi chat completion qua client dùng chung, ghi usage vào run hiện tại (nếu có).
+
+    Breaker của model đang mở thì call được chuyển sang LLM_FALLBACK_MODEL hoặc bị từ
+    chối ngay bằng CircuitOpenError (không chờ timeout / retry). Run đã hết budget thì
+    call bị từ chối bằng BudgetExceededError trước khi gửi.
+    """
+    usage = current_usage()
+    if usage is not None:
+        usage.check_budget()
+    model = breakers.route(model)
+    try:
+        completion = _send_chat_completion(messages, model, params)
+    except BaseException as e:
+        breakers.record(model, e)
+        raise
+    breakers.record(model)
+    if usage is not None:
+        usage.record(model, getattr(completion, "usage", None))
+    return completion
+
+
+def _send_chat_completion(messages: List[Dict], model: str, params: Dict):
+    """Gửi một chat completion.
+
+    Mỗi call phải lấy slot từ scheduler (theo priority class và tenant của run).
+    Nếu run hiện tại có cancellation token, call chưa bắt đầu sẽ không được gửi
+    và call đang chạy sẽ bị bỏ chờ ngay khi token bị huỷ (connection của nó bị đóng
+    trong vòng CANCEL_POLL_INTERVAL, xem create_http_client). Call temperature=0
+    được hedge khi bật HEDGE_ENABLED.
+    """
+    client = get_client()
+    token = current_token()
+    hedge = hedging_policy.applies(params)
+    if token is None and not hedge:
+        with scheduler.slot():
+            return client.chat.completions.create(model=model, messages=messages, **params)
+
+    if token is not None:
+        token.raise_if_cancelled()
+    workload = scheduler.acquire()
+    if token is not None and token.cancelled:
+        scheduler.release(workload)
+        token.raise_if_cancelled()
+    future = _submit(client, workload, model, messages, params)
+
+    if hedge:
+        def launch_hedge() -> Optional[concurrent.futures.Future]:
+            # Hedge không xếp hàng: backend đang bận thì bỏ qua
+            hedge_workload = scheduler.try_acquire(workload)
+            if hedge_workload is None:
+                return None
+            return _submit(client, hedge_workload, model, messages, params)
+
+        usage = current_usage()
+
+        def record_discarded(discarded: concurrent.futures.Future) -> None:
+            # Bản thua vẫn tốn token: tính vào usage (budget, cost) của run khi nó xong
+            if usage is not None and not discarded.cancelled() and discarded.exception() is None:
+                usage.record(model, getattr(discarded.result(), "usage", None))
+
+        return hedging_policy.run(future, launch_hedge, token, on_discarded=record_discarded)
+    return token.wait_for(future)
+
+
+def reset_client() -> None:
+    """Bỏ client hiện tại (gọi sau fork để worker tự tạo client mới)"""
+    global _client, _client_pid, _call_executor, _executor_pid
+
+    pid = os.getpid()
+    with _lock:
+        if _client is not None and _client_pid == pid:
+            _client.close()
+        if _call_executor is not None and _executor_pid == pid:
+            _call_executor.shutdown(wait=False, cancel_futures=True)
+        _client = None
+        _client_pid = None
+        _call_executor = None
+        _executor_pid = None
+
+
+def warm_up() -> Optional[float]:
+    """Mở sẵn connection tới OpenAI để request đầu tiên không phải trả TLS handshake"""
+    start_time = time.time()
+    try:
+        get_client().models.list()
+    except Exception as e:
+        logger.warning(f"OpenAI warm-up failed: {str(e)}")
+        return None
+
+    warmup_time = time.time() - start_time
+    logger.info(f"OpenAI warm-up finished in {warmup_time:.3f}s")
+    return warmup_time
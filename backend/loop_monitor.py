@@ -0,0 +1,158 @@
+import asyncio
+import bisect
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Dict, List, Optional
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+# Chu kỳ heartbeat trên event loop
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))
+# Event loop bị chặn lâu hơn ngưỡng này thì ghi lại handler và stack
+LOOP_BLOCK_THRESHOLD = float(os.getenv("LOOP_BLOCK_THRESHOLD", "0.5"))
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+LAG_WINDOW = 1000
+MAX_BLOCK_EVENTS = 20
+STACK_LIMIT = 15
+
+_THIS_FILE = os.path.abspath(__file__)
+_BACKEND_DIR = os.path.dirname(_THIS_FILE)
+
+
+def _blocking_handler(stack: List[traceback.FrameSummary]) -> str:
+    """Handler trong main.py nếu có, nếu không thì frame code backend trong cùng"""
+    own = [frame for frame in stack
+           if frame.filename.startswith(_BACKEND_DIR) and frame.filename != _THIS_FILE]
+    for frame in own:
+        if os.path.basename(frame.filename) == "main.py":
+            return f"main.{frame.name}"
+    if own:
+        return f"{os.path.splitext(os.path.basename(own[-1].filename))[0]}.{own[-1].name}"
+    return f"{stack[-1].name} ({stack[-1].filename})" if stack else "unknown"
+
+
+class LoopLagMonitor:
+    """Đo độ trễ event loop liên tục bằng heartbeat; một watchdog thread chụp
+    stack của loop thread khi heartbeat trễ quá ngưỡng để biết handler nào đang chặn."""
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, threshold: float = LOOP_BLOCK_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._lags = deque(maxlen=LAG_WINDOW)
+        self._bucket_counts = [0] * (len(LAG_BUCKETS) + 1)
+        self.samples = 0
+        self.max_lag = 0.0
+        self.blocked_events = 0
+        self._blocks = deque(maxlen=MAX_BLOCK_EVENTS)
+        self._pending_block: Optional[Dict] = None
+        self._last_beat = 0.0
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        """Gọi trong event loop (lifespan startup)"""
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _heartbeat(self) -> None:
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._last_beat = now
+            self.record_lag(max(0.0, now - start - self.interval))
+
+    def record_lag(self, lag: float) -> None:
+        with self._lock:
+            self._lags.append(lag)
+            self._bucket_counts[bisect.bisect_left(LAG_BUCKETS, lag)] += 1
+            self.samples += 1
+            self.max_lag = max(self.max_lag, lag)
+            if self._pending_block is not None:
+                # Heartbeat chạy lại: stall đã kết thúc, cập nhật thời gian chặn thực tế
+                self._pending_block["duration"] = round(lag, 4)
+                logger.warning(
+                    f"Event loop blocked for {lag:.3f}s by {self._pending_block['handler']}"
+                )
+                self._pending_block = None
+
+    def _watch(self) -> None:
+        reported_beat = None
+        while not self._stop.wait(self.interval):
+            last_beat = self._last_beat
+            stalled = time.monotonic() - last_beat
+            if stalled < self.threshold or reported_beat == last_beat:
+                continue
+            reported_beat = last_beat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self.record_block(traceback.extract_stack(frame), stalled)
+
+    def record_block(self, stack: List[traceback.FrameSummary], stalled: float) -> None:
+        event = {
+            "handler": _blocking_handler(stack),
+            "duration": round(stalled, 4),
+            "at": time.time(),
+            "stack": [f"{frame.filename}:{frame.lineno} {frame.name}" for frame in stack[-STACK_LIMIT:]]
+        }
+        with self._lock:
+            self.blocked_events += 1
+            self._blocks.append(event)
+            self._pending_block = event
+
+    def stats(self, include_blocks: bool = True) -> Dict:
+        with self._lock:
+            lags = sorted(self._lags)
+            counts = list(self._bucket_counts)
+            blocks = [dict(event) for event in self._blocks]
+            samples, max_lag, blocked = self.samples, self.max_lag, self.blocked_events
+
+        def percentile(p: float) -> float:
+            if not lags:
+                return 0.0
+            return round(lags[min(len(lags) - 1, int(len(lags) * p / 100))], 4)
+
+        histogram, cumulative = {}, 0
+        for bound, count in zip(list(LAG_BUCKETS) + ["+Inf"], counts):
+            cumulative += count
+            histogram[str(bound)] = cumulative
+        stats = {
+            "samples": samples,
+            "p50_lag": percentile(50),
+            "p99_lag": percentile(99),
+            "max_lag": round(max_lag, 4),
+            "lag_histogram": histogram,
+            "block_threshold": self.threshold,
+            "blocked_events": blocked
+        }
+        if include_blocks:
+            stats["recent_blocks"] = blocks
+        return stats
+
+
+loop_monitor = LoopLagMonitor()
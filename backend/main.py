@@ -1,13 +1,16 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Header, Query
+from fastapi.responses import FileResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 import os
 import logging
-from typing import List
+from typing import List, Optional
 import time
 from pydantic import BaseModel
 from run_prompt_with_testcases import PromptTestRunner
-from run_prompt_evaluate import PromptEvaluator
+from run_prompt_evaluate import PromptEvaluator, EVALUATION_MODES
 
 # Load environment variables from .env file
 load_dotenv()
@@ -27,17 +30,62 @@ from models import (
     EvaluationResponse,
     RunPromptRequest,
     RunPromptResponse,
+    PackingStats,
+    CacheStats,
     EvaluatePromptRequest,
-    EvaluatePromptResponse
-)
-from utils import (
-    generate_prompt_from_samples,
-    evaluate_prompt,
-    update_prompt
+    EvaluatePromptResponse,
+    RunResultsPage,
+    SweepRequest,
+    SweepResponse,
+    DistributedRunRequest,
+    DistributedRunStatus,
+    UsageStats,
+    CostEstimate,
+    EstimateRequest,
+    RunDiff,
+    FailureClusters
 )
+from utils import generate_prompt_from_samples
+from prompt_optimizer import PromptOptimizer
 from test_case_generator import generate_test_cases as gen_test_cases
+from runtime import server_stats, InFlightMiddleware
+from cancellation import RunCancelledError, CancellationToken, run_until_disconnected
+from scheduler import scheduler, WorkloadMiddleware
+from hedging import hedging_policy
+from usage_tracker import track_usage, active_runs, BudgetExceededError
+from cost_estimator import estimate_run
+from output_budget import plan_output_budget
+from failure_clusters import cluster_failures
+from profiling import ProfilingMiddleware, is_admin, profile_path
+from loop_monitor import loop_monitor, LOOP_MONITOR_ENABLED
+from result_store import result_store, RESULT_STORE_ENABLED, DIFF_STATUSES
+from sweep import PromptSweep
+from work_queue import open_queue
+from distributed import Coordinator
+from generation_cache import generation_cache
+from circuit_breaker import breakers, degraded_reasons, DegradationMiddleware
+from serialization import FastJSONResponse
+from compression import CompressionMiddleware
+import suite_stream
+import llm_client
+
+WARMUP_ON_START = os.getenv("WARMUP_ON_START", "false").lower() == "true"
 
-app = FastAPI(title="Auto Prompting Tool API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Worker startup: client OpenAI được tạo lười, warm-up là tuỳ chọn
+    server_stats.mark_ready()
+    if LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+    if WARMUP_ON_START:
+        server_stats.warmup_time = await run_in_threadpool(llm_client.warm_up)
+    yield
+    # Worker shutdown: chờ các run đang chạy rồi mới đóng connection pool
+    await server_stats.drain()
+    await loop_monitor.stop()
+    llm_client.reset_client()
+
+app = FastAPI(title="Auto Prompting Tool API", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -47,39 +95,64 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Nén nằm trong các middleware đo lường để profile / in-flight tính cả thời gian nén
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(DegradationMiddleware)
+app.add_middleware(WorkloadMiddleware)
+app.add_middleware(InFlightMiddleware)
+app.add_middleware(ProfilingMiddleware)
 
 MAX_ITERATIONS = 5
+# Status code (theo quy ước nginx) khi client đóng kết nối trước khi có kết quả
+CLIENT_CLOSED_REQUEST = 499
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize runners
+# Initialize runners (OpenAI client được khởi tạo lười trong từng worker)
 test_runner = PromptTestRunner()
 evaluator = PromptEvaluator()
+_coordinator = None
+
+def get_coordinator() -> Coordinator:
+    # Queue được mở lười: app không cần queue nếu không dùng distributed mode
+    global _coordinator
+    if _coordinator is None:
+        _coordinator = Coordinator(open_queue())
+    return _coordinator
 
 @app.post("/api/generate-test-cases", response_model=TestCaseResponse)
-async def generate_test_cases_endpoint(request: TestCaseRequest):
+async def generate_test_cases_endpoint(request: TestCaseRequest, http_request: Request):
     """Generate test cases based on format, samples and conditions"""
     try:
         start_time = time.time()
         
         # Generate test cases using the test case generator
-        test_cases = gen_test_cases(
-            format_output=request.format,
-            samples=request.samples,
-            conditions=request.conditions,
-            num_cases=request.num_cases
-        )
+        with track_usage(label="generate-test-cases") as usage:
+            test_cases = await run_until_disconnected(
+                http_request,
+                gen_test_cases,
+                format_output=request.format,
+                samples=request.samples,
+                conditions=request.conditions,
+                num_cases=request.num_cases,
+                seed=request.seed,
+                regenerate=request.regenerate
+            )
         
         generation_time = time.time() - start_time
         
         return TestCaseResponse(
             test_cases=test_cases,
             total_cases=len(test_cases),
-            generation_time=generation_time
+            generation_time=generation_time,
+            usage=UsageStats(**usage.summary()),
+            degraded=degraded_reasons()
         )
         
+    except RunCancelledError:
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
     except Exception as e:
         logger.error(f"Error generating test cases: {str(e)}", exc_info=True)
         raise HTTPException(
@@ -87,62 +160,63 @@ async def generate_test_cases_endpoint(request: TestCaseRequest):
             detail=f"Failed to generate test cases: {str(e)}"
         )
 
-@app.post("/api/generate-prompt", response_model=PromptResponse)
-async def generate_prompt_endpoint(request: PromptRequest):
-    # Initial prompt generation
-    generated_prompt = generate_prompt_from_samples(
-        format_output=request.format,
-        samples=request.samples,
-        conditions=request.conditions
-    )
-    
-    # Log the generated prompt
-    logger.info(f"API generated prompt:\n{generated_prompt}")
-    
-    iteration = request.iteration
-    optimization_history = []
-    
-    # Generate and evaluate test cases
-    test_cases = gen_test_cases(
-        format_output=request.format,
-        samples=request.samples,
-        conditions=request.conditions
-    )
-    accuracy, response_time = evaluate_prompt(generated_prompt, test_cases)
-    
-    # Record initial results
-    optimization_history.append(
-        OptimizationHistory(
-            iteration=iteration,
-            accuracy=accuracy,
-            response_time=response_time
+def run_prompt_optimization(request: PromptRequest) -> PromptResponse:
+    """Sinh prompt rồi tối ưu bằng PromptOptimizer (chạy trong threadpool)"""
+    # Usage (và budget) tính cho cả bước generate lẫn các vòng tối ưu
+    with track_usage(budget_tokens=request.budget_tokens, budget_usd=request.budget_usd,
+                     label="generate-prompt") as usage:
+        # Initial prompt generation
+        generated_prompt = generate_prompt_from_samples(
+            format_output=request.format,
+            samples=request.samples,
+            conditions=request.conditions,
+            seed=request.seed,
+            regenerate=request.regenerate
         )
-    )
-
-    # Iterative improvement loop
-    while accuracy < 0.9 and iteration < MAX_ITERATIONS:
-        iteration += 1
-        generated_prompt = update_prompt(generated_prompt, test_cases, accuracy)
-        test_cases = gen_test_cases(generated_prompt)
-        accuracy, response_time = evaluate_prompt(generated_prompt, test_cases)
-        
-        optimization_history.append(
-            OptimizationHistory(
-                iteration=iteration,
-                accuracy=accuracy,
-                response_time=response_time
-            )
+        
+        # Log the generated prompt
+        logger.info(f"API generated prompt:\n{generated_prompt}")
+        
+        # Generate test cases một lần, mọi prompt candidate được chấm trên cùng suite
+        test_cases = gen_test_cases(
+            format_output=request.format,
+            samples=request.samples,
+            conditions=request.conditions,
+            seed=request.seed,
+            regenerate=request.regenerate
+        )
+        
+        # Đề xuất prompt từ các case sai, chấm trên minibatch, chỉ prompt dẫn đầu chạy full suite
+        optimizer = PromptOptimizer(test_runner, evaluator)
+        result = optimizer.optimize(
+            generated_prompt,
+            test_cases,
+            target_accuracy=0.9,
+            max_iterations=MAX_ITERATIONS,
+            start_iteration=request.iteration
         )
 
     return PromptResponse(
-        generated_prompt=generated_prompt,
-        test_cases=test_cases,
-        accuracy=accuracy,
-        response_time=response_time,
-        iteration=iteration,
-        optimization_history=optimization_history
+        generated_prompt=result.prompt,
+        test_cases=result.test_cases,
+        accuracy=result.accuracy,
+        response_time=sum(history.response_time for history in result.history),
+        iteration=result.iterations,
+        optimization_history=result.history,
+        llm_calls=usage.requests,
+        usage=UsageStats(**usage.summary()),
+        degraded=degraded_reasons()
     )
 
+@app.post("/api/generate-prompt", response_model=PromptResponse)
+async def generate_prompt_endpoint(request: PromptRequest, http_request: Request):
+    try:
+        return FastJSONResponse(await run_until_disconnected(http_request, run_prompt_optimization, request))
+    except BudgetExceededError:
+        raise HTTPException(status_code=402, detail="Run budget exhausted before a prompt could be generated")
+    except RunCancelledError:
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
+
 @app.post("/api/feedback")
 async def feedback_endpoint(request: FeedbackRequest):
     # Here you would typically store the feedback and potentially
@@ -152,39 +226,121 @@ async def feedback_endpoint(request: FeedbackRequest):
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "server": server_stats.snapshot(),
+        "scheduler": scheduler.stats(),
+        "event_loop": loop_monitor.stats(include_blocks=False),
+        "breakers": breakers.stats()
+    }
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Metrics của worker hiện tại (JSON)"""
+    return {
+        "server": server_stats.snapshot(),
+        "scheduler": scheduler.stats(),
+        "hedging": hedging_policy.stats(),
+        "event_loop": loop_monitor.stats(),
+        "breakers": breakers.stats()
+    }
+
+@app.get("/api/scheduler/stats")
+async def scheduler_stats_endpoint():
+    """Queue depth, in-flight và thời gian chờ của từng priority class"""
+    return scheduler.stats()
+
+@app.post("/api/estimate", response_model=CostEstimate)
+async def estimate_endpoint(request: EstimateRequest):
+    """Ước lượng request / token / chi phí của một run trước khi chạy (tokenizer local, không gọi model)"""
+    output_budget = plan_output_budget(
+        request.test_cases,
+        request.model,
+        request.max_output_tokens or test_runner.max_tokens,
+        mode=request.output_budget,
+        stop_sequences=False
+    ) if request.output_budget else None
+    return await run_in_threadpool(
+        estimate_run,
+        request.prompt,
+        request.test_cases,
+        request.model,
+        pack_size=request.pack_size,
+        num_samples=request.num_samples,
+        max_output_tokens=request.max_output_tokens,
+        output_caps=[output_budget.cap_for(i) for i in range(len(request.test_cases))] if output_budget else None
+    )
+
+@app.get("/api/usage/active")
+async def active_usage_endpoint():
+    """Token / chi phí / budget trực tiếp của các run đang chạy trong worker này"""
+    return active_runs()
+
+@app.get("/api/generation-cache")
+async def generation_cache_stats_endpoint():
+    """Số entry / hit / miss / eviction của cache generate có seed"""
+    return generation_cache.stats()
+
+@app.delete("/api/generation-cache")
+async def clear_generation_cache_endpoint():
+    """Xoá toàn bộ prompt / test case đã cache (ví dụ sau khi đổi model hoặc template)"""
+    return {"message": "Generation cache cleared", "cleared": generation_cache.clear()}
+
+@app.get("/api/admin/profiles/{profile_id}")
+async def get_profile_endpoint(profile_id: str, summary: bool = False,
+                               x_admin_token: str = Header(default="")):
+    """Tải profile của một request (speedscope JSON, hoặc breakdown nếu summary=true)"""
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+    path = profile_path(profile_id, "summary.json" if summary else "speedscope.json")
+    if path is None or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/json")
 
 @app.post("/api/generate-prompt-and-testcases", response_model=PromptAndTestResponse)
-async def generate_prompt_and_test_endpoint(request: PromptAndTestRequest):
+async def generate_prompt_and_test_endpoint(request: PromptAndTestRequest, http_request: Request):
     """Generate prompt and test cases in one call"""
     try:
         start_time = time.time()
         
-        # Step 1: Generate prompt
-        generated_prompt = generate_prompt_from_samples(
-            format_output=request.format,
-            samples=request.samples,
-            conditions=request.conditions
-        )
-        logger.info(f"Generated prompt:\n{generated_prompt}")
-        
-        # Step 2: Generate test cases
-        test_cases = gen_test_cases(
-            format_output=request.format,
-            samples=request.samples,
-            conditions=request.conditions,
-            num_cases=request.num_test_cases
-        )
-        logger.info(f"Generated {len(test_cases)} test cases")
+        with track_usage(label="generate-prompt-and-testcases") as usage:
+            # Step 1: Generate prompt
+            generated_prompt = await run_until_disconnected(
+                http_request,
+                generate_prompt_from_samples,
+                format_output=request.format,
+                samples=request.samples,
+                conditions=request.conditions,
+                seed=request.seed,
+                regenerate=request.regenerate
+            )
+            logger.info(f"Generated prompt:\n{generated_prompt}")
+            
+            # Step 2: Generate test cases
+            test_cases = await run_until_disconnected(
+                http_request,
+                gen_test_cases,
+                format_output=request.format,
+                samples=request.samples,
+                conditions=request.conditions,
+                num_cases=request.num_test_cases,
+                seed=request.seed,
+                regenerate=request.regenerate
+            )
+            logger.info(f"Generated {len(test_cases)} test cases")
         
         total_time = time.time() - start_time
         
         return PromptAndTestResponse(
             generated_prompt=generated_prompt,
             test_cases=test_cases,
-            total_time=total_time
+            total_time=total_time,
+            usage=UsageStats(**usage.summary()),
+            degraded=degraded_reasons()
         )
         
+    except RunCancelledError:
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
     except Exception as e:
         logger.error(f"Error in generate_prompt_and_test: {str(e)}", exc_info=True)
         raise HTTPException(
@@ -192,25 +348,63 @@ async def generate_prompt_and_test_endpoint(request: PromptAndTestRequest):
             detail=f"Failed to generate prompt and test cases: {str(e)}"
         )
 
+async def _store_results(kind: str, test_cases: List[PromptTestCase], **meta) -> Optional[str]:
+    """Ghi kết quả vào result store; lỗi ghi đĩa không làm hỏng response"""
+    if not RESULT_STORE_ENABLED:
+        return None
+    try:
+        return await run_in_threadpool(result_store.save, kind, test_cases, **meta)
+    except OSError as e:
+        logger.error(f"Failed to store {kind} results: {str(e)}")
+        return None
+
 @app.post("/api/run-prompt", response_model=RunPromptResponse)
-async def run_prompt_endpoint(request: RunPromptRequest):
+async def run_prompt_endpoint(request: RunPromptRequest, http_request: Request):
     """Chạy prompt với test cases và trả về kết quả"""
     try:
         start_time = time.time()
         
-        # Run prompt với test cases đã có
-        test_cases = test_runner.run_with_testcases(
-            prompt=request.prompt,  # Sử dụng prompt trực tiếp từ request
-            test_cases=request.test_cases  # Sử dụng test cases từ request
-        )
+        packing = PackingStats() if request.pack_size > 1 and request.num_samples == 1 else None
+        output_budget = plan_output_budget(
+            request.test_cases,
+            test_runner.model,
+            test_runner.max_tokens,
+            mode=request.output_budget,
+            stop_sequences=request.stop_sequences,
+            retry_truncated=request.retry_truncated
+        ) if request.output_budget else None
+        
+        # Run prompt với test cases đã có (huỷ các call còn lại nếu client ngắt kết nối)
+        with track_usage(budget_tokens=request.budget_tokens, budget_usd=request.budget_usd,
+                         label="run-prompt") as usage:
+            test_cases = await run_until_disconnected(
+                http_request,
+                test_runner.run_with_testcases,
+                prompt=request.prompt,  # Sử dụng prompt trực tiếp từ request
+                test_cases=request.test_cases,  # Sử dụng test cases từ request
+                pack_size=request.pack_size,
+                packing_stats=packing,
+                num_samples=request.num_samples,
+                temperature=request.temperature,
+                output_budget=output_budget
+            )
         
         total_time = time.time() - start_time
+        run_id = await _store_results("run-prompt", test_cases, prompt=request.prompt)
         
-        return RunPromptResponse(
+        return FastJSONResponse(RunPromptResponse(
             test_cases=test_cases,
-            total_time=total_time
-        )
+            total_time=total_time,
+            packing=packing,
+            cache=CacheStats(**usage.cache_stats()),
+            usage=UsageStats(**usage.summary()),
+            output_budget=output_budget.stats() if output_budget else None,
+            degraded=degraded_reasons(),
+            run_id=run_id
+        ))
         
+    except RunCancelledError:
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
     except Exception as e:
         logger.error(f"Error running prompt: {str(e)}", exc_info=True)
         raise HTTPException(
@@ -218,22 +412,253 @@ async def run_prompt_endpoint(request: RunPromptRequest):
             detail=f"Failed to run prompt: {str(e)}"
         )
 
+@app.post("/api/sweep", response_model=SweepResponse)
+async def sweep_endpoint(request: SweepRequest, http_request: Request):
+    """Chạy suite trên grid model × temperature × max_tokens, trả accuracy / latency / cost
+    từng config và tập Pareto"""
+    try:
+        sweep = PromptSweep(
+            evaluator,
+            max_concurrency=request.max_concurrency,
+            store=result_store.save if RESULT_STORE_ENABLED else None
+        )
+        return FastJSONResponse(await run_until_disconnected(http_request, sweep.run, request))
+    except RunCancelledError:
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
+    except Exception as e:
+        logger.error(f"Error running sweep: {str(e)}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to run sweep: {str(e)}"
+        )
+
 @app.post("/api/evaluate-results", response_model=EvaluatePromptResponse) 
 async def evaluate_results_endpoint(request: EvaluatePromptRequest):
     """Đánh giá kết quả của prompt với expected output"""
     try:
         # Đánh giá test cases
-        results = evaluator.evaluate_testcases(request.test_cases)
+        with track_usage(label="evaluate-results") as usage:
+            results = await run_in_threadpool(
+                evaluator.evaluate_testcases,
+                request.test_cases,
+                mode=request.mode,
+                required_keys=request.required_keys,
+                judge_criteria=request.judge_criteria
+            )
+        run_id = await _store_results("evaluate", results.test_cases, mode=request.mode)
+        clusters = (
+            await run_in_threadpool(cluster_failures, results.test_cases)
+            if request.cluster_failures else None
+        )
         
-        return EvaluatePromptResponse(
+        return FastJSONResponse(EvaluatePromptResponse(
             accuracy=results.accuracy,
             avg_similarity=results.avg_similarity,
-            test_cases=results.test_cases
-        )
+            test_cases=results.test_cases,
+            majority_vote_accuracy=results.majority_vote_accuracy,
+            sample_accuracy=results.sample_accuracy,
+            avg_agreement=results.avg_agreement,
+            judge=results.judge,
+            usage=UsageStats(**usage.summary()),
+            failure_clusters=clusters,
+            degraded=degraded_reasons(),
+            run_id=run_id
+        ))
         
     except Exception as e:
         logger.error(f"Error evaluating results: {str(e)}", exc_info=True)
         raise HTTPException(
             status_code=500,
             detail=f"Failed to evaluate results: {str(e)}"
-        ) 
\ No newline at end of file
+        )
+
+def _suite_option(query_value, options: dict, name: str, default):
+    """Tham số trên query được ưu tiên, sau đó tới header của suite JSONL"""
+    if query_value is not None:
+        return query_value
+    return options.get(name, default)
+
+def _suite_mode(query_value: Optional[str], options: dict) -> str:
+    """Mode đánh giá của suite, kiểm tra trước khi response bắt đầu stream"""
+    mode = _suite_option(query_value, options, "mode", "text")
+    if mode not in EVALUATION_MODES:
+        raise HTTPException(status_code=400, detail=f"Unsupported mode: {mode!r} (expected one of {', '.join(EVALUATION_MODES)})")
+    return mode
+
+@app.post("/api/suites/run")
+async def run_suite_stream_endpoint(http_request: Request, prompt: Optional[str] = None,
+                                    format: Optional[str] = None, output_format: Optional[str] = None,
+                                    pack_size: Optional[int] = None, num_samples: Optional[int] = None,
+                                    temperature: Optional[float] = None, mode: Optional[str] = None):
+    """Upload suite JSONL/CSV dạng stream, chạy + đánh giá từng batch ngay trong lúc upload
+    và stream kết quả về (JSONL hoặc CSV). Prompt lấy từ query hoặc dòng header của JSONL."""
+    try:
+        input_format = suite_stream.detect_format(http_request.headers.get("content-type"), format)
+        options, cases = await suite_stream.read_suite(http_request.stream(), input_format)
+        output_format = suite_stream.detect_format(None, output_format or input_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    prompt = _suite_option(prompt, options, "prompt", None)
+    if not prompt:
+        raise HTTPException(status_code=400, detail="Missing prompt (query parameter or JSONL header line)")
+    pack_size = _suite_option(pack_size, options, "pack_size", 1)
+    num_samples = _suite_option(num_samples, options, "num_samples", 1)
+    temperature = _suite_option(temperature, options, "temperature", 0.0)
+    mode = _suite_mode(mode, options)
+    required_keys = options.get("required_keys")
+    judge_criteria = options.get("judge_criteria")
+
+    def run_batch(batch: List[PromptTestCase]) -> List[PromptTestCase]:
+        test_runner.run_with_testcases(
+            prompt,
+            batch,
+            pack_size=pack_size,
+            packing_stats=PackingStats() if pack_size > 1 else None,
+            num_samples=num_samples,
+            temperature=temperature
+        )
+        return evaluator.evaluate_testcases(batch, mode=mode, required_keys=required_keys,
+                                           judge_criteria=judge_criteria).test_cases
+
+    batches = suite_stream.process_in_batches(cases, run_batch, CancellationToken(),
+                                              is_disconnected=http_request.is_disconnected)
+    headers = {}
+    if RESULT_STORE_ENABLED:
+        run_id, writer = result_store.create_run("suite-run", mode=mode)
+        batches = suite_stream.persist(batches, writer)
+        headers["x-run-id"] = run_id
+    return suite_stream.UploadStreamingResponse(
+        suite_stream.encode_results(batches, output_format),
+        media_type=suite_stream.media_type(output_format),
+        headers=headers
+    )
+
+@app.post("/api/suites/evaluate")
+async def evaluate_suite_stream_endpoint(http_request: Request, format: Optional[str] = None,
+                                         output_format: Optional[str] = None, mode: Optional[str] = None):
+    """Như /api/evaluate-results nhưng nhận suite JSONL/CSV dạng stream và stream kết quả về"""
+    try:
+        input_format = suite_stream.detect_format(http_request.headers.get("content-type"), format)
+        options, cases = await suite_stream.read_suite(http_request.stream(), input_format)
+        output_format = suite_stream.detect_format(None, output_format or input_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    mode = _suite_mode(mode, options)
+    required_keys = options.get("required_keys")
+    judge_criteria = options.get("judge_criteria")
+
+    def evaluate_batch(batch: List[PromptTestCase]) -> List[PromptTestCase]:
+        return evaluator.evaluate_testcases(batch, mode=mode, required_keys=required_keys,
+                                           judge_criteria=judge_criteria).test_cases
+
+    batches = suite_stream.process_in_batches(cases, evaluate_batch, CancellationToken(),
+                                              is_disconnected=http_request.is_disconnected)
+    headers = {}
+    if RESULT_STORE_ENABLED:
+        run_id, writer = result_store.create_run("suite-evaluate", mode=mode)
+        batches = suite_stream.persist(batches, writer)
+        headers["x-run-id"] = run_id
+    return suite_stream.UploadStreamingResponse(
+        suite_stream.encode_results(batches, output_format),
+        media_type=suite_stream.media_type(output_format),
+        headers=headers
+    )
+
+@app.get("/api/runs")
+async def list_runs_endpoint():
+    """Các run đã lưu trong result store (mới nhất trước)"""
+    return await run_in_threadpool(result_store.list_runs)
+
+@app.get("/api/runs/{run_id}/results", response_model=RunResultsPage)
+async def run_results_endpoint(run_id: str, offset: int = 0, limit: int = 100,
+                               is_correct: Optional[bool] = None, min_similarity: Optional[float] = None,
+                               max_similarity: Optional[float] = None, input_contains: Optional[str] = None):
+    """Một trang kết quả của run, lọc theo is_correct / khoảng similarity / chuỗi con của input"""
+    try:
+        return FastJSONResponse(await run_in_threadpool(
+            result_store.query, run_id,
+            offset=offset,
+            limit=limit,
+            is_correct=is_correct,
+            min_similarity=min_similarity,
+            max_similarity=max_similarity,
+            input_contains=input_contains
+        ))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Run not found")
+
+@app.get("/api/runs/{run_id}/diff/{other_run_id}", response_model=RunDiff)
+async def run_diff_endpoint(run_id: str, other_run_id: str, status: Optional[List[str]] = Query(None),
+                            offset: int = 0, limit: int = 100):
+    """So run other_run_id với run_id (run gốc): case regressed / fixed / changed / added / removed
+    (status=unchanged để lấy cả case không đổi), kèm diff output"""
+    invalid = set(status or []) - set(DIFF_STATUSES)
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Unknown status: {', '.join(sorted(invalid))}")
+    try:
+        return FastJSONResponse(await run_in_threadpool(
+            result_store.diff, run_id, other_run_id,
+            status=status,
+            offset=offset,
+            limit=limit
+        ))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Run not found")
+
+@app.get("/api/runs/{run_id}/clusters", response_model=FailureClusters)
+async def run_clusters_endpoint(run_id: str, k: Optional[int] = None, seed: int = 0):
+    """Gom các case sai của run thành cluster (số case, term đặc trưng, case đại diện)"""
+    def cluster() -> FailureClusters:
+        total = result_store.run_info(run_id)["total"]
+        positions, cases = result_store.failures(run_id)
+        return cluster_failures(cases, positions, k=k, seed=seed, total_cases=total)
+
+    try:
+        return FastJSONResponse(await run_in_threadpool(cluster))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Run not found")
+
+@app.delete("/api/runs/{run_id}")
+async def delete_run_endpoint(run_id: str):
+    try:
+        await run_in_threadpool(result_store.delete_run, run_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return {"message": "Run deleted"}
+
+@app.post("/api/distributed/runs", response_model=DistributedRunStatus)
+async def submit_distributed_run_endpoint(request: DistributedRunRequest):
+    """Chia run thành chunk và đẩy vào work queue; các process worker.py chạy và ghi kết quả về"""
+    output_budget = plan_output_budget(
+        request.test_cases,
+        test_runner.model,
+        test_runner.max_tokens,
+        mode=request.output_budget,
+        stop_sequences=request.stop_sequences,
+        retry_truncated=request.retry_truncated
+    ) if request.output_budget else None
+    coordinator = get_coordinator()
+    run_id = await run_in_threadpool(
+        coordinator.submit,
+        request.prompt,
+        request.test_cases,
+        chunk_size=request.chunk_size,
+        output_budget=output_budget,
+        pack_size=request.pack_size,
+        num_samples=request.num_samples,
+        temperature=request.temperature,
+        evaluate=request.evaluate,
+        mode=request.mode,
+        required_keys=request.required_keys
+    )
+    return await run_in_threadpool(coordinator.status, run_id, False)
+
+@app.get("/api/distributed/runs/{run_id}", response_model=DistributedRunStatus)
+async def distributed_run_status_endpoint(run_id: str):
+    """Tiến độ của run; khi xong trả kèm test case đã merge theo thứ tự input"""
+    try:
+        return FastJSONResponse(await run_in_threadpool(get_coordinator().status, run_id))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Run not found")
\ No newline at end of file
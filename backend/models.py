@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Dict, List, Literal, Optional
 
 class Sample(BaseModel):
     input: str
@@ -11,17 +11,47 @@ class PromptTestCase(BaseModel):
     prompt_output: str = ""  # Output từ prompt cần đánh giá
     is_correct: bool = False  # Kết quả so sánh
     similarity_score: float = 0.0  # Độ tương đồng
+    field_scores: Optional[Dict[str, float]] = None  # Score theo JSON path (mode="json")
+    missing_keys: Optional[List[str]] = None  # Required key thiếu trong output (mode="json")
+    samples: Optional[List[str]] = None  # Mọi sample khi chạy consistency mode (num_samples > 1)
+    agreement_rate: Optional[float] = None  # Tỷ lệ sample trùng với output đa số
+    judge_reason: Optional[str] = None  # Nhận xét của judge (mode="judge")
+    error: Optional[str] = None  # Lý do case không có kết quả (ví dụ chunk distributed bị lỗi)
 
 class OptimizationHistory(BaseModel):
     iteration: int
     accuracy: float
     response_time: float
 
+class UsageStats(BaseModel):
+    requests: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    cost: float = 0.0  # USD
+    budget_tokens: Optional[int] = None
+    budget_usd: Optional[float] = None
+    budget_exceeded: bool = False  # Run dừng sớm vì hết budget, kết quả chỉ là một phần
+    rejected_calls: int = 0  # Số call bị từ chối vì hết budget
+
+class CostEstimate(BaseModel):
+    model: str
+    requests: int
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    cost: float  # USD, cận trên (không tính prompt cache)
+    tokenizer: str  # "tiktoken" hoặc "approx" (ước lượng theo byte khi chưa cài tiktoken)
+
 class PromptRequest(BaseModel):
     format: str
     samples: List[Sample]
     conditions: Optional[str] = None
     iteration: int = 0
+    seed: Optional[int] = None  # Có seed: kết quả generate được cache, cùng cấu hình trả ngay
+    regenerate: bool = False  # Bỏ qua cache, gọi model lại (ghi đè cache nếu có seed)
+    budget_tokens: Optional[int] = None  # Dừng lên lịch call mới khi run đã dùng chừng này token
+    budget_usd: Optional[float] = None  # Như budget_tokens, tính theo chi phí USD
 
 class PromptResponse(BaseModel):
     generated_prompt: str
@@ -30,6 +60,9 @@ class PromptResponse(BaseModel):
     response_time: float
     iteration: int
     optimization_history: List[OptimizationHistory]
+    llm_calls: Optional[int] = None  # Tổng số model call của cả quá trình tối ưu
+    usage: Optional[UsageStats] = None
+    degraded: Optional[List[str]] = None  # Lý do kết quả bị degraded (model dự phòng, breaker mở, output dự phòng)
 
 class FeedbackRequest(BaseModel):
     prompt: str
@@ -40,22 +73,30 @@ class TestCaseRequest(BaseModel):
     samples: List[Sample]
     conditions: str
     num_cases: int = 5
+    seed: Optional[int] = None
+    regenerate: bool = False
 
 class TestCaseResponse(BaseModel):
     test_cases: List[PromptTestCase]
     total_cases: int
     generation_time: float
+    usage: Optional[UsageStats] = None
+    degraded: Optional[List[str]] = None
 
 class PromptAndTestRequest(BaseModel):
     format: str
     samples: List[Sample]
     conditions: Optional[str] = None
     num_test_cases: int = 5
+    seed: Optional[int] = None
+    regenerate: bool = False
 
 class PromptAndTestResponse(BaseModel):
     generated_prompt: str
     test_cases: List[PromptTestCase]
     total_time: float
+    usage: Optional[UsageStats] = None
+    degraded: Optional[List[str]] = None
 
 class EvaluationRequest(BaseModel):
     prompt: str
@@ -118,6 +159,15 @@ class EvaluationResponse(BaseModel):
 class RunPromptRequest(BaseModel):
     prompt: str
     test_cases: List[PromptTestCase]
+    pack_size: int = Field(1, ge=1)  # > 1: gộp nhiều input ngắn vào một request
+    num_samples: int = Field(1, ge=1)  # > 1: consistency mode, lấy nhiều sample mỗi case bằng tham số n
+    temperature: float = 0.0
+    budget_tokens: Optional[int] = None  # Hết budget: dừng sớm, trả kết quả một phần
+    budget_usd: Optional[float] = None
+    # Cap max_tokens theo độ dài expected_output: "suite" (một cap) hoặc "case" (từng case)
+    output_budget: Optional[Literal["suite", "case"]] = None
+    stop_sequences: bool = True  # Với output_budget: tự suy stop sequence từ expected_output
+    retry_truncated: bool = True  # Với output_budget: chạy lại không cap khi output bị cắt
     
     class Config:
         json_schema_extra = {
@@ -142,9 +192,40 @@ class RunPromptRequest(BaseModel):
             }
         }
 
+class PackingStats(BaseModel):
+    packed_requests: int = 0  # Số request chứa nhiều input
+    packed_items: int = 0  # Số input có answer từ request gộp
+    fallback_items: int = 0  # Số input phải chạy lại riêng lẻ
+
+class OutputBudgetStats(BaseModel):
+    mode: str  # "suite" hoặc "case"
+    max_tokens: int  # Cap lớn nhất đã dùng
+    stop: Optional[List[str]] = None
+    requests: int = 0
+    truncated: int = 0  # Call dừng vì chạm cap (finish_reason="length")
+    retried: int = 0  # Call bị cắt đã chạy lại không cap
+    truncation_rate: float = 0.0
+    completion_tokens: int = 0
+    latency: float = 0.0  # Tổng thời gian các call có cap (giây)
+    estimated_tokens_saved: int = 0  # Cận trên, so với max_tokens cũ
+    estimated_latency_saved: float = 0.0  # Ước lượng thô, giây
+
+class CacheStats(BaseModel):
+    requests: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0  # Từ usage.prompt_tokens_details.cached_tokens (0 nếu API không trả)
+    cache_hit_ratio: float = 0.0
+    estimated_savings: float = 0.0  # USD tiết kiệm nhờ prompt caching
+
 class RunPromptResponse(BaseModel):
     test_cases: List[PromptTestCase]
     total_time: float
+    packing: Optional[PackingStats] = None
+    cache: Optional[CacheStats] = None
+    usage: Optional[UsageStats] = None
+    output_budget: Optional[OutputBudgetStats] = None
+    degraded: Optional[List[str]] = None
+    run_id: Optional[str] = None  # Id trong result store, dùng cho GET /api/runs/{run_id}/results
     
     class Config:
         json_schema_extra = {
@@ -169,8 +250,36 @@ class RunPromptResponse(BaseModel):
             }
         }
 
+class JudgeStats(BaseModel):
+    requests: int = 0  # Số request judge đã gửi
+    judged: int = 0  # Số cặp được judge chấm mới
+    cached: int = 0  # Số cặp lấy verdict từ cache
+    failed: int = 0  # Số cặp judge không chấm được, đã fallback về text similarity
+
+class FailureCluster(BaseModel):
+    cluster_id: int = 0  # Thứ tự theo kích thước, 0 = cluster lớn nhất
+    size: int
+    share: float  # Tỷ lệ trên tổng số case sai
+    input_terms: List[str]  # Term đặc trưng của input trong cluster
+    output_terms: List[str]  # Term đặc trưng của output trong cluster
+    empty_outputs: int = 0
+    avg_similarity: float = 0.0
+    representative: PromptTestCase  # Case gần centroid nhất
+    representative_position: int
+    positions: List[int]  # Một số vị trí case ví dụ của cluster
+
+class FailureClusters(BaseModel):
+    total_cases: int
+    failures: int
+    clusters: List[FailureCluster]
+    elapsed: float  # Giây
+
 class EvaluatePromptRequest(BaseModel):
     test_cases: List[PromptTestCase]  # Test cases đã có prompt_output
+    mode: Literal["text", "json", "judge"] = "text"  # "json": so sánh theo từng field, "judge": chấm bằng LLM judge
+    judge_criteria: Optional[str] = None  # Tiêu chí bổ sung cho judge (mode="judge")
+    required_keys: Optional[List[str]] = None  # Mặc định: mọi key top-level của expected
+    cluster_failures: bool = False  # Gom case sai thành cluster sau khi chấm (failure_clusters)
     
     class Config:
         json_schema_extra = {
@@ -198,6 +307,14 @@ class EvaluatePromptResponse(BaseModel):
     accuracy: float
     avg_similarity: float
     test_cases: List[PromptTestCase]
+    majority_vote_accuracy: Optional[float] = None  # Chỉ có khi test case có samples
+    sample_accuracy: Optional[float] = None
+    avg_agreement: Optional[float] = None
+    judge: Optional[JudgeStats] = None  # Chỉ có ở mode="judge"
+    usage: Optional[UsageStats] = None  # Call của judge (mode="judge")
+    failure_clusters: Optional[FailureClusters] = None
+    degraded: Optional[List[str]] = None
+    run_id: Optional[str] = None  # Id trong result store
     
     class Config:
         json_schema_extra = {
@@ -231,8 +348,129 @@ class PromptOutput(BaseModel):
     input: str
     output: str
     response_time: float = 0.0
+    samples: Optional[List[str]] = None
 
 class EvaluationResult(BaseModel):
     accuracy: float
     avg_similarity: float
-    test_cases: List[PromptTestCase] 
\ No newline at end of file
+    test_cases: List[PromptTestCase]
+    majority_vote_accuracy: Optional[float] = None
+    sample_accuracy: Optional[float] = None
+    avg_agreement: Optional[float] = None
+    judge: Optional[JudgeStats] = None
+
+class OptimizationResult(BaseModel):
+    prompt: str
+    accuracy: float
+    test_cases: List[PromptTestCase]
+    history: List[OptimizationHistory]
+    iterations: int
+
+class StoredTestCase(PromptTestCase):
+    position: int  # Thứ tự của case trong run
+
+class RunResultsPage(BaseModel):
+    run_id: str
+    total: int  # Tổng số case của run
+    matched: int  # Số case khớp filter
+    offset: int
+    limit: int
+    items: List[StoredTestCase]
+
+class CaseDiff(BaseModel):
+    status: Literal["regressed", "fixed", "changed", "added", "removed", "unchanged"]
+    input: str
+    expected_output: str
+    base_position: Optional[int] = None  # None: case không có trong run gốc (added)
+    head_position: Optional[int] = None  # None: case không còn trong run mới (removed)
+    base_output: Optional[str] = None
+    head_output: Optional[str] = None
+    base_correct: Optional[bool] = None
+    head_correct: Optional[bool] = None
+    base_score: Optional[float] = None
+    head_score: Optional[float] = None
+    diff: Optional[str] = None  # Unified diff của hai output (chỉ khi output khác nhau)
+
+class RunDiff(BaseModel):
+    base_run_id: str
+    head_run_id: str
+    counts: Dict[str, int]  # Số case theo status
+    matched: int  # Số case khớp filter status
+    offset: int
+    limit: int
+    items: List[CaseDiff]
+
+class SweepConfig(BaseModel):
+    model: str = "gpt-4o-mini"
+    temperature: float = 0.0
+    max_tokens: int = 2048
+
+class SweepRequest(BaseModel):
+    prompt: str
+    test_cases: List[PromptTestCase] = Field(min_length=1)
+    # Grid: mọi tổ hợp models × temperatures × max_tokens (cộng thêm configs nếu có)
+    models: List[str] = ["gpt-4o-mini"]
+    temperatures: List[float] = [0.0]
+    max_tokens: List[int] = [2048]
+    configs: Optional[List[SweepConfig]] = None
+    mode: Literal["text", "json", "judge"] = "text"
+    required_keys: Optional[List[str]] = None
+    max_concurrency: int = Field(16, ge=1, le=256)  # Tổng số call đồng thời của cả sweep
+    target_accuracy: Optional[float] = None
+
+class SweepConfigResult(BaseModel):
+    config: SweepConfig
+    accuracy: float
+    avg_similarity: float
+    latency_p50: float
+    latency_p95: float
+    latency_p99: float
+    requests: int  # Số model call thật sự đã gửi
+    cached_results: int  # Số input lấy lại từ cache thay vì gọi model
+    # Token / cost của config, kể cả input lấy từ cache (theo usage lúc output được tạo)
+    prompt_tokens: int
+    completion_tokens: int
+    cost: float  # USD
+    cache_savings: float = 0.0  # USD không phải trả nhờ cache (đã tính trong cost)
+    pareto_optimal: bool = False
+    run_id: Optional[str] = None
+
+class SweepResponse(BaseModel):
+    results: List[SweepConfigResult]
+    pareto: List[SweepConfig]  # Không config nào tốt hơn cùng lúc về accuracy, cost và latency
+    cheapest_at_target: Optional[SweepConfig] = None
+    fastest_at_target: Optional[SweepConfig] = None
+    unique_inputs: int
+    total_time: float
+
+class DistributedRunRequest(BaseModel):
+    # Không có budget_tokens / budget_usd: usage nằm ở từng process worker, không có budget chung
+    model_config = ConfigDict(extra="forbid")
+
+    prompt: str
+    test_cases: List[PromptTestCase]
+    pack_size: int = Field(1, ge=1)
+    num_samples: int = Field(1, ge=1)
+    temperature: float = 0.0
+    output_budget: Optional[Literal["suite", "case"]] = None  # Lập trên cả suite rồi chia theo chunk
+    stop_sequences: bool = True
+    retry_truncated: bool = True
+    chunk_size: int = Field(50, ge=1)  # Số test case mỗi chunk gửi cho worker
+    evaluate: bool = True  # Worker chấm luôn kết quả sau khi chạy
+    mode: Literal["text", "json", "judge"] = "text"
+    required_keys: Optional[List[str]] = None
+
+class DistributedRunStatus(BaseModel):
+    run_id: str
+    total_chunks: int
+    pending_chunks: int
+    running_chunks: int
+    completed_chunks: int
+    failed_chunks: int  # Quá số lần thử: case của chunk được trả về với error
+    done: bool
+    test_cases: Optional[List[PromptTestCase]] = None  # Có khi run đã xong, theo đúng thứ tự input
+    output_budget: Optional[OutputBudgetStats] = None  # Gộp từ các chunk đã xong
+
+class EstimateRequest(RunPromptRequest):
+    model: str = "gpt-4o-mini"
+    max_output_tokens: Optional[int] = None  # Giới hạn output mỗi case (mặc định theo expected_output)
\ No newline at end of file
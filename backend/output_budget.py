@@ -0,0 +1,175 @@
+import logging
+import math
+import os
+import threading
+from typing import Any, Dict, List, Optional
+from models import PromptTestCase, OutputBudgetStats
+from cost_estimator import count_tokens
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Cap = percentile độ dài expected_output (token) × margin, không nhỏ hơn OUTPUT_BUDGET_MIN_TOKENS
+OUTPUT_BUDGET_PERCENTILE = float(os.getenv("OUTPUT_BUDGET_PERCENTILE", "0.95"))
+OUTPUT_BUDGET_MARGIN = float(os.getenv("OUTPUT_BUDGET_MARGIN", "1.5"))
+OUTPUT_BUDGET_MIN_TOKENS = int(os.getenv("OUTPUT_BUDGET_MIN_TOKENS", "16"))
+
+
+def _percentile(values: List[int], q: float) -> int:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+def derive_stop_sequences(expected_outputs: List[str]) -> Optional[List[str]]:
+    """Stop sequence an toàn cho suite: "\\n" nếu mọi expected_output một dòng, "\\n\\n" nếu
+    không có dòng trống. Output dạng JSON không có stop (model có thể pretty-print)."""
+    outputs = [output.strip() for output in expected_outputs if output.strip()]
+    if not outputs or any(output[0] in "{[" for output in outputs):
+        return None
+    if not any("\n" in output for output in outputs):
+        return ["\n"]
+    if not any("\n\n" in output for output in outputs):
+        return ["\n\n"]
+    return None
+
+
+class OutputBudget:
+    """max_tokens (và stop sequence) cho các call của một run, ước lượng từ expected_output.
+
+    mode="suite": một cap cho mọi case; mode="case": cap theo expected_output của từng case,
+    đánh chỉ số theo vị trí case trong suite (case không có expected_output dùng cap của suite).
+    Call bị cắt (finish_reason="length") được chạy lại không cap nếu retry_truncated.
+    max_tokens là giới hạn cũ (không cap), dùng để ước lượng token / latency tiết kiệm.
+    """
+
+    def __init__(self, cap: int, case_caps: Optional[List[Optional[int]]] = None, stop: Optional[List[str]] = None,
+                 retry_truncated: bool = True, mode: str = "suite", max_tokens: Optional[int] = None):
+        self.cap = cap
+        self.case_caps = case_caps or []
+        self.stop = stop
+        self.retry_truncated = retry_truncated
+        self.mode = mode
+        self.max_tokens = max_tokens if max_tokens is not None else cap
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._truncated = 0
+        self._retried = 0
+        self._completion_tokens = 0
+        self._latency = 0.0
+        self._retry_latency = 0.0
+        self._tokens_saved = 0
+
+    def chunk_options(self, start: int, stop: int) -> Dict[str, Any]:
+        """Cấu hình budget cho các case [start, stop) (gửi kèm chunk distributed, JSON được)"""
+        return {
+            "cap": self.cap,
+            "case_caps": self.case_caps[start:stop],
+            "stop": self.stop,
+            "retry_truncated": self.retry_truncated,
+            "mode": self.mode,
+            "max_tokens": self.max_tokens
+        }
+
+    @classmethod
+    def from_options(cls, options: Dict[str, Any]) -> "OutputBudget":
+        return cls(options["cap"], options.get("case_caps"), options.get("stop"),
+                   options.get("retry_truncated", True), options.get("mode", "suite"), options.get("max_tokens"))
+
+    def cap_for(self, index: Optional[int]) -> int:
+        if index is not None and 0 <= index < len(self.case_caps) and self.case_caps[index] is not None:
+            return self.case_caps[index]
+        return self.cap
+
+    def is_truncated(self, completion: Any) -> bool:
+        # Output rỗng khi có stop: model mở đầu bằng xuống dòng, coi như bị cắt
+        return any(
+            choice.finish_reason == "length"
+            or (self.stop is not None and not (choice.message.content or "").strip())
+            for choice in completion.choices
+        )
+
+    def record(self, completion: Any, latency: float, cap: int, truncated: bool,
+               retry_latency: Optional[float] = None, stop_used: bool = False) -> None:
+        """Ghi một call có cap; retry_latency là thời gian của lần chạy lại không cap (nếu có).
+
+        Call kết thúc sớm nhờ budget (dừng ở stop sequence, hoặc bị cắt mà không chạy lại) được
+        tính tiết kiệm (max_tokens cũ - completion token thực tế) cho mỗi sample.
+        """
+        usage = getattr(completion, "usage", None)
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        with self._lock:
+            self._requests += 1
+            self._completion_tokens += completion_tokens
+            self._latency += latency
+            if truncated:
+                self._truncated += 1
+            if retry_latency is not None:
+                self._retried += 1
+                self._retry_latency += retry_latency
+            elif stop_used or truncated:
+                self._tokens_saved += max(0, self.max_tokens * len(completion.choices) - completion_tokens)
+
+    def stats(self) -> OutputBudgetStats:
+        """Metric của run. Latency tiết kiệm là cận trên: token tiết kiệm (giả định output không
+        dừng sớm sẽ chạy tới max_tokens cũ) nhân thời gian / token đo được, trừ thời gian các lần
+        chạy lại."""
+        with self._lock:
+            seconds_per_token = self._latency / self._completion_tokens if self._completion_tokens else 0.0
+            return OutputBudgetStats(
+                mode=self.mode,
+                max_tokens=max([self.cap, *(cap for cap in self.case_caps if cap is not None)]),
+                stop=self.stop,
+                requests=self._requests,
+                truncated=self._truncated,
+                retried=self._retried,
+                truncation_rate=self._truncated / self._requests if self._requests else 0.0,
+                completion_tokens=self._completion_tokens,
+                latency=round(self._latency, 3),
+                estimated_tokens_saved=self._tokens_saved,
+                estimated_latency_saved=round(self._tokens_saved * seconds_per_token - self._retry_latency, 3)
+            )
+
+
+def merge_stats(stats: List[OutputBudgetStats]) -> Optional[OutputBudgetStats]:
+    """Gộp stats của nhiều phần một run (ví dụ các chunk distributed)"""
+    if not stats:
+        return None
+    requests = sum(item.requests for item in stats)
+    truncated = sum(item.truncated for item in stats)
+    return OutputBudgetStats(
+        mode=stats[0].mode,
+        max_tokens=max(item.max_tokens for item in stats),
+        stop=stats[0].stop,
+        requests=requests,
+        truncated=truncated,
+        retried=sum(item.retried for item in stats),
+        truncation_rate=truncated / requests if requests else 0.0,
+        completion_tokens=sum(item.completion_tokens for item in stats),
+        latency=round(sum(item.latency for item in stats), 3),
+        estimated_tokens_saved=sum(item.estimated_tokens_saved for item in stats),
+        estimated_latency_saved=round(sum(item.estimated_latency_saved for item in stats), 3)
+    )
+
+
+def plan_output_budget(test_cases: List[PromptTestCase], model: str, max_tokens: int, mode: str = "suite",
+                       stop_sequences: bool = True, retry_truncated: bool = True,
+                       percentile: float = OUTPUT_BUDGET_PERCENTILE,
+                       margin: float = OUTPUT_BUDGET_MARGIN) -> Optional[OutputBudget]:
+    """OutputBudget cho suite, None nếu không case nào có expected_output để ước lượng"""
+    lengths = [
+        count_tokens(case.expected_output, model) if case.expected_output.strip() else None
+        for case in test_cases
+    ]
+    known = [tokens for tokens in lengths if tokens is not None]
+    if not known:
+        return None
+
+    def cap(tokens: int) -> int:
+        return min(max_tokens, max(OUTPUT_BUDGET_MIN_TOKENS, math.ceil(tokens * margin)))
+
+    suite_cap = cap(_percentile(known, percentile))
+    # Theo vị trí case: input trùng nhau nhưng expected_output khác vẫn có cap riêng
+    case_caps = [cap(tokens) if tokens is not None else None for tokens in lengths] if mode == "case" else None
+    stop = derive_stop_sequences([case.expected_output for case in test_cases]) if stop_sequences else None
+    logger.info(f"Output budget ({mode}): max_tokens={suite_cap}, stop={stop!r}")
+    return OutputBudget(suite_cap, case_caps, stop, retry_truncated, mode, max_tokens=max_tokens)
@@ -0,0 +1,222 @@
+import hmac
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Không đặt token thì profiling bị tắt hoàn toàn
+PROFILING_ADMIN_TOKEN = os.getenv("PROFILING_ADMIN_TOKEN", "")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+MAX_STACK_DEPTH = 128
+
+_PROFILE_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+# Phân loại thời gian theo frame trong cùng của mỗi sample
+LOOP_IDLE = "loop_idle"
+IO_WAIT = "io_wait"
+LOCK_WAIT = "lock_wait"
+CPU = "cpu"
+
+_IO_FILES = ("ssl.py", "socket.py", "selectors.py")
+_LOCK_FILES = ("threading.py", "queue.py", os.path.join("concurrent", "futures", "_base.py"))
+
+
+def _frame_key(code) -> Tuple[str, str, int]:
+    return code.co_name, code.co_filename, code.co_firstlineno
+
+
+def _classify(stack: List, loop_thread: bool) -> Optional[str]:
+    """Trả về loại thời gian của sample, None nếu thread đang rảnh (worker pool chờ việc)"""
+    name, filename, _ = stack[-1]
+    if filename.endswith("queue.py") and name in ("get", "_get"):
+        return None
+    if filename.endswith("selectors.py"):
+        return LOOP_IDLE if loop_thread else IO_WAIT
+    if filename.endswith(_IO_FILES) or "httpcore" in filename:
+        return IO_WAIT
+    if filename.endswith(_LOCK_FILES):
+        return LOCK_WAIT
+    return CPU
+
+
+class SamplingProfiler:
+    """Statistical profiler: một thread nền chụp stack của mọi thread sau mỗi interval.
+
+    Khác cProfile, sampler thấy được cả code chạy trong threadpool (run_in_threadpool,
+    executor của runner) và thời gian chờ mạng/lock, với overhead cố định theo interval.
+    Các request chạy đồng thời cũng xuất hiện trong profile.
+    """
+
+    def __init__(self, interval: Optional[float] = None):
+        self.interval = interval or PROFILE_SAMPLE_INTERVAL
+        self.loop_thread_id = threading.get_ident()
+        self._frames: Dict[Tuple[str, str, int], int] = {}
+        self._samples: Dict[int, List[List[int]]] = {}
+        self._breakdown: Dict[int, Counter] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.started_at = 0.0
+        self.duration = 0.0
+
+    def start(self) -> None:
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.time() - self.started_at
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    self._record(thread_id, frame)
+
+    def _record(self, thread_id: int, frame) -> None:
+        stack = []
+        while frame is not None and len(stack) < MAX_STACK_DEPTH:
+            stack.append(_frame_key(frame.f_code))
+            frame = frame.f_back
+        stack.reverse()
+
+        category = _classify(stack, thread_id == self.loop_thread_id)
+        if category is None:
+            return
+        self._breakdown.setdefault(thread_id, Counter())[category] += 1
+        indices = [self._frames.setdefault(key, len(self._frames)) for key in stack]
+        self._samples.setdefault(thread_id, []).append(indices)
+
+    def breakdown(self) -> Dict:
+        """Thời gian (giây, ước lượng từ số sample) theo loại, tách event loop và thread pool"""
+        loop = self._breakdown.get(self.loop_thread_id, Counter())
+        workers = Counter()
+        for thread_id, counts in self._breakdown.items():
+            if thread_id != self.loop_thread_id:
+                workers.update(counts)
+        return {
+            "duration": round(self.duration, 4),
+            "sample_interval": self.interval,
+            "event_loop": {key: round(count * self.interval, 4) for key, count in loop.items()},
+            "threads": {key: round(count * self.interval, 4) for key, count in workers.items()}
+        }
+
+    def to_speedscope(self, name: str) -> Dict:
+        threads = {thread.ident: thread.name for thread in threading.enumerate()}
+        profiles = []
+        for thread_id, samples in self._samples.items():
+            label = "event loop" if thread_id == self.loop_thread_id else threads.get(thread_id, str(thread_id))
+            profiles.append({
+                "type": "sampled",
+                "name": label,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": self.duration,
+                "samples": samples,
+                "weights": [self.interval] * len(samples)
+            })
+        frames = [None] * len(self._frames)
+        for (func, filename, line), index in self._frames.items():
+            frames[index] = {"name": func, "file": filename, "line": line}
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "auto-prompting-backend",
+            "shared": {"frames": frames},
+            "profiles": profiles
+        }
+
+
+def profile_path(profile_id: str, suffix: str = "speedscope.json") -> Optional[str]:
+    if not _PROFILE_ID_RE.match(profile_id):
+        return None
+    return os.path.join(PROFILE_DIR, f"{profile_id}.{suffix}")
+
+
+def save_profile(profiler: SamplingProfiler, name: str) -> str:
+    """Lưu speedscope file + breakdown, trả về profile id"""
+    profile_id = uuid.uuid4().hex
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(profile_path(profile_id), "w", encoding="utf-8") as f:
+        json.dump(profiler.to_speedscope(name), f)
+    with open(profile_path(profile_id, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump({"request": name, **profiler.breakdown()}, f)
+    return profile_id
+
+
+def is_admin(token: Optional[str]) -> bool:
+    # So sánh constant-time: thời gian không lộ độ dài prefix đúng của token
+    if not PROFILING_ADMIN_TOKEN or token is None:
+        return False
+    return hmac.compare_digest(token.encode("utf-8"), PROFILING_ADMIN_TOKEN.encode("utf-8"))
+
+
+class ProfilingMiddleware:
+    """Profile một request khi có header `x-profile: 1` (hoặc query `profile=1`)
+    kèm `x-admin-token` hợp lệ. Kết quả được lưu vào PROFILE_DIR, id trả về trong
+    header `x-profile-id`. Khi PROFILING_ADMIN_TOKEN không được đặt middleware chỉ
+    chuyển tiếp request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def _requested(self, scope) -> bool:
+        headers = dict(scope["headers"])
+        flag = headers.get(b"x-profile", b"").decode() or ""
+        if not flag:
+            query = scope.get("query_string", b"").decode()
+            flag = "1" if "profile=1" in query.split("&") else ""
+        if flag not in ("1", "true"):
+            return False
+        return is_admin(headers.get(b"x-admin-token", b"").decode())
+
+    async def __call__(self, scope, receive, send):
+        if not PROFILING_ADMIN_TOKEN or scope["type"] != "http" or not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profiler = SamplingProfiler()
+        profiler.start()
+        finished = False
+
+        def finish() -> Optional[str]:
+            nonlocal finished
+            if finished:
+                return None
+            finished = True
+            profiler.stop()
+            try:
+                return save_profile(profiler, f"{scope['method']} {scope['path']}")
+            except OSError as e:
+                logger.error(f"Failed to save profile: {str(e)}")
+                return None
+
+        async def send_with_profile(message):
+            # Response JSON được tạo xong trước khi gửi header nên profile dừng ở đây
+            if message["type"] == "http.response.start":
+                profile_id = finish()
+                if profile_id:
+                    message = dict(message)
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"x-profile-id", profile_id.encode())
+                    ]
+                    logger.info(f"Profiled {scope['path']} as {profile_id}")
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            finish()
@@ -1,14 +1,25 @@
 import logging
 import os
-from openai import OpenAI
-from typing import List
+from typing import List, Optional
 from models import Sample
-import openai
+from cancellation import RunCancelledError, sleep as cancellable_sleep
+from circuit_breaker import CircuitOpenError, degradation_scope, mark_degraded
+from generation_cache import generation_cache, cache_key
+import llm_client
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+PROMPT_GENERATION_PARAMS = {
+    "response_format": {"type": "text"},
+    "temperature": 1,
+    "max_tokens": 2048,
+    "top_p": 1,
+    "frequency_penalty": 0,
+    "presence_penalty": 0
+}
+
 def validate_api_key():
     """Validate OpenAI API key"""
     api_key = os.getenv('OPENAI_API_KEY')
@@ -18,39 +29,38 @@ def validate_api_key():
         raise ValueError("Invalid OpenAI API key format")
     return api_key
 
-def call_openai_api(client, messages, max_retries=3):
+def call_openai_api(messages, max_retries=3, seed: Optional[int] = None):
     """Call OpenAI API with manual retry mechanism"""
+    params = dict(PROMPT_GENERATION_PARAMS)
+    if seed is not None:
+        params["seed"] = seed
     try_count = 0
     while try_count < max_retries:
         try:
             logger.info(f"Attempt {try_count + 1} to call OpenAI API")
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=messages,
-                response_format={"type": "text"},
-                temperature=1,
-                max_tokens=2048,
-                top_p=1,
-                frequency_penalty=0,
-                presence_penalty=0
-            )
+            response = llm_client.chat_completion(messages=messages, **params)
             return response
+        except (RunCancelledError, CircuitOpenError):
+            # Breaker đang mở: retry chỉ làm request chờ thêm
+            raise
         except Exception as e:
             try_count += 1
             if try_count == max_retries:
                 logger.error(f"Failed after {max_retries} attempts: {str(e)}")
                 raise
             logger.warning(f"Attempt {try_count} failed: {str(e)}. Retrying in {try_count} seconds...")
-            time.sleep(try_count)
+            cancellable_sleep(try_count)
+
+def generate_prompt(format_output: str, samples: List[Sample], conditions: str, num_testcases: int = 1,
+                    seed: Optional[int] = None, regenerate: bool = False) -> str:
+    """Generate a prompt using OpenAI API
 
-def generate_prompt(format_output: str, samples: List[Sample], conditions: str, num_testcases: int = 1) -> str:
-    """Generate a prompt using OpenAI API"""
+    Có seed thì kết quả được cache theo (input, seed, model, tham số): gọi lại cùng cấu hình
+    trả ngay prompt cũ, trừ khi regenerate=True (gọi model lại và ghi đè cache).
+    """
     try:
         # Validate API key first
-        api_key = validate_api_key()
-        
-        # Initialize OpenAI client with validated key
-        client = openai.OpenAI(api_key=api_key)
+        validate_api_key()
         
         # Format samples into input-output pairs
         sample_pairs = "\n".join([
@@ -84,9 +94,18 @@ def generate_prompt(format_output: str, samples: List[Sample], conditions: str,
             }
         ]
 
+        key = None
+        if seed is not None:
+            key = cache_key("prompt", messages, seed, llm_client.DEFAULT_MODEL, PROMPT_GENERATION_PARAMS)
+            cached = None if regenerate else generation_cache.get(key)
+            if cached is not None:
+                logger.info(f"Using cached prompt for seed {seed}")
+                return cached
+
         # Call API with retry mechanism
         logger.info("Calling 4o-mini API...")
-        response = call_openai_api(client, messages)
+        with degradation_scope() as degraded:
+            response = call_openai_api(messages, seed=seed)
         
         # Extract generated prompt from response
         generated_prompt = response.choices[0].message.content
@@ -94,8 +113,14 @@ def generate_prompt(format_output: str, samples: List[Sample], conditions: str,
         # Log the generated prompt
         logger.info(f"Generated prompt:\n{generated_prompt}")
         
+        # Prompt fallback (khi API lỗi) và kết quả degraded của chính call này (model dự phòng,
+        # circuit mở) không được cache: key theo model mặc định, không theo model thực sự đã trả lời
+        if key is not None and not degraded:
+            generation_cache.put(key, generated_prompt)
         return generated_prompt
         
+    except RunCancelledError:
+        raise
     except Exception as e:
         logger.error(f"Error calling 4o-mini API: {str(e)}", exc_info=True)
         # Fallback to basic prompt generation if API call fails
@@ -104,4 +129,5 @@ def generate_prompt(format_output: str, samples: List[Sample], conditions: str,
         cond_str = f"Conditions: {conditions}" if conditions else ""
         fallback_prompt = f"{base}{sample_str}\n{cond_str}"
         logger.info(f"Using fallback prompt:\n{fallback_prompt}")
+        mark_degraded("fallback_prompt")
         return fallback_prompt 
\ No newline at end of file
@@ -0,0 +1,180 @@
+import concurrent.futures
+import contextvars
+import logging
+import random
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+from models import PromptTestCase, OptimizationHistory, OptimizationResult
+from cancellation import RunCancelledError
+from usage_tracker import BudgetExceededError, current_usage
+import llm_client
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MAX_FAILING_EXAMPLES = 8
+
+OPTIMIZER_SYSTEM_PROMPT = """Bạn là Prompt Optimizer. Bạn nhận một prompt hiện tại và các test case mà prompt đó làm sai (input, output mong đợi, output thực tế).
+Nhiệm vụ: viết lại prompt để sửa các lỗi này mà không làm hỏng các trường hợp đang đúng.
+- Giữ nguyên nhiệm vụ, format output và RESPONSE JSON TEMPLATE (nếu có) của prompt gốc.
+- Sửa instruction, bổ sung quy tắc hoặc ví dụ nhắm đúng vào nguyên nhân gây sai.
+- CHỈ trả về nội dung prompt mới, không giải thích, không bọc trong ```."""
+
+_FENCE_RE = re.compile(r"^```[a-zA-Z]*\s*(.*?)\s*```$", re.DOTALL)
+
+
+class PromptOptimizer:
+    """Tối ưu prompt theo kiểu successive halving.
+
+    Mỗi vòng: đề xuất nhiều prompt sửa từ các case sai, chấm tất cả trên minibatch
+    ngẫu nhiên nhỏ, giữ nửa tốt nhất và tăng gấp đôi minibatch; chỉ các prompt dẫn
+    đầu mới được chấm trên toàn bộ suite. Kết quả (prompt, case) được cache nên
+    các minibatch đã chấm không bao giờ bị chạy lại.
+    """
+
+    def __init__(self, runner, evaluator, num_candidates: int = 4, minibatch_size: int = 4,
+                 seed: Optional[int] = None):
+        self.runner = runner
+        self.evaluator = evaluator
+        self.num_candidates = num_candidates
+        self.minibatch_size = minibatch_size
+        self.rng = random.Random(seed)
+        self._results: Dict[Tuple[str, int], PromptTestCase] = {}
+        self._lock = threading.Lock()
+
+    def propose_edits(self, prompt: str, failing_cases: Sequence[PromptTestCase],
+                      num_candidates: int) -> List[str]:
+        """Sinh num_candidates prompt sửa lỗi trong một request (tham số n)"""
+        examples = "\n\n".join(
+            f"Input: {case.input}\nExpected: {case.expected_output}\nGot: {case.prompt_output}"
+            for case in failing_cases[:MAX_FAILING_EXAMPLES]
+        )
+        messages = [
+            {"role": "system", "content": OPTIMIZER_SYSTEM_PROMPT},
+            {"role": "user", "content": f"PROMPT HIỆN TẠI:\n{prompt}\n\nCÁC TEST CASE BỊ SAI:\n{examples}"}
+        ]
+
+        try:
+            completion = llm_client.chat_completion(
+                messages=messages,
+                temperature=1,
+                max_tokens=4096,
+                n=num_candidates
+            )
+        except RunCancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error proposing prompt edits: {str(e)}")
+            return []
+
+        candidates = []
+        for choice in completion.choices:
+            text = (choice.message.content or "").strip()
+            fenced = _FENCE_RE.match(text)
+            if fenced:
+                text = fenced.group(1)
+            if text and text != prompt and text not in candidates:
+                candidates.append(text)
+        return candidates
+
+    def evaluate(self, prompt: str, test_cases: List[PromptTestCase],
+                 indices: Sequence[int]) -> Tuple[float, List[PromptTestCase]]:
+        """Chấm prompt trên các case theo indices, chỉ chạy những case chưa có trong cache"""
+        with self._lock:
+            missing = [i for i in indices if (prompt, i) not in self._results]
+
+        if missing:
+            cases = [
+                test_cases[i].model_copy(update={"prompt_output": "", "samples": None})
+                for i in missing
+            ]
+            self.runner.run_with_testcases(prompt, cases)
+            self.evaluator.evaluate_testcases(cases)
+            with self._lock:
+                for i, case in zip(missing, cases):
+                    self._results[(prompt, i)] = case
+
+        with self._lock:
+            results = [self._results[(prompt, i)] for i in indices]
+        accuracy = sum(case.is_correct for case in results) / len(results) if results else 0.0
+        return accuracy, results
+
+    def _evaluate_many(self, prompts: List[str], test_cases: List[PromptTestCase],
+                       indices: Sequence[int]) -> List[float]:
+        """Chấm nhiều prompt song song trên cùng một minibatch"""
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(prompts))) as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, self.evaluate, prompt, test_cases, indices)
+                for prompt in prompts
+            ]
+            return [future.result()[0] for future in futures]
+
+    def successive_halving(self, candidates: List[str], test_cases: List[PromptTestCase]) -> List[str]:
+        """Loại dần candidate trên minibatch tăng dần, trả về các prompt dẫn đầu"""
+        pool = list(candidates)
+        size = min(self.minibatch_size, len(test_cases))
+
+        while len(pool) > 1 and size < len(test_cases):
+            minibatch = self.rng.sample(range(len(test_cases)), size)
+            scores = self._evaluate_many(pool, test_cases, minibatch)
+            ranked = sorted(zip(scores, range(len(pool))), key=lambda item: (-item[0], item[1]))
+            pool = [pool[i] for _, i in ranked[:(len(pool) + 1) // 2]]
+            logger.info(f"Successive halving: kept {len(pool)} candidate(s) after minibatch of {size}")
+            size *= 2
+
+        return pool
+
+    def optimize(self, prompt: str, test_cases: List[PromptTestCase], target_accuracy: float = 0.9,
+                 max_iterations: int = 5, start_iteration: int = 0) -> OptimizationResult:
+        """Lặp đề xuất → successive halving → chấm full suite cho tới khi đạt target_accuracy"""
+        all_indices = range(len(test_cases))
+        start_time = time.time()
+        best_prompt = prompt
+        best_accuracy, best_cases = self.evaluate(prompt, test_cases, all_indices)
+        iteration = start_iteration
+        history = [OptimizationHistory(
+            iteration=iteration,
+            accuracy=best_accuracy,
+            response_time=time.time() - start_time
+        )]
+
+        while best_accuracy < target_accuracy and iteration < max_iterations:
+            usage = current_usage()
+            if usage is not None and usage.budget_exceeded:
+                logger.warning("Run budget exhausted, stopping optimization")
+                break
+            iteration_start = time.time()
+            failing = [case for case in best_cases if not case.is_correct]
+            try:
+                candidates = self.propose_edits(best_prompt, failing, self.num_candidates)
+            except BudgetExceededError:
+                logger.warning("Run budget exhausted, stopping optimization")
+                break
+            if not candidates:
+                logger.warning("Optimizer produced no candidate prompts, stopping")
+                break
+            iteration += 1
+
+            leaders = self.successive_halving(candidates, test_cases)
+            scores = self._evaluate_many(leaders, test_cases, all_indices)
+            for leader, accuracy in zip(leaders, scores):
+                if accuracy > best_accuracy:
+                    best_prompt = leader
+                    best_accuracy, best_cases = self.evaluate(leader, test_cases, all_indices)
+
+            history.append(OptimizationHistory(
+                iteration=iteration,
+                accuracy=best_accuracy,
+                response_time=time.time() - iteration_start
+            ))
+            logger.info(f"Optimization iteration {iteration}: best accuracy {best_accuracy:.2f}")
+
+        return OptimizationResult(
+            prompt=best_prompt,
+            accuracy=best_accuracy,
+            test_cases=best_cases,
+            history=history,
+            iterations=iteration
+        )
@@ -0,0 +1,469 @@
+import difflib
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+import shutil
+import struct
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from typing import Dict, Iterator, List, Optional, Tuple
+from models import PromptTestCase, StoredTestCase, RunResultsPage, CaseDiff, RunDiff
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+RESULT_STORE_ENABLED = os.getenv("RESULT_STORE_ENABLED", "true").lower() == "true"
+RESULT_STORE_DIR = os.getenv("RESULT_STORE_DIR", "results")
+# Retention: giữ tối đa RESULT_STORE_MAX_RUNS run mới nhất, xoá run cũ hơn RESULT_STORE_MAX_AGE_DAYS
+# (0 = không giới hạn); áp dụng mỗi khi tạo run mới
+RESULT_STORE_MAX_RUNS = int(os.getenv("RESULT_STORE_MAX_RUNS", "1000"))
+RESULT_STORE_MAX_AGE_DAYS = float(os.getenv("RESULT_STORE_MAX_AGE_DAYS", "30"))
+MAX_PAGE_SIZE = 1000
+# Diff so diff.idx của hai run theo khối entry (so sánh bytes, memcmp); chỉ khối khác nhau
+# mới được duyệt từng entry
+DIFF_BLOCK_ENTRIES = 1024
+
+# Mỗi record trong results.dat: độ dài (uint32) + JSON của PromptTestCase.
+# index.idx: mỗi record một entry cố định (offset, length, similarity, is_correct)
+# để lọc theo is_correct/similarity mà không phải đọc record.
+_LENGTH = struct.Struct("<I")
+_INDEX_ENTRY = struct.Struct("<QId?")
+# diff.idx: cùng thứ tự với index.idx, mỗi entry (hash input, hash output, similarity, is_correct)
+# để so hai run bằng hash, chỉ đọc record của các case khác nhau
+_DIFF_ENTRY = struct.Struct("<16s16sd?")
+# pass.idx / fail.idx: vị trí (uint32, tăng dần) của các case đúng / sai, để lọc theo is_correct
+# và phân trang mà không duyệt cả index
+_POSITION = struct.Struct("<I")
+_RUN_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+DATA_FILE = "results.dat"
+INDEX_FILE = "index.idx"
+META_FILE = "meta.json"
+DIFF_FILE = "diff.idx"
+PASS_FILE = "pass.idx"
+FAIL_FILE = "fail.idx"
+
+DIFF_STATUSES = ("regressed", "fixed", "changed", "added", "removed", "unchanged")
+
+
+def _map(path: str) -> Optional[mmap.mmap]:
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def _diff_entry(case: PromptTestCase) -> bytes:
+    return _DIFF_ENTRY.pack(_digest(case.input), _digest(case.prompt_output), case.similarity_score, case.is_correct)
+
+
+def _entry(blob: bytes, position: int) -> bytes:
+    return blob[position * _DIFF_ENTRY.size:(position + 1) * _DIFF_ENTRY.size]
+
+
+def _add_range(ranges: List[Tuple[int, int]], start: int, stop: int) -> None:
+    if ranges and ranges[-1][1] == start:
+        ranges[-1] = (ranges[-1][0], stop)
+    else:
+        ranges.append((start, stop))
+
+
+def _positions_file(correct: bool) -> str:
+    return PASS_FILE if correct else FAIL_FILE
+
+
+def _classify(base: Tuple, head: Tuple) -> str:
+    _, base_output, base_score, base_correct = base
+    _, head_output, head_score, head_correct = head
+    if base_correct != head_correct:
+        return "fixed" if head_correct else "regressed"
+    if base_output != head_output or base_score != head_score:
+        return "changed"
+    return "unchanged"
+
+
+class RunWriter:
+    """Ghi append-only kết quả của một run; có thể đọc song song trong lúc ghi"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._data = open(os.path.join(directory, DATA_FILE), "ab")
+        self._index = open(os.path.join(directory, INDEX_FILE), "ab")
+        self._diff = open(os.path.join(directory, DIFF_FILE), "ab")
+        self._positions = {
+            correct: open(os.path.join(directory, _positions_file(correct)), "ab") for correct in (True, False)
+        }
+        self._offset = self._data.tell()
+        self.count = self._index.tell() // _INDEX_ENTRY.size
+
+    def append(self, test_cases: List[PromptTestCase]) -> None:
+        with self._lock:
+            for case in test_cases:
+                payload = case.model_dump_json().encode("utf-8")
+                self._data.write(_LENGTH.pack(len(payload)))
+                self._data.write(payload)
+                self._index.write(_INDEX_ENTRY.pack(
+                    self._offset, len(payload), case.similarity_score, case.is_correct
+                ))
+                self._diff.write(_diff_entry(case))
+                self._positions[case.is_correct].write(_POSITION.pack(self.count))
+                self._offset += _LENGTH.size + len(payload)
+                self.count += 1
+            # Data phải xuống đĩa trước index để reader không thấy entry trỏ vào vùng chưa ghi;
+            # vị trí vượt quá index (chưa flush) bị reader bỏ qua
+            self._data.flush()
+            self._diff.flush()
+            for f in self._positions.values():
+                f.flush()
+            self._index.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._data.close()
+            self._index.close()
+            self._diff.close()
+            for f in self._positions.values():
+                f.close()
+
+
+class ResultStore:
+    """Lưu kết quả run trên đĩa, truy vấn phân trang qua mmap (bộ nhớ không phụ thuộc kích thước run)"""
+
+    def __init__(self, root: str = RESULT_STORE_DIR, max_runs: int = RESULT_STORE_MAX_RUNS,
+                 max_age_days: float = RESULT_STORE_MAX_AGE_DAYS):
+        self.root = root
+        self.max_runs = max_runs
+        self.max_age_days = max_age_days
+
+    def _run_dir(self, run_id: str) -> str:
+        if not _RUN_ID_RE.match(run_id):
+            raise KeyError(run_id)
+        return os.path.join(self.root, run_id)
+
+    def create_run(self, kind: str, **meta) -> Tuple[str, RunWriter]:
+        run_id = uuid.uuid4().hex
+        directory = os.path.join(self.root, run_id)
+        os.makedirs(directory)
+        with open(os.path.join(directory, META_FILE), "w", encoding="utf-8") as f:
+            json.dump({"run_id": run_id, "kind": kind, "created_at": time.time(), **meta}, f, ensure_ascii=False)
+        writer = RunWriter(directory)
+        self.prune()
+        return run_id, writer
+
+    def prune(self) -> int:
+        """Xoá run vượt retention (max_runs run mới nhất, max_age_days); trả số run đã xoá"""
+        if not self.max_runs and not self.max_age_days:
+            return 0
+        cutoff = time.time() - self.max_age_days * 86400 if self.max_age_days else None
+        expired = [
+            run["run_id"] for position, run in enumerate(self.list_runs())
+            if (self.max_runs and position >= self.max_runs) or (cutoff is not None and run["created_at"] < cutoff)
+        ]
+        for run_id in expired:
+            try:
+                self.delete_run(run_id)
+            except (KeyError, OSError):
+                pass  # Worker khác đã xoá
+        if expired:
+            logger.info(f"Pruned {len(expired)} run(s) past retention")
+        return len(expired)
+
+    def save(self, kind: str, test_cases: List[PromptTestCase], **meta) -> str:
+        run_id, writer = self.create_run(kind, **meta)
+        try:
+            writer.append(test_cases)
+        finally:
+            writer.close()
+        return run_id
+
+    def run_info(self, run_id: str) -> Dict:
+        directory = self._run_dir(run_id)
+        meta_path = os.path.join(directory, META_FILE)
+        if not os.path.exists(meta_path):
+            raise KeyError(run_id)
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        meta["total"] = os.path.getsize(os.path.join(directory, INDEX_FILE)) // _INDEX_ENTRY.size
+        return meta
+
+    def list_runs(self) -> List[Dict]:
+        if not os.path.isdir(self.root):
+            return []
+        runs = []
+        for name in os.listdir(self.root):
+            if not _RUN_ID_RE.match(name):
+                continue
+            try:
+                runs.append(self.run_info(name))
+            except (KeyError, OSError):
+                continue  # Run đang được tạo / xoá
+        return sorted(runs, key=lambda run: run["created_at"], reverse=True)
+
+    def delete_run(self, run_id: str) -> None:
+        directory = self._run_dir(run_id)
+        if not os.path.isdir(directory):
+            raise KeyError(run_id)
+        shutil.rmtree(directory)
+
+    def _positions_path(self, run_id: str, correct: bool) -> str:
+        """pass.idx / fail.idx của run (run cũ chưa có file thì dựng từ index.idx và ghi lại)"""
+        directory = self._run_dir(run_id)
+        path = os.path.join(directory, _positions_file(correct))
+        if not os.path.exists(path):
+            index = _map(os.path.join(directory, INDEX_FILE))
+            positions: Dict[bool, List[bytes]] = {True: [], False: []}
+            if index is not None:
+                try:
+                    for i in range(len(index) // _INDEX_ENTRY.size):
+                        flag = _INDEX_ENTRY.unpack_from(index, i * _INDEX_ENTRY.size)[3]
+                        positions[flag].append(_POSITION.pack(i))
+                finally:
+                    index.close()
+            for flag, entries in positions.items():
+                target = os.path.join(directory, _positions_file(flag))
+                tmp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(b"".join(entries))
+                os.replace(tmp, target)
+        return path
+
+    def _positions(self, run_id: str, correct: bool, total: int, start: int = 0,
+                   stop: Optional[int] = None) -> Tuple[int, List[int]]:
+        """(số case đúng / sai trong total case đầu, vị trí [start, stop) của chúng)"""
+        with open(self._positions_path(run_id, correct), "rb") as f:
+            count = os.fstat(f.fileno()).st_size // _POSITION.size
+            # Writer ghi vị trí trước index: bỏ các vị trí index chưa có
+            while count:
+                f.seek((count - 1) * _POSITION.size)
+                if _POSITION.unpack(f.read(_POSITION.size))[0] < total:
+                    break
+                count -= 1
+            stop = count if stop is None else min(stop, count)
+            if start >= stop:
+                return count, []
+            f.seek(start * _POSITION.size)
+            blob = f.read((stop - start) * _POSITION.size)
+        return count, [position for (position,) in _POSITION.iter_unpack(blob)]
+
+    def _scan(self, run_id: str, is_correct: Optional[bool], min_similarity: Optional[float],
+              max_similarity: Optional[float], input_contains: Optional[str]) -> Iterator[Tuple[int, Optional[PromptTestCase]]]:
+        """Duyệt các record khớp filter (index, record nếu đã phải parse để lọc input)"""
+        directory = self._run_dir(run_id)
+        index = _map(os.path.join(directory, INDEX_FILE))
+        if index is None:
+            return
+        data = _map(os.path.join(directory, DATA_FILE))
+        try:
+            total = len(index) // _INDEX_ENTRY.size
+            # Lọc is_correct: chỉ duyệt vị trí trong pass.idx / fail.idx
+            candidates = range(total) if is_correct is None else self._positions(run_id, is_correct, total)[1]
+            for i in candidates:
+                offset, length, similarity, correct = _INDEX_ENTRY.unpack_from(index, i * _INDEX_ENTRY.size)
+                if min_similarity is not None and similarity < min_similarity:
+                    continue
+                if max_similarity is not None and similarity > max_similarity:
+                    continue
+                if input_contains is None:
+                    yield i, None
+                    continue
+                start = offset + _LENGTH.size
+                case = PromptTestCase.model_validate_json(data[start:start + length])
+                if input_contains.lower() in case.input.lower():
+                    yield i, case
+        finally:
+            index.close()
+            if data is not None:
+                data.close()
+
+    def read_many(self, run_id: str, positions: List[int]) -> List[PromptTestCase]:
+        directory = self._run_dir(run_id)
+        index = _map(os.path.join(directory, INDEX_FILE))
+        data = _map(os.path.join(directory, DATA_FILE))
+        try:
+            cases = []
+            for position in positions:
+                offset, length, _, _ = _INDEX_ENTRY.unpack_from(index, position * _INDEX_ENTRY.size)
+                start = offset + _LENGTH.size
+                cases.append(PromptTestCase.model_validate_json(data[start:start + length]))
+            return cases
+        finally:
+            if index is not None:
+                index.close()
+            if data is not None:
+                data.close()
+
+    def failures(self, run_id: str) -> Tuple[List[int], List[PromptTestCase]]:
+        """Vị trí và nội dung mọi case sai của run (vị trí lấy từ fail.idx, chỉ đọc record của case sai)"""
+        _, positions = self._positions(run_id, False, self.run_info(run_id)["total"])
+        return positions, self.read_many(run_id, positions) if positions else []
+
+    def query(self, run_id: str, offset: int = 0, limit: int = 100, is_correct: Optional[bool] = None,
+              min_similarity: Optional[float] = None, max_similarity: Optional[float] = None,
+              input_contains: Optional[str] = None) -> RunResultsPage:
+        """Một trang kết quả khớp filter; chỉ các record trong trang mới được đọc từ data file"""
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        info = self.run_info(run_id)
+        matched = 0
+        page: List[Tuple[int, Optional[PromptTestCase]]] = []
+        if is_correct is not None and min_similarity is None and max_similarity is None and input_contains is None:
+            # Chỉ lọc is_correct: trang lấy thẳng từ pass.idx / fail.idx, không duyệt run
+            matched, positions = self._positions(run_id, is_correct, info["total"], offset, offset + limit)
+            page = [(position, None) for position in positions]
+        else:
+            for position, case in self._scan(run_id, is_correct, min_similarity, max_similarity, input_contains):
+                if offset <= matched < offset + limit:
+                    page.append((position, case))
+                matched += 1
+
+        unread = [position for position, case in page if case is None]
+        loaded = dict(zip(unread, self.read_many(run_id, unread))) if unread else {}
+        items = [
+            StoredTestCase(position=position, **(case or loaded[position]).model_dump())
+            for position, case in page
+        ]
+        return RunResultsPage(
+            run_id=run_id,
+            total=info["total"],
+            matched=matched,
+            offset=offset,
+            limit=limit,
+            items=items
+        )
+
+    def _diff_blob(self, run_id: str) -> bytes:
+        """Nội dung diff.idx của run (run cũ chưa có file thì tính từ record và ghi lại)"""
+        total = self.run_info(run_id)["total"]
+        path = os.path.join(self._run_dir(run_id), DIFF_FILE)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                blob = f.read(total * _DIFF_ENTRY.size)
+            if len(blob) == total * _DIFF_ENTRY.size:
+                return blob
+        blob = b"".join(_diff_entry(case) for case in self.read_many(run_id, list(range(total))))
+        with open(path, "wb") as f:
+            f.write(blob)
+        return blob
+
+    def _pair(self, base: bytes, head: bytes) -> Tuple[List[Tuple[str, Optional[int], Optional[int]]],
+                                                       List[Tuple[int, int]]]:
+        """Ghép case hai run theo hash input: (các cặp khác nhau (status, vị trí ở base, vị trí ở
+        head), các khoảng vị trí [start, stop) giống hệt nhau ở cả hai run).
+
+        Cùng suite chạy lại thì input thẳng hàng theo vị trí: khối entry giống hệt byte được bỏ
+        qua bằng một phép so sánh bytes, không tạo cặp cho từng case. Vẫn đọc O(N) byte index
+        nhưng phần việc Python tỉ lệ với số khối có thay đổi. Phần lệch ghép theo hash input
+        (input trùng ghép theo thứ tự xuất hiện).
+        """
+        size = _DIFF_ENTRY.size
+        base_total, head_total = len(base) // size, len(head) // size
+        pairs: List[Tuple[str, Optional[int], Optional[int]]] = []
+        unchanged: List[Tuple[int, int]] = []
+        unpaired_base: Dict[bytes, deque] = defaultdict(deque)
+        unpaired_head: List[int] = []
+
+        aligned = min(base_total, head_total)
+        for start in range(0, aligned, DIFF_BLOCK_ENTRIES):
+            stop = min(aligned, start + DIFF_BLOCK_ENTRIES)
+            if base[start * size:stop * size] == head[start * size:stop * size]:
+                _add_range(unchanged, start, stop)
+                continue
+            for position in range(start, stop):
+                base_entry, head_entry = _entry(base, position), _entry(head, position)
+                if base_entry == head_entry:
+                    _add_range(unchanged, position, position + 1)
+                elif base_entry[:16] == head_entry[:16]:
+                    pairs.append((_classify(_DIFF_ENTRY.unpack(base_entry), _DIFF_ENTRY.unpack(head_entry)),
+                                  position, position))
+                else:
+                    unpaired_base[base_entry[:16]].append(position)
+                    unpaired_head.append(position)
+        for position in range(aligned, base_total):
+            unpaired_base[_entry(base, position)[:16]].append(position)
+        unpaired_head.extend(range(aligned, head_total))
+
+        for head_position in unpaired_head:
+            head_entry = _entry(head, head_position)
+            candidates = unpaired_base.get(head_entry[:16])
+            if candidates:
+                base_position = candidates.popleft()
+                status = _classify(_DIFF_ENTRY.unpack(_entry(base, base_position)), _DIFF_ENTRY.unpack(head_entry))
+                pairs.append((status, base_position, head_position))
+            else:
+                pairs.append(("added", None, head_position))
+        for positions in unpaired_base.values():
+            pairs.extend(("removed", position, None) for position in positions)
+        return pairs, unchanged
+
+    def diff(self, base_run_id: str, head_run_id: str, status: Optional[List[str]] = None,
+             offset: int = 0, limit: int = 100) -> RunDiff:
+        """So hai run theo hash: số case mỗi status và một trang case khớp filter status
+        (mặc định mọi case trừ unchanged). Chỉ record trong trang được đọc và diff text."""
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        wanted = set(status) if status else set(DIFF_STATUSES) - {"unchanged"}
+        pairs, unchanged = self._pair(self._diff_blob(base_run_id), self._diff_blob(head_run_id))
+
+        counts = dict.fromkeys(DIFF_STATUSES, 0)
+        for pair_status, _, _ in pairs:
+            counts[pair_status] += 1
+        counts["unchanged"] += sum(stop - start for start, stop in unchanged)
+        selected = [pair for pair in pairs if pair[0] in wanted]
+        if "unchanged" in wanted:
+            # Chỉ khi lọc unchanged mới tạo cặp cho từng case không đổi
+            selected.extend(("unchanged", position, position)
+                            for start, stop in unchanged for position in range(start, stop))
+        # Thứ tự ổn định theo vị trí trong run mới, case bị xoá ở cuối
+        selected.sort(key=lambda pair: (pair[2] is None, pair[2] if pair[2] is not None else pair[1]))
+        page = selected[offset:offset + limit]
+
+        base_positions = [base for _, base, _ in page if base is not None]
+        head_positions = [head for _, _, head in page if head is not None]
+        base_cases = dict(zip(base_positions, self.read_many(base_run_id, base_positions))) if base_positions else {}
+        head_cases = dict(zip(head_positions, self.read_many(head_run_id, head_positions))) if head_positions else {}
+
+        items = []
+        for pair_status, base_position, head_position in page:
+            base_case = base_cases.get(base_position)
+            head_case = head_cases.get(head_position)
+            case = head_case or base_case
+            diff = None
+            if base_case is not None and head_case is not None and base_case.prompt_output != head_case.prompt_output:
+                diff = "\n".join(difflib.unified_diff(
+                    base_case.prompt_output.splitlines(), head_case.prompt_output.splitlines(),
+                    fromfile=base_run_id, tofile=head_run_id, lineterm=""
+                ))
+            items.append(CaseDiff(
+                status=pair_status,
+                input=case.input,
+                expected_output=case.expected_output,
+                base_position=base_position,
+                head_position=head_position,
+                base_output=base_case.prompt_output if base_case else None,
+                head_output=head_case.prompt_output if head_case else None,
+                base_correct=base_case.is_correct if base_case else None,
+                head_correct=head_case.is_correct if head_case else None,
+                base_score=base_case.similarity_score if base_case else None,
+                head_score=head_case.similarity_score if head_case else None,
+                diff=diff
+            ))
+        return RunDiff(
+            base_run_id=base_run_id,
+            head_run_id=head_run_id,
+            counts=counts,
+            matched=len(selected),
+            offset=offset,
+            limit=limit,
+            items=items
+        )
+
+
+result_store = ResultStore()
@@ -1,4 +1,15 @@
+import argparse
+import sys
 import uvicorn
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Auto Prompting Tool API server")
+    parser.add_argument("--prod", action="store_true", help="Chạy production mode (gunicorn, nhiều worker)")
+    args = parser.parse_args()
+
+    if args.prod:
+        from gunicorn.app.wsgiapp import run
+        sys.argv = ["gunicorn", "-c", "gunicorn.conf.py", "main:app"]
+        run()
+    else:
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
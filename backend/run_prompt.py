@@ -1,33 +1,72 @@
+import json
 import logging
 import os
 import time
-from typing import List, Dict
-import openai
-import httpx
+from typing import Any, List, Dict, Optional
 from models import PromptInput, PromptOutput
+from cancellation import RunCancelledError
+from circuit_breaker import mark_degraded
+from consistency import majority_vote
+import llm_client
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Output token cho mỗi input khi nhiều input được gộp chung một request
+PACKED_MAX_TOKENS_PER_ITEM = 512
+# Token phụ của mỗi item trong output gộp ({"index": i, "output": ...})
+PACKED_ITEM_OVERHEAD_TOKENS = 12
+PACKED_MAX_TOKENS = 16000
+DEFAULT_MAX_TOKENS = 2048
+
+# Hợp đồng output khi gộp nhiều input: đặt sau prompt gốc, giống nhau cho mọi request
+PACKING_INSTRUCTION = """
+
+============
+MULTI-INPUT MODE:
+The user message is a JSON object {"items": [{"index": <int>, "input": <string>}, ...]}.
+Treat every item as a separate, independent request and apply all instructions above to each input on its own.
+Respond ONLY with a JSON object of the form:
+{"answers": [{"index": <same index as the item>, "output": <your complete response for that item>}]}
+Return exactly one answer per item and keep each output exactly as you would answer that input alone."""
+
 class PromptRunner:
-    def __init__(self):
-        # Khởi tạo OpenAI client
-        api_key = os.getenv('OPENAI_API_KEY')
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY environment variable is not set")
-            
-        http_client = httpx.Client(
-            base_url="https://api.openai.com/v1",
-            timeout=60.0,
-            follow_redirects=True
-        )
+    def __init__(self, model: str = llm_client.DEFAULT_MODEL, max_tokens: int = DEFAULT_MAX_TOKENS):
+        self.model = model
+        self.max_tokens = max_tokens
+
+    @property
+    def client(self):
+        # OpenAI client dùng chung của worker, khởi tạo lười ở lần gọi đầu tiên
+        return llm_client.get_client()
+
+    def _complete(self, messages: List[Dict], temperature: float, budget=None,
+                  cap: Optional[int] = None, **params) -> Any:
+        """Gọi model với max_tokens của runner, hoặc với cap (mặc định cap của suite) / stop của
+        OutputBudget; output bị cắt được chạy lại không cap nếu budget cho phép"""
+        if budget is None:
+            return llm_client.chat_completion(messages=messages, model=self.model, temperature=temperature,
+                                              max_tokens=self.max_tokens, **params)
+        
+        cap = cap if cap is not None else budget.cap
+        start_time = time.time()
+        stop = {"stop": budget.stop} if budget.stop and "response_format" not in params else {}
+        completion = llm_client.chat_completion(messages=messages, model=self.model, temperature=temperature,
+                                                max_tokens=cap, **stop, **params)
+        latency = time.time() - start_time
+        truncated = budget.is_truncated(completion)
+        if not truncated or not budget.retry_truncated:
+            budget.record(completion, latency, cap, truncated, stop_used=bool(stop))
+            return completion
         
-        self.client = openai.OpenAI(
-            api_key=api_key,
-            http_client=http_client
-        )
+        retry_start = time.time()
+        retry = llm_client.chat_completion(messages=messages, model=self.model, temperature=temperature,
+                                           max_tokens=max(self.max_tokens, cap), **params)
+        budget.record(completion, latency, cap, truncated, retry_latency=time.time() - retry_start)
+        return retry
 
-    def run_single_prompt(self, prompt: str, input_text: str) -> PromptOutput:
+    def run_single_prompt(self, prompt: str, input_text: str, temperature: float = 0,
+                          budget=None, cap: Optional[int] = None) -> PromptOutput:
         """Chạy một prompt với một input"""
         try:
             start_time = time.time()
@@ -37,11 +76,11 @@ class PromptRunner:
                 {"role": "user", "content": input_text}
             ]
             
-            completion = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=messages,
-                temperature=0,
-                max_tokens=2048
+            completion = self._complete(
+                messages,
+                temperature,
+                budget=budget,
+                cap=cap
             )
             
             output = completion.choices[0].message.content.strip()
@@ -53,14 +92,126 @@ class PromptRunner:
                 response_time=response_time
             )
             
+        except RunCancelledError:
+            raise
         except Exception as e:
             logger.error(f"Error running prompt: {str(e)}")
+            mark_degraded("failed_outputs")
             return PromptOutput(
                 input=input_text,
                 output="",
                 response_time=0.0
             )
 
+    def run_multi_sample(self, prompt: str, input_text: str, num_samples: int,
+                         temperature: float = 1.0, budget=None, cap: Optional[int] = None) -> PromptOutput:
+        """Lấy num_samples output cho một input trong một request (tham số n)"""
+        try:
+            start_time = time.time()
+            
+            messages = [
+                {"role": "system", "content": prompt},
+                {"role": "user", "content": input_text}
+            ]
+            
+            # Một round-trip, prompt token chỉ tính một lần cho cả num_samples sample
+            completion = self._complete(
+                messages,
+                temperature,
+                budget=budget,
+                cap=cap,
+                n=num_samples
+            )
+            
+            choices = sorted(completion.choices, key=lambda choice: choice.index)
+            samples = [(choice.message.content or "").strip() for choice in choices]
+            output, _ = majority_vote(samples)
+            
+            return PromptOutput(
+                input=input_text,
+                output=output,
+                response_time=time.time() - start_time,
+                samples=samples
+            )
+            
+        except RunCancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error running multi-sample prompt: {str(e)}")
+            mark_degraded("failed_outputs")
+            return PromptOutput(
+                input=input_text,
+                output="",
+                response_time=0.0,
+                samples=[]
+            )
+
+    def run_packed_prompts(self, prompt: str, inputs: List[str], budget=None,
+                           caps: Optional[List[int]] = None) -> List[Optional[PromptOutput]]:
+        """Chạy nhiều input trong một request; input không map được answer trả về None.
+
+        Với budget, max_tokens là tổng cap của các item (caps theo thứ tự inputs, mặc định cap
+        của suite); response bị cắt không parse được
+        nên các item rơi về chạy riêng lẻ (có cap) thay vì chạy lại cả request.
+        """
+        results: List[Optional[PromptOutput]] = [None] * len(inputs)
+        try:
+            start_time = time.time()
+            
+            messages = [
+                {"role": "system", "content": prompt + PACKING_INSTRUCTION},
+                {"role": "user", "content": json.dumps(
+                    {"items": [{"index": i, "input": text} for i, text in enumerate(inputs)]},
+                    ensure_ascii=False
+                )}
+            ]
+            
+            if budget is None:
+                max_tokens = min(PACKED_MAX_TOKENS, PACKED_MAX_TOKENS_PER_ITEM * len(inputs))
+            else:
+                max_tokens = min(PACKED_MAX_TOKENS, sum(
+                    min(PACKED_MAX_TOKENS_PER_ITEM, cap + PACKED_ITEM_OVERHEAD_TOKENS)
+                    for cap in (caps if caps is not None else [budget.cap] * len(inputs))
+                ))
+            
+            call_start = time.time()
+            completion = llm_client.chat_completion(
+                messages=messages,
+                model=self.model,
+                temperature=0,
+                max_tokens=max_tokens,
+                response_format={"type": "json_object"}
+            )
+            if budget is not None:
+                budget.record(completion, time.time() - call_start, max_tokens, budget.is_truncated(completion))
+            
+            response_time = (time.time() - start_time) / len(inputs)
+            answers = json.loads(completion.choices[0].message.content).get("answers", [])
+            
+            for answer in answers:
+                index = answer.get("index") if isinstance(answer, dict) else None
+                if not isinstance(index, int) or not 0 <= index < len(inputs) or results[index] is not None:
+                    continue
+                output = answer.get("output")
+                if isinstance(output, (dict, list)):
+                    output = json.dumps(output, ensure_ascii=False)
+                elif output is not None:
+                    output = str(output).strip()
+                if not output:
+                    continue
+                results[index] = PromptOutput(
+                    input=inputs[index],
+                    output=output,
+                    response_time=response_time
+                )
+            
+        except RunCancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error running packed prompt: {str(e)}")
+        
+        return results
+
     def run_batch_prompts(self, prompt: str, inputs: List[str]) -> List[PromptOutput]:
         """Chạy một prompt với nhiều input"""
         outputs = []
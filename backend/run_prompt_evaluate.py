@@ -1,38 +1,139 @@
-from typing import List, Dict
-from models import PromptTestCase, EvaluationResult
+from typing import List, Dict, Optional, Tuple
+from models import PromptTestCase, EvaluationResult, JudgeStats
 from difflib import SequenceMatcher
+from json_compare import parse_json_output, parse_expected_output, compare_json
+from consistency import majority_vote
+from judge import LLMJudge, JudgePair, Verdict, llm_judge
+from circuit_breaker import mark_degraded
 import logging
 
 logger = logging.getLogger(__name__)
 
+TEXT_MODE = "text"
+JSON_MODE = "json"
+JUDGE_MODE = "judge"
+EVALUATION_MODES = (TEXT_MODE, JSON_MODE, JUDGE_MODE)
+
 class PromptEvaluator:
+    def __init__(self, judge: Optional[LLMJudge] = None):
+        self.judge = judge or llm_judge
+
     def calculate_similarity(self, text1: str, text2: str) -> float:
         """Tính độ tương đồng giữa 2 text"""
         if text1 == text2:
             return 1.0
         return SequenceMatcher(None, text1, text2).ratio()
 
-    def evaluate_testcases(self, test_cases: List[PromptTestCase]) -> EvaluationResult:
-        """Đánh giá kết quả test cases"""
+    def compare_json_output(self, expected_output: str, output: str,
+                            required_keys: Optional[List[str]] = None) -> Tuple[float, Optional[Dict[str, float]], Optional[List[str]]]:
+        """So sánh output JSON theo từng field, fallback về text similarity nếu không parse được"""
+        expected_ok, expected = parse_expected_output(expected_output)
+        actual_ok, actual = parse_json_output(output) if expected_ok else (False, None)
+
+        if not (expected_ok and actual_ok):
+            return self.calculate_similarity(output, expected_output), None, None
+
+        similarity, field_scores, missing_keys = compare_json(expected, actual, required_keys)
+        # Thiếu required key thì không thể coi là đúng
+        if missing_keys:
+            similarity = min(similarity, 0.95)
+        return similarity, field_scores, missing_keys
+
+    def evaluate_json(self, test_case: PromptTestCase, required_keys: Optional[List[str]] = None) -> float:
+        """Đánh giá test case ở mode json, lưu score theo field vào test case"""
+        similarity, test_case.field_scores, test_case.missing_keys = self.compare_json_output(
+            test_case.expected_output, test_case.prompt_output, required_keys
+        )
+        return similarity
+
+    def score_output(self, expected_output: str, output: str, mode: str = TEXT_MODE,
+                     required_keys: Optional[List[str]] = None) -> float:
+        """Similarity của một output bất kỳ (dùng cho từng sample ở consistency mode)"""
+        if mode == JSON_MODE:
+            return self.compare_json_output(expected_output, output, required_keys)[0]
+        return self.calculate_similarity(output, expected_output)
+
+    def evaluate_samples(self, test_case: PromptTestCase, mode: str = TEXT_MODE,
+                         required_keys: Optional[List[str]] = None) -> Tuple[float, bool]:
+        """Đánh giá mọi sample của test case: trả về (tỷ lệ sample đúng, output đa số có đúng không)"""
+        majority, test_case.agreement_rate = majority_vote(test_case.samples)
+        correct = [
+            self.score_output(test_case.expected_output, sample, mode, required_keys) > 0.95
+            for sample in test_case.samples
+        ]
+        majority_correct = correct[test_case.samples.index(majority)]
+        return sum(correct) / len(correct), majority_correct
+
+    def judge_testcases(self, test_cases: List[PromptTestCase], criteria: Optional[str],
+                        stats: JudgeStats) -> List[Optional[Verdict]]:
+        """Verdict của judge cho từng test case; output trùng expected hoặc rỗng không cần gửi judge"""
+        verdicts: List[Optional[Verdict]] = [None] * len(test_cases)
+        pending = []
+        for i, test_case in enumerate(test_cases):
+            if test_case.prompt_output == test_case.expected_output:
+                verdicts[i] = Verdict(1.0, True, "Exact match")
+            elif not test_case.prompt_output.strip():
+                verdicts[i] = Verdict(0.0, False, "Empty output")
+            else:
+                pending.append(i)
+        pairs = [
+            JudgePair(test_cases[i].input, test_cases[i].expected_output, test_cases[i].prompt_output)
+            for i in pending
+        ]
+        for i, verdict in zip(pending, self.judge.judge(pairs, criteria, stats)):
+            verdicts[i] = verdict
+        if stats.failed:
+            mark_degraded("judge_fallback")
+        return verdicts
+
+    def evaluate_testcases(self, test_cases: List[PromptTestCase], mode: str = TEXT_MODE,
+                           required_keys: Optional[List[str]] = None,
+                           judge_criteria: Optional[str] = None) -> EvaluationResult:
+        """Đánh giá kết quả test cases
+
+        mode="judge": chấm ngữ nghĩa bằng LLM judge (nhiều cặp mỗi request, verdict được
+        cache); cặp judge không chấm được fallback về text similarity.
+        """
         total_cases = len(test_cases)
         correct_cases = 0
         total_similarity = 0.0
+        # Consistency mode: các test case có nhiều sample
+        sampled_cases = 0
+        majority_correct_cases = 0
+        total_sample_accuracy = 0.0
+        total_agreement = 0.0
+        judge_stats = JudgeStats() if mode == JUDGE_MODE else None
+        verdicts = self.judge_testcases(test_cases, judge_criteria, judge_stats) if judge_stats else None
         
-        for test_case in test_cases:
+        for i, test_case in enumerate(test_cases):
+            verdict = verdicts[i] if verdicts else None
             # Tính similarity
-            similarity = self.calculate_similarity(
-                test_case.prompt_output,
-                test_case.expected_output
-            )
+            if verdict is not None:
+                similarity = verdict.score
+                test_case.judge_reason = verdict.reason
+            elif mode == JSON_MODE:
+                similarity = self.evaluate_json(test_case, required_keys)
+            else:
+                similarity = self.calculate_similarity(
+                    test_case.prompt_output,
+                    test_case.expected_output
+                )
             
             # Cập nhật test case
             test_case.similarity_score = similarity
-            test_case.is_correct = similarity > 0.95
+            test_case.is_correct = verdict.correct if verdict is not None else similarity > 0.95
             
             if test_case.is_correct:
                 correct_cases += 1
             total_similarity += similarity
             
+            if test_case.samples:
+                sample_accuracy, majority_correct = self.evaluate_samples(test_case, mode, required_keys)
+                sampled_cases += 1
+                majority_correct_cases += majority_correct
+                total_sample_accuracy += sample_accuracy
+                total_agreement += test_case.agreement_rate
+            
             logger.info(f"""
                 Evaluation results:
                 Input: {test_case.input}
@@ -43,7 +144,11 @@ class PromptEvaluator:
             """)
         
         return EvaluationResult(
-            accuracy=correct_cases / total_cases,
-            avg_similarity=total_similarity / total_cases,
-            test_cases=test_cases
-        ) 
\ No newline at end of file
+            accuracy=correct_cases / total_cases if total_cases else 0.0,
+            avg_similarity=total_similarity / total_cases if total_cases else 0.0,
+            test_cases=test_cases,
+            majority_vote_accuracy=majority_correct_cases / sampled_cases if sampled_cases else None,
+            sample_accuracy=total_sample_accuracy / sampled_cases if sampled_cases else None,
+            avg_agreement=total_agreement / sampled_cases if sampled_cases else None,
+            judge=judge_stats
+        )
\ No newline at end of file
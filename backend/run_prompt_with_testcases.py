@@ -1,26 +1,131 @@
-from typing import List
-from models import PromptTestCase
-from run_prompt import PromptRunner
+from typing import List, Optional
+from models import PromptTestCase, PackingStats
+from output_budget import OutputBudget
+from run_prompt import PromptRunner, DEFAULT_MAX_TOKENS
+from cancellation import RunCancelledError
+from usage_tracker import BudgetExceededError
+from circuit_breaker import mark_degraded
+import concurrent.futures
+import contextvars
 import logging
+import os
+import threading
+import llm_client
 
 logger = logging.getLogger(__name__)
 
+# Số test case chạy song song trong một run; tổng số call vẫn do scheduler giới hạn
+RUN_CONCURRENCY = int(os.getenv("RUN_CONCURRENCY", "8"))
+# Prompt caching của OpenAI chỉ áp dụng cho prefix >= 1024 token (~4 ký tự / token)
+PREFIX_CACHE_MIN_CHARS = 4096
+
 class PromptTestRunner(PromptRunner):
-    def run_with_testcases(self, prompt: str, test_cases: List[PromptTestCase]) -> List[PromptTestCase]:
-        """Chạy prompt với test cases có sẵn"""
+    def __init__(self, max_workers: int = RUN_CONCURRENCY, model: str = llm_client.DEFAULT_MODEL,
+                 max_tokens: int = DEFAULT_MAX_TOKENS):
+        super().__init__(model=model, max_tokens=max_tokens)
+        self.max_workers = max_workers
+        self._stats_lock = threading.Lock()
+
+    def run_test_case(self, prompt: str, test_case: PromptTestCase, num_samples: int = 1,
+                      temperature: float = 0, output_budget: Optional[OutputBudget] = None,
+                      index: Optional[int] = None) -> PromptTestCase:
+        """Chạy prompt với một test case (index: vị trí trong suite, để lấy cap riêng của case)"""
+        cap = output_budget.cap_for(index) if output_budget else None
+        # Chạy prompt với input của test case
+        if num_samples > 1:
+            output = self.run_multi_sample(prompt, test_case.input, num_samples, temperature,
+                                           budget=output_budget, cap=cap)
+            test_case.samples = output.samples
+        else:
+            output = self.run_single_prompt(prompt, test_case.input, temperature, budget=output_budget, cap=cap)
+        
+        # Cập nhật output vào test case (consistency mode: output đa số)
+        test_case.prompt_output = output.output
+        
+        logger.info(f"""
+            Test case run:
+            Input: {test_case.input}
+            Output: {output.output}
+        """)
+        return test_case
+
+    def run_packed_batch(self, prompt: str, batch: List[PromptTestCase], stats: PackingStats,
+                         output_budget: Optional[OutputBudget] = None, start: int = 0) -> List[PromptTestCase]:
+        """Chạy một nhóm test case trong một request, chạy lại riêng các case không map được"""
+        outputs = self.run_packed_prompts(
+            prompt,
+            [test_case.input for test_case in batch],
+            budget=output_budget,
+            caps=[output_budget.cap_for(start + i) for i in range(len(batch))] if output_budget else None
+        )
+        fallbacks = [(start + i, test_case) for i, (test_case, output) in enumerate(zip(batch, outputs))
+                     if output is None]
+        
+        for test_case, output in zip(batch, outputs):
+            if output is not None:
+                test_case.prompt_output = output.output
+        
+        with self._stats_lock:
+            stats.packed_requests += 1
+            stats.packed_items += len(batch) - len(fallbacks)
+            stats.fallback_items += len(fallbacks)
+        
+        if fallbacks:
+            logger.warning(f"{len(fallbacks)}/{len(batch)} packed answers could not be mapped, re-running individually")
+        for index, test_case in fallbacks:
+            self.run_test_case(prompt, test_case, output_budget=output_budget, index=index)
+        return batch
+
+    def run_with_testcases(self, prompt: str, test_cases: List[PromptTestCase], pack_size: int = 1,
+                           packing_stats: Optional[PackingStats] = None, num_samples: int = 1,
+                           temperature: float = 0,
+                           output_budget: Optional[OutputBudget] = None) -> List[PromptTestCase]:
+        """Chạy prompt với test cases có sẵn.
+
+        pack_size > 1: gộp nhiều input mỗi request (temperature=0).
+        num_samples > 1: consistency mode, lấy num_samples sample mỗi case trong một request.
+        output_budget: cap max_tokens / stop sequence ước lượng từ expected_output (plan_output_budget).
+        """
         logger.info(f"Running prompt with {len(test_cases)} test cases")
         
-        for test_case in test_cases:
-            # Chạy prompt với input của test case
-            output = self.run_single_prompt(prompt, test_case.input)
-            
-            # Cập nhật output vào test case
-            test_case.prompt_output = output
-            
-            logger.info(f"""
-                Test case run:
-                Input: {test_case.input}
-                Output: {output}
-            """)
-            
-        return test_cases 
\ No newline at end of file
+        if pack_size > 1 and num_samples == 1:
+            stats = packing_stats if packing_stats is not None else PackingStats()
+            jobs = [
+                (self.run_packed_batch, (prompt, test_cases[i:i + pack_size], stats, output_budget, i))
+                for i in range(0, len(test_cases), pack_size)
+            ]
+        else:
+            jobs = [
+                (self.run_test_case, (prompt, test_case, num_samples, temperature, output_budget, i))
+                for i, test_case in enumerate(test_cases)
+            ]
+        
+        try:
+            self._run_jobs(prompt, jobs)
+        except BudgetExceededError:
+            # Hết budget: không lên lịch call mới, trả các case đã chạy xong (case còn lại giữ output rỗng)
+            done = sum(1 for test_case in test_cases if test_case.prompt_output)
+            logger.warning(f"Run budget exhausted after {done}/{len(test_cases)} test cases")
+            mark_degraded("budget_exceeded")
+        return test_cases
+
+    def _run_jobs(self, prompt: str, jobs: List) -> None:
+        # Mọi request của run có cùng system message ở đầu. Với prompt đủ dài, chạy request
+        # đầu tiên trước để prefix vào cache, các request song song sau đó dùng lại cache
+        if len(jobs) > 1 and len(prompt) >= PREFIX_CACHE_MIN_CHARS:
+            func, args = jobs.pop(0)
+            func(*args)
+        
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # copy_context để mỗi thread giữ cancellation token, workload và usage của request
+            futures = [
+                executor.submit(contextvars.copy_context().run, func, *args)
+                for func, args in jobs
+            ]
+            try:
+                for future in futures:
+                    future.result()
+            except RunCancelledError:
+                for future in futures:
+                    future.cancel()
+                raise
\ No newline at end of file
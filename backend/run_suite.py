@@ -0,0 +1,286 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+# Chạy prompt trên suite JSONL không cần API server (CI, cron):
+#   python run_suite.py suite.jsonl --prompt-file prompt.txt -o results.jsonl --min-accuracy 0.9
+# Các module nặng (openai, pydantic, starlette) chỉ được import trong run(): --help / lỗi tham số
+# trả ngay, và tham số scheduler (đọc từ env lúc import) được đặt trước khi import.
+
+CHUNK_SIZE = 1 << 20
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Chạy prompt trên suite JSONL, stream kết quả ra JSONL")
+    parser.add_argument("suite", help="File suite JSONL ('-' = stdin); dòng đầu có thể là header {\"prompt\": ...}")
+    parser.add_argument("--prompt-file", help="File chứa prompt (mặc định lấy từ header của suite)")
+    parser.add_argument("-o", "--output", default="-", help="File kết quả JSONL ('-' = stdout)")
+    parser.add_argument("--model", default=None, help="Model chạy prompt (mặc định model của backend)")
+    parser.add_argument("--concurrency", type=int, default=None, help="Số case chạy song song mỗi batch")
+    parser.add_argument("--batch-size", type=int, default=None, help="Số case mỗi batch (SUITE_BATCH_SIZE)")
+    parser.add_argument("--parallel-batches", type=int, default=None,
+                        help="Số batch chạy đồng thời (SUITE_MAX_PARALLEL_BATCHES)")
+    parser.add_argument("--max-concurrency", type=int, default=None,
+                        help="Giới hạn model call đồng thời của cả tiến trình (MODEL_MAX_CONCURRENCY)")
+    parser.add_argument("--rate-limit-rpm", type=float, default=None,
+                        help="Giới hạn model call mỗi phút (MODEL_RATE_LIMIT_RPM)")
+    parser.add_argument("--pack-size", type=int, default=None)
+    parser.add_argument("--num-samples", type=int, default=None)
+    parser.add_argument("--temperature", type=float, default=None)
+    parser.add_argument("--mode", choices=["text", "json", "judge"], default=None, help="Cách chấm kết quả")
+    parser.add_argument("--no-evaluate", action="store_true", help="Chỉ chạy prompt, không chấm")
+    parser.add_argument("--cache", default=None,
+                        help="File cache output (temperature=0, một sample) dùng lại giữa các lần chạy")
+    parser.add_argument("--store", action="store_true", help="Lưu kết quả vào result store (in ra run_id)")
+    parser.add_argument("--min-accuracy", type=float, default=None,
+                        help="Exit code 1 nếu accuracy thấp hơn ngưỡng (CI gate)")
+    return parser.parse_args(argv)
+
+
+def _apply_scheduler_env(args: argparse.Namespace) -> None:
+    # Một process: giới hạn của scheduler không chia theo số worker của server
+    os.environ["WEB_CONCURRENCY"] = "1"
+    if args.max_concurrency is not None:
+        os.environ["MODEL_MAX_CONCURRENCY"] = str(args.max_concurrency)
+        # Tiến trình chỉ chạy một suite: không cần giữ slot cho interactive
+        os.environ["INTERACTIVE_RESERVED_SLOTS"] = "0"
+    if args.rate_limit_rpm is not None:
+        os.environ["MODEL_RATE_LIMIT_RPM"] = str(args.rate_limit_rpm)
+
+
+class OutputCacheFile:
+    """Cache output deterministic giữa các lần chạy: file JSONL {"key", "output"}, key là
+    sha256 của (model, max_tokens, pack_size, prompt, input); output mới được append ngay khi có"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.hits = 0
+        self._lock = threading.Lock()
+        self._items: Dict[str, str] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._items[entry["key"]] = entry["output"]
+        self._file = open(path, "a", encoding="utf-8")
+
+    @staticmethod
+    def key(model: str, max_tokens: int, pack_size: int, prompt: str, input_text: str) -> str:
+        # Output chạy gộp (pack_size > 1) sinh ra dưới instruction khác, không dùng chung key
+        payload = json.dumps([model, max_tokens, pack_size, prompt, input_text], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            output = self._items.get(key)
+            if output is not None:
+                self.hits += 1
+            return output
+
+    def put(self, key: str, output: str) -> None:
+        # Output rỗng là call lỗi, không cache
+        if not output:
+            return
+        with self._lock:
+            if key in self._items:
+                return
+            self._items[key] = output
+            self._file.write(json.dumps({"key": key, "output": output}, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def _percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))]
+
+
+async def _read_chunks(path: str):
+    f = sys.stdin.buffer if path == "-" else open(path, "rb")
+    try:
+        while True:
+            chunk = await asyncio.to_thread(f.read, CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        if f is not sys.stdin.buffer:
+            f.close()
+
+
+async def _run(args: argparse.Namespace) -> int:
+    from models import PackingStats, PromptTestCase
+    from cancellation import CancellationToken
+    from run_prompt_with_testcases import PromptTestRunner, RUN_CONCURRENCY
+    from run_prompt_evaluate import PromptEvaluator
+    from usage_tracker import track_usage
+    from circuit_breaker import degradation_scope
+    import llm_client
+    import suite_stream
+
+    class TimedRunner(PromptTestRunner):
+        """PromptTestRunner ghi latency của từng request (một case, hoặc một nhóm khi pack_size > 1)"""
+
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            self.latencies: List[float] = []
+
+        def _record(self, start: float) -> None:
+            with self._stats_lock:
+                self.latencies.append(time.perf_counter() - start)
+
+        def run_test_case(self, *func_args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return super().run_test_case(*func_args, **kwargs)
+            finally:
+                self._record(start)
+
+        def run_packed_batch(self, *func_args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return super().run_packed_batch(*func_args, **kwargs)
+            finally:
+                self._record(start)
+
+    options, cases = await suite_stream.read_suite(_read_chunks(args.suite), suite_stream.JSONL_FORMAT)
+    if args.prompt_file:
+        with open(args.prompt_file, encoding="utf-8") as f:
+            prompt = f.read()
+    else:
+        prompt = options.get("prompt")
+    if not prompt:
+        print("Missing prompt (--prompt-file or JSONL header line)", file=sys.stderr)
+        return 2
+
+    def option(value, name, default):
+        return value if value is not None else options.get(name, default)
+
+    pack_size = option(args.pack_size, "pack_size", 1)
+    num_samples = option(args.num_samples, "num_samples", 1)
+    temperature = option(args.temperature, "temperature", 0.0)
+    mode = option(args.mode, "mode", "text")
+    required_keys = options.get("required_keys")
+    judge_criteria = options.get("judge_criteria")
+
+    runner = TimedRunner(max_workers=args.concurrency or RUN_CONCURRENCY,
+                         model=args.model or llm_client.DEFAULT_MODEL)
+    evaluator = None if args.no_evaluate else PromptEvaluator()
+    cache = OutputCacheFile(args.cache) if args.cache and temperature == 0 and num_samples == 1 else None
+
+    def run_batch(batch: List[PromptTestCase]) -> List[PromptTestCase]:
+        pending = batch
+        if cache is not None:
+            keys = {id(case): cache.key(runner.model, runner.max_tokens, pack_size, prompt, case.input)
+                    for case in batch}
+            pending = []
+            for case in batch:
+                output = cache.get(keys[id(case)])
+                if output is None:
+                    pending.append(case)
+                else:
+                    case.prompt_output = output
+        if pending:
+            with degradation_scope() as degraded:
+                runner.run_with_testcases(
+                    prompt,
+                    pending,
+                    pack_size=pack_size,
+                    packing_stats=PackingStats() if pack_size > 1 else None,
+                    num_samples=num_samples,
+                    temperature=temperature
+                )
+            # Batch có call degraded (model dự phòng, breaker mở, hết budget): output không phải
+            # của runner.model, không cache dưới key của nó
+            if cache is not None and not degraded:
+                for case in pending:
+                    cache.put(keys[id(case)], case.prompt_output)
+        if evaluator is None:
+            return batch
+        return evaluator.evaluate_testcases(batch, mode=mode, required_keys=required_keys,
+                                           judge_criteria=judge_criteria).test_cases
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    total = correct = 0
+    run_id = None
+    start = time.perf_counter()
+    try:
+        with track_usage(label="cli") as usage:
+            batches = suite_stream.process_in_batches(cases, run_batch, CancellationToken(),
+                                                      batch_size=args.batch_size,
+                                                      max_parallel=args.parallel_batches)
+            if args.store:
+                from result_store import result_store
+                run_id, writer = result_store.create_run("cli-run", prompt=prompt, mode=mode)
+                batches = suite_stream.persist(batches, writer)
+            async for batch in batches:
+                out.write(suite_stream.encode_jsonl(batch).decode("utf-8"))
+                out.flush()
+                total += len(batch)
+                correct += sum(1 for case in batch if case.is_correct)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if cache is not None:
+            cache.close()
+    elapsed = time.perf_counter() - start
+
+    accuracy = correct / total if total else 0.0
+    stats = usage.summary()
+    latencies = runner.latencies
+    summary = {
+        "cases": total,
+        "accuracy": None if evaluator is None else round(accuracy, 4),
+        "elapsed": round(elapsed, 3),
+        "throughput": round(total / elapsed, 2) if elapsed else 0.0,  # case / giây
+        "requests": stats["requests"],
+        "cache_hits": cache.hits if cache is not None else 0,
+        "latency_p50": round(_percentile(latencies, 50), 3),
+        "latency_p95": round(_percentile(latencies, 95), 3),
+        "latency_p99": round(_percentile(latencies, 99), 3),
+        "prompt_tokens": stats["prompt_tokens"],
+        "completion_tokens": stats["completion_tokens"],
+        "cost": stats["cost"],
+        "run_id": run_id
+    }
+    # Summary ra stderr để stdout chỉ chứa kết quả JSONL
+    print(json.dumps(summary, ensure_ascii=False), file=sys.stderr)
+
+    if evaluator is not None and args.min_accuracy is not None and accuracy < args.min_accuracy:
+        print(f"Accuracy {accuracy:.4f} is below --min-accuracy {args.min_accuracy}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def run(args: argparse.Namespace) -> int:
+    _apply_scheduler_env(args)
+    from dotenv import load_dotenv
+    load_dotenv()
+    import logging
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+    try:
+        return asyncio.run(_run(args))
+    except KeyboardInterrupt:
+        print("Interrupted", file=sys.stderr)
+        return 130
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    return run(parse_args(argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
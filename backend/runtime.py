@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+import psutil
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "110"))
+
+
+class ServerStats:
+    """Theo dõi cold start, request đầu tiên và số request đang chạy của worker"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.process_start = psutil.Process(os.getpid()).create_time()
+        self.ready_at: Optional[float] = None
+        self.warmup_time: Optional[float] = None
+        self.first_request_latency: Optional[float] = None
+        self.in_flight = 0
+        self.total_requests = 0
+
+    def mark_ready(self) -> float:
+        """Ghi lại thời điểm worker sẵn sàng nhận request, trả về cold start (giây)"""
+        self.ready_at = time.time()
+        # Sau fork, create_time là của worker nên cold start chỉ tính phần của worker
+        self.process_start = psutil.Process(os.getpid()).create_time()
+        cold_start = self.ready_at - self.process_start
+        logger.info(f"Worker {os.getpid()} ready, cold start {cold_start:.3f}s")
+        return cold_start
+
+    def request_started(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+
+    def request_finished(self, latency: float) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.total_requests += 1
+            if self.first_request_latency is None:
+                self.first_request_latency = latency
+                logger.info(f"Worker {os.getpid()} first request latency {latency:.3f}s")
+
+    async def drain(self, timeout: float = SHUTDOWN_DRAIN_TIMEOUT) -> bool:
+        """Chờ các request đang chạy hoàn tất trước khi tắt worker"""
+        deadline = time.time() + timeout
+        if self.in_flight:
+            logger.info(f"Draining {self.in_flight} in-flight request(s)")
+        while self.in_flight and time.time() < deadline:
+            await asyncio.sleep(0.1)
+        if self.in_flight:
+            logger.warning(f"Shutdown with {self.in_flight} request(s) still running")
+            return False
+        return True
+
+    def snapshot(self) -> Dict:
+        return {
+            "pid": os.getpid(),
+            "cold_start": (self.ready_at - self.process_start) if self.ready_at else None,
+            "warmup_time": self.warmup_time,
+            "first_request_latency": self.first_request_latency,
+            "in_flight": self.in_flight,
+            "total_requests": self.total_requests,
+            "uptime": (time.time() - self.ready_at) if self.ready_at else 0.0
+        }
+
+
+server_stats = ServerStats()
+
+
+class InFlightMiddleware:
+    """ASGI middleware đếm request đang chạy (dùng cho graceful drain)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.time()
+        server_stats.request_started()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            server_stats.request_finished(time.time() - start_time)
@@ -0,0 +1,316 @@
+import contextvars
+import hashlib
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, NamedTuple, Optional
+from cancellation import RunCancelledError, current_token
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+PRIORITY_CLASSES = (INTERACTIVE, BULK)
+
+# Ba giới hạn dưới đây là của cả deployment. Scheduler nằm trong từng process (không chia sẻ
+# state giữa các gunicorn worker), nên mỗi worker nhận phần chia đều theo WEB_CONCURRENCY
+# (gunicorn.conf.py đặt biến này theo số worker thật)
+WORKER_COUNT = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+MODEL_MAX_CONCURRENCY = int(os.getenv("MODEL_MAX_CONCURRENCY", "16"))
+# Số slot chỉ dành cho interactive: bulk không bao giờ chiếm hết backend
+INTERACTIVE_RESERVED_SLOTS = int(os.getenv("INTERACTIVE_RESERVED_SLOTS", "4"))
+# Giới hạn số model call mỗi phút (0 = không giới hạn)
+MODEL_RATE_LIMIT_RPM = float(os.getenv("MODEL_RATE_LIMIT_RPM", "0"))
+WAIT_SAMPLE_WINDOW = 1000
+
+# Endpoint chạy cả suite là bulk, các endpoint còn lại (Step 1, feedback...) là interactive
+BULK_PATHS = {
+    "/api/run-prompt",
+    "/api/generate-prompt",
+    "/api/suites/run",
+    "/api/suites/evaluate",
+    "/api/evaluate-results",
+    "/api/sweep",
+}
+TENANT_WEIGHTS = {
+    # "<tenant>": weight, cấu hình qua TENANT_WEIGHTS="team-a=2,team-b=1"
+    name.strip(): float(weight)
+    for name, weight in (
+        item.split("=", 1) for item in os.getenv("TENANT_WEIGHTS", "").split(",") if "=" in item
+    )
+}
+
+
+class Workload(NamedTuple):
+    priority: str = INTERACTIVE
+    tenant: str = "anonymous"
+    weight: float = 1.0
+
+
+_current_workload: contextvars.ContextVar[Workload] = contextvars.ContextVar(
+    "workload", default=Workload()
+)
+
+
+def current_workload() -> Workload:
+    return _current_workload.get()
+
+
+@contextmanager
+def use_workload(priority: str, tenant: str, weight: float = 1.0):
+    reset = _current_workload.set(Workload(priority, tenant, weight))
+    try:
+        yield
+    finally:
+        _current_workload.reset(reset)
+
+
+class _Ticket:
+    __slots__ = ("seq", "workload", "enqueued_at", "granted")
+
+    def __init__(self, seq: int, workload: Workload):
+        self.seq = seq
+        self.workload = workload
+        self.enqueued_at = time.time()
+        self.granted = False
+
+
+class _ClassQueue:
+    """Hàng đợi của một priority class: weighted fair queuing giữa các tenant"""
+
+    def __init__(self):
+        self.tenants: Dict[str, Deque[_Ticket]] = {}
+        self.virtual_time: Dict[str, float] = {}
+        self.in_flight = 0
+        self.dispatched = 0
+        self.waits: Deque[float] = deque(maxlen=WAIT_SAMPLE_WINDOW)
+
+    @property
+    def depth(self) -> int:
+        return sum(len(q) for q in self.tenants.values())
+
+    def push(self, ticket: _Ticket) -> None:
+        tenant = ticket.workload.tenant
+        if tenant not in self.tenants:
+            # Tenant mới bắt đầu từ virtual time nhỏ nhất của các tenant đang chờ, không được
+            # "để dành" lượt; tenant idle đã tụt sau mốc đó không cần giữ virtual time nữa
+            floor = min((self.virtual_time[t] for t in self.tenants), default=0.0)
+            for idle in [t for t, vt in self.virtual_time.items() if t not in self.tenants and vt <= floor]:
+                del self.virtual_time[idle]
+            self.virtual_time[tenant] = max(self.virtual_time.get(tenant, 0.0), floor)
+            self.tenants[tenant] = deque()
+        self.tenants[tenant].append(ticket)
+
+    def remove(self, ticket: _Ticket) -> None:
+        queue = self.tenants.get(ticket.workload.tenant)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del self.tenants[ticket.workload.tenant]
+                if not self.tenants:
+                    # Không còn ai chờ: không có gì để chia, bỏ virtual time của mọi tenant
+                    self.virtual_time.clear()
+
+    def peek(self) -> Optional[_Ticket]:
+        if not self.tenants:
+            return None
+        tenant = min(self.tenants, key=lambda t: (self.virtual_time[t], self.tenants[t][0].seq))
+        return self.tenants[tenant][0]
+
+    def pop(self) -> _Ticket:
+        ticket = self.peek()
+        tenant = ticket.workload.tenant
+        self.virtual_time[tenant] += 1.0 / max(ticket.workload.weight, 0.01)
+        self.remove(ticket)
+        return ticket
+
+
+class ModelScheduler:
+    """Scheduler trung tâm cho mọi model call.
+
+    Interactive luôn được ưu tiên và có slot dự trữ; bulk dùng phần còn lại.
+    Trong cùng một class, các tenant (user / API key) chia slot theo weight.
+    rate_limit_rpm > 0 thêm token bucket: slot chỉ được cấp khi còn quota.
+    Giới hạn là của một process; workers > 1 chia đều giới hạn của cả deployment.
+    """
+
+    def __init__(self, max_concurrency: int = MODEL_MAX_CONCURRENCY,
+                 interactive_reserved: int = INTERACTIVE_RESERVED_SLOTS,
+                 rate_limit_rpm: float = MODEL_RATE_LIMIT_RPM, workers: int = 1):
+        self.workers = workers
+        max_concurrency = max(1, max_concurrency // workers)
+        interactive_reserved = math.ceil(interactive_reserved / workers)
+        rate_limit_rpm = rate_limit_rpm / workers
+        self.max_concurrency = max_concurrency
+        self.bulk_limit = max(1, max_concurrency - interactive_reserved)
+        self.rate_limit_rpm = rate_limit_rpm
+        # Cho phép burst tối đa một giây quota (ít nhất một call)
+        self._rate_capacity = max(1.0, rate_limit_rpm / 60)
+        self._rate_tokens = self._rate_capacity
+        self._rate_updated = time.monotonic()
+        self.rate_limited = 0
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._queues = {name: _ClassQueue() for name in PRIORITY_CLASSES}
+
+    @property
+    def _in_flight(self) -> int:
+        return sum(q.in_flight for q in self._queues.values())
+
+    def _has_rate_quota(self) -> bool:
+        if self.rate_limit_rpm <= 0:
+            return True
+        now = time.monotonic()
+        self._rate_tokens = min(
+            self._rate_capacity,
+            self._rate_tokens + (now - self._rate_updated) * self.rate_limit_rpm / 60
+        )
+        self._rate_updated = now
+        return self._rate_tokens >= 1
+
+    def _take_rate_quota(self) -> None:
+        if self.rate_limit_rpm > 0:
+            self._rate_tokens -= 1
+
+    def _next_ticket(self) -> Optional[_Ticket]:
+        if self._in_flight >= self.max_concurrency:
+            return None
+        if not self._has_rate_quota():
+            if self._queues[INTERACTIVE].depth or self._queues[BULK].depth:
+                self.rate_limited += 1
+            return None
+        interactive = self._queues[INTERACTIVE].peek()
+        if interactive is not None:
+            return interactive
+        if self._queues[BULK].in_flight < self.bulk_limit:
+            return self._queues[BULK].peek()
+        return None
+
+    def _dispatch(self) -> None:
+        while True:
+            ticket = self._next_ticket()
+            if ticket is None:
+                return
+            queue = self._queues[ticket.workload.priority]
+            queue.pop()
+            self._take_rate_quota()
+            queue.in_flight += 1
+            queue.dispatched += 1
+            queue.waits.append(time.time() - ticket.enqueued_at)
+            ticket.granted = True
+            self._cond.notify_all()
+
+    def acquire(self, workload: Optional[Workload] = None) -> Workload:
+        """Chờ tới lượt; raise RunCancelledError nếu run bị huỷ khi đang xếp hàng"""
+        workload = workload or current_workload()
+        if workload.priority not in self._queues:
+            workload = workload._replace(priority=BULK)
+        token = current_token()
+
+        with self._cond:
+            ticket = _Ticket(next(self._seq), workload)
+            self._queues[workload.priority].push(ticket)
+            self._dispatch()
+            while not ticket.granted:
+                self._cond.wait(timeout=0.1)
+                # Quota rate limit hồi lại theo thời gian, không có release nào báo hiệu
+                self._dispatch()
+                if token is not None and token.cancelled and not ticket.granted:
+                    self._queues[workload.priority].remove(ticket)
+                    raise RunCancelledError(token.reason)
+        return workload
+
+    def try_acquire(self, workload: Optional[Workload] = None) -> Optional[Workload]:
+        """Lấy slot nếu còn trống ngay lúc này, không xếp hàng (dùng cho hedge request)"""
+        workload = workload or current_workload()
+        if workload.priority not in self._queues:
+            workload = workload._replace(priority=BULK)
+
+        with self._cond:
+            queue = self._queues[workload.priority]
+            if queue.depth or self._in_flight >= self.max_concurrency:
+                return None
+            if workload.priority == BULK and queue.in_flight >= self.bulk_limit:
+                return None
+            if not self._has_rate_quota():
+                return None
+            self._take_rate_quota()
+            queue.in_flight += 1
+            queue.dispatched += 1
+            queue.waits.append(0.0)
+        return workload
+
+    def release(self, workload: Workload) -> None:
+        with self._cond:
+            self._queues[workload.priority].in_flight -= 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, workload: Optional[Workload] = None):
+        workload = self.acquire(workload)
+        try:
+            yield workload
+        finally:
+            self.release(workload)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            result = {
+                "workers": self.workers,
+                "max_concurrency": self.max_concurrency,
+                "bulk_limit": self.bulk_limit,
+                "rate_limit_rpm": self.rate_limit_rpm,
+                "rate_limited": self.rate_limited,
+                "classes": {}
+            }
+            for name, queue in self._queues.items():
+                waits = sorted(queue.waits)
+                result["classes"][name] = {
+                    "queue_depth": queue.depth,
+                    "in_flight": queue.in_flight,
+                    "dispatched": queue.dispatched,
+                    "waiting_tenants": len(queue.tenants),
+                    "avg_wait": sum(waits) / len(waits) if waits else 0.0,
+                    "p95_wait": waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+                    "max_wait": waits[-1] if waits else 0.0
+                }
+            return result
+
+
+scheduler = ModelScheduler(workers=WORKER_COUNT)
+
+
+def _tenant_from_scope(scope) -> str:
+    headers = dict(scope.get("headers") or [])
+    api_key = headers.get(b"x-api-key")
+    if api_key:
+        # Không giữ API key dạng rõ trong bộ nhớ scheduler
+        return "key:" + hashlib.sha256(api_key).hexdigest()[:12]
+    user_id = headers.get(b"x-user-id")
+    if user_id:
+        return "user:" + user_id.decode("latin-1")
+    client = scope.get("client")
+    return f"ip:{client[0]}" if client else "anonymous"
+
+
+class WorkloadMiddleware:
+    """ASGI middleware gán priority class và tenant cho mọi model call của request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        priority = BULK if scope["path"] in BULK_PATHS else INTERACTIVE
+        tenant = _tenant_from_scope(scope)
+        with use_workload(priority, tenant, TENANT_WEIGHTS.get(tenant, 1.0)):
+            await self.app(scope, receive, send)
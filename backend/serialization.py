@@ -0,0 +1,38 @@
+import json
+from typing import Any
+from pydantic import BaseModel
+from starlette.responses import Response
+
+try:
+    import orjson
+
+    def _dumps(content: Any) -> bytes:
+        return orjson.dumps(content)
+except ImportError:  # orjson là tuỳ chọn, fallback về json chuẩn
+    def _dumps(content: Any) -> bytes:
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dumps(content: Any) -> bytes:
+    """JSON (UTF-8) của response.
+
+    Model pydantic được serialize thẳng bằng serializer (Rust) của chính nó, không đi
+    qua jsonable_encoder + validate lại theo response_model như đường mặc định của FastAPI.
+    """
+    if isinstance(content, BaseModel):
+        return type(content).__pydantic_serializer__.to_json(content)
+    return _dumps(content)
+
+
+class FastJSONResponse(Response):
+    """Response JSON cho payload lớn (suite nhiều case).
+
+    Endpoint trả thẳng FastJSONResponse(model) thì FastAPI bỏ qua bước serialize theo
+    response_model (model đã được validate khi tạo); response_model vẫn được giữ để
+    sinh OpenAPI schema.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
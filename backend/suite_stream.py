@@ -0,0 +1,257 @@
+import asyncio
+import codecs
+import csv
+import io
+import json
+import logging
+import os
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from pydantic import ValidationError
+from starlette.responses import StreamingResponse
+from models import PromptTestCase
+from cancellation import CancellationToken, run_with_token, DISCONNECT_POLL_INTERVAL
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+JSONL_FORMAT = "jsonl"
+CSV_FORMAT = "csv"
+# Số case mỗi batch gửi vào runner/evaluator
+SUITE_BATCH_SIZE = int(os.getenv("SUITE_BATCH_SIZE", "64"))
+# Số batch chạy đồng thời; upload bị dừng đọc (backpressure) khi đủ số batch này
+SUITE_MAX_PARALLEL_BATCHES = int(os.getenv("SUITE_MAX_PARALLEL_BATCHES", "4"))
+
+CSV_COLUMNS = list(PromptTestCase.model_fields)
+_JSON_COLUMNS = {"field_scores", "missing_keys", "samples"}
+
+
+def detect_format(content_type: Optional[str], requested: Optional[str] = None) -> str:
+    if requested:
+        if requested not in (JSONL_FORMAT, CSV_FORMAT):
+            raise ValueError(f"Unsupported suite format: {requested}")
+        return requested
+    return CSV_FORMAT if content_type and "csv" in content_type else JSONL_FORMAT
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Tách stream bytes thành từng dòng, không giữ nhiều hơn một dòng trong bộ nhớ"""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+
+async def _jsonl_records(lines: AsyncIterator[str]) -> AsyncIterator[Dict[str, Any]]:
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"Invalid JSON on line {line_number}: {str(e)}")
+
+
+async def _csv_records(lines: AsyncIterator[str]) -> AsyncIterator[Dict[str, Any]]:
+    header = None
+    pending = ""
+    async for line in lines:
+        pending = f"{pending}\n{line}" if pending else line
+        # Field có xuống dòng trong dấu nháy: gom tiếp cho tới khi nháy đóng
+        if pending.count('"') % 2 or not pending:
+            continue
+        row = next(csv.reader([pending]))
+        pending = ""
+        if header is None:
+            header = row
+            continue
+        record = {}
+        for column, value in zip(header, row):
+            if value == "" and column not in ("input", "expected_output", "prompt_output"):
+                continue
+            record[column] = json.loads(value) if column in _JSON_COLUMNS else value
+        yield record
+
+
+async def read_suite(chunks: AsyncIterator[bytes],
+                     fmt: str) -> Tuple[Dict[str, Any], AsyncIterator[PromptTestCase]]:
+    """Parse suite JSONL/CSV dạng stream.
+
+    Với JSONL, dòng đầu tiên có thể là header chứa tuỳ chọn của run
+    (ví dụ {"prompt": "..."}), nhận biết bằng việc không có field "input".
+    Trả về (options, async iterator các PromptTestCase).
+    """
+    lines = iter_lines(chunks)
+    records = _csv_records(lines) if fmt == CSV_FORMAT else _jsonl_records(lines)
+    options: Dict[str, Any] = {}
+    first = None
+    async for record in records:
+        if fmt == JSONL_FORMAT and "input" not in record:
+            options = record
+        else:
+            first = record
+        break
+
+    def validate(record: Dict[str, Any], number: int) -> PromptTestCase:
+        try:
+            return PromptTestCase.model_validate(record)
+        except ValidationError as e:
+            raise ValueError(f"Invalid test case #{number}: {str(e)}")
+
+    async def cases() -> AsyncIterator[PromptTestCase]:
+        number = 0
+        if first is not None:
+            number += 1
+            yield validate(first, number)
+        async for record in records:
+            number += 1
+            yield validate(record, number)
+
+    return options, cases()
+
+
+async def process_in_batches(cases: AsyncIterator[PromptTestCase],
+                             process: Callable[[List[PromptTestCase]], List[PromptTestCase]],
+                             token: CancellationToken,
+                             batch_size: Optional[int] = None,
+                             max_parallel: Optional[int] = None,
+                             is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None
+                             ) -> AsyncIterator[List[PromptTestCase]]:
+    """Chạy process trên từng batch ngay khi đọc đủ batch (trong lúc upload còn tiếp diễn).
+
+    Tối đa max_parallel batch chạy cùng lúc; kết quả trả ra theo đúng thứ tự input.
+    Record lỗi (ValueError) dừng việc đọc: các case trước đó vẫn được chạy và trả ra, sau đó
+    lỗi được raise lại. is_disconnected (request.is_disconnected) được poll sau khi upload
+    xong, như run_until_disconnected: client ngắt kết nối thì token bị huỷ.
+    """
+    batch_size = batch_size or SUITE_BATCH_SIZE
+    max_parallel = max_parallel or SUITE_MAX_PARALLEL_BATCHES
+    in_flight: List[asyncio.Future] = []
+    batch: List[PromptTestCase] = []
+    error: Optional[ValueError] = None
+    watcher: Optional[asyncio.Future] = None
+
+    def launch(items: List[PromptTestCase]) -> None:
+        in_flight.append(asyncio.ensure_future(run_with_token(token, process, items)))
+
+    async def watch_disconnect() -> None:
+        while not token.cancelled:
+            if await is_disconnected():
+                logger.info("Client disconnected from suite stream, cancelling run")
+                token.cancel("client disconnected")
+                return
+            await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+    try:
+        while True:
+            try:
+                case = await cases.__anext__()
+            except StopAsyncIteration:
+                break
+            except ValueError as e:
+                error = e
+                break
+            batch.append(case)
+            if len(batch) >= batch_size:
+                launch(batch)
+                batch = []
+            while len(in_flight) >= max_parallel or (in_flight and in_flight[0].done()):
+                yield await in_flight.pop(0)
+        if batch:
+            launch(batch)
+        # Upload đã đọc hết: receive() không còn nuốt chunk body, poll disconnect được
+        if is_disconnected is not None:
+            watcher = asyncio.ensure_future(watch_disconnect())
+        while in_flight:
+            yield await in_flight.pop(0)
+        if error is not None:
+            raise error
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+        if in_flight:
+            # Client ngắt kết nối hoặc upload lỗi: dừng các model call còn lại
+            token.cancel("suite stream closed")
+            await asyncio.gather(*in_flight, return_exceptions=True)
+
+
+async def persist(batches: AsyncIterator[List[PromptTestCase]], writer) -> AsyncIterator[List[PromptTestCase]]:
+    """Ghi từng batch vào result store (theo thứ tự input) trước khi stream về client"""
+    try:
+        async for batch in batches:
+            writer.append(batch)
+            yield batch
+    finally:
+        writer.close()
+
+
+def encode_jsonl(test_cases: List[PromptTestCase]) -> bytes:
+    return "".join(case.model_dump_json() + "\n" for case in test_cases).encode("utf-8")
+
+
+def csv_header() -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(CSV_COLUMNS)
+    return buffer.getvalue().encode("utf-8")
+
+
+def encode_csv(test_cases: List[PromptTestCase]) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for case in test_cases:
+        row = case.model_dump()
+        writer.writerow([
+            json.dumps(row[column], ensure_ascii=False)
+            if column in _JSON_COLUMNS and row[column] is not None
+            else ("" if row[column] is None else row[column])
+            for column in CSV_COLUMNS
+        ])
+    return buffer.getvalue().encode("utf-8")
+
+
+def encode_error(message: str, fmt: str) -> bytes:
+    """Dòng báo lỗi cuối stream: JSONL {"error": ...}, CSV một dòng chỉ có cột error"""
+    if fmt != CSV_FORMAT:
+        return (json.dumps({"error": message}, ensure_ascii=False) + "\n").encode("utf-8")
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow([message if column == "error" else "" for column in CSV_COLUMNS])
+    return buffer.getvalue().encode("utf-8")
+
+
+async def encode_results(batches: AsyncIterator[List[PromptTestCase]], fmt: str) -> AsyncIterator[bytes]:
+    if fmt == CSV_FORMAT:
+        yield csv_header()
+    try:
+        async for batch in batches:
+            yield encode_csv(batch) if fmt == CSV_FORMAT else encode_jsonl(batch)
+    except ValueError as e:
+        # Response đã bắt đầu (status 200): báo record lỗi bằng một dòng cuối thay vì cắt stream
+        logger.warning(f"Suite stream stopped at invalid record: {str(e)}")
+        yield encode_error(str(e), fmt)
+
+
+def media_type(fmt: str) -> str:
+    return "text/csv" if fmt == CSV_FORMAT else "application/x-ndjson"
+
+
+class UploadStreamingResponse(StreamingResponse):
+    """StreamingResponse đọc được request body trong lúc đang gửi response.
+
+    StreamingResponse mặc định chạy listen_for_disconnect song song, task này gọi
+    receive() và sẽ nuốt mất các chunk body của upload đang stream. Ở đây body
+    chỉ được đọc bởi generator; client ngắt kết nối được phát hiện qua upload
+    (ClientDisconnect), sau khi upload xong thì qua request.is_disconnected; token của
+    run bị huỷ trong process_in_batches.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
@@ -0,0 +1,218 @@
+import concurrent.futures
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+from models import (
+    PromptOutput,
+    SweepConfig,
+    SweepConfigResult,
+    SweepRequest,
+    SweepResponse
+)
+from run_prompt import PromptRunner
+from cancellation import RunCancelledError
+from usage_tracker import RunUsage, track_usage
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Số output deterministic (temperature=0) giữ lại giữa các sweep
+SWEEP_CACHE_SIZE = int(os.getenv("SWEEP_CACHE_SIZE", "50000"))
+
+
+class CachedOutput(NamedTuple):
+    """Output kèm usage của call đã tạo ra nó, để config dùng lại cache vẫn báo đúng cost"""
+    output: PromptOutput
+    prompt_tokens: int
+    completion_tokens: int
+    cost: float
+
+
+class OutputCache:
+    """LRU cache output của call temperature=0, key (model, max_tokens, prompt, input)"""
+
+    def __init__(self, max_size: int = SWEEP_CACHE_SIZE):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[Tuple, CachedOutput]" = OrderedDict()
+
+    @staticmethod
+    def key(config: SweepConfig, prompt: str, input_text: str) -> Optional[Tuple]:
+        if config.temperature != 0:
+            return None
+        return config.model, config.max_tokens, prompt, input_text
+
+    def get(self, key: Optional[Tuple]) -> Optional[CachedOutput]:
+        if key is None:
+            return None
+        with self._lock:
+            output = self._items.get(key)
+            if output is not None:
+                self._items.move_to_end(key)
+            return output
+
+    def put(self, key: Optional[Tuple], output: CachedOutput) -> None:
+        # Output rỗng là call lỗi, không cache
+        if key is None or not output.output.output:
+            return
+        with self._lock:
+            self._items[key] = output
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+
+output_cache = OutputCache()
+
+
+def expand_grid(request: SweepRequest) -> List[SweepConfig]:
+    """Mọi tổ hợp models × temperatures × max_tokens cộng configs, bỏ trùng, giữ thứ tự"""
+    configs = [
+        SweepConfig(model=model, temperature=temperature, max_tokens=max_tokens)
+        for model in request.models
+        for temperature in request.temperatures
+        for max_tokens in request.max_tokens
+    ] + list(request.configs or [])
+    unique: Dict[Tuple, SweepConfig] = {}
+    for config in configs:
+        unique.setdefault((config.model, config.temperature, config.max_tokens), config)
+    return list(unique.values())
+
+
+def _percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def pareto_front(results: List[SweepConfigResult]) -> List[int]:
+    """Index các config không bị config nào khác trội hơn (accuracy cao hơn, cost và p50 thấp hơn)"""
+    front = []
+    for i, candidate in enumerate(results):
+        dominated = any(
+            other.accuracy >= candidate.accuracy
+            and other.cost <= candidate.cost
+            and other.latency_p50 <= candidate.latency_p50
+            and (other.accuracy, -other.cost, -other.latency_p50)
+            != (candidate.accuracy, -candidate.cost, -candidate.latency_p50)
+            for j, other in enumerate(results) if j != i
+        )
+        if not dominated:
+            front.append(i)
+    return front
+
+
+class PromptSweep:
+    """Chạy một suite trên nhiều config (model / temperature / max_tokens) cùng lúc.
+
+    Mọi call của sweep dùng chung một executor (max_concurrency) và đi qua scheduler
+    toàn cục (concurrency + rate limit của worker). Input trùng nhau chỉ chạy một lần
+    mỗi config; output temperature=0 được cache và dùng lại giữa các sweep.
+    """
+
+    def __init__(self, evaluator, cache: OutputCache = output_cache, max_concurrency: int = 16,
+                 store: Optional[Callable[..., str]] = None):
+        self.evaluator = evaluator
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        # store(kind, test_cases, **meta) -> run_id, ví dụ result_store.save
+        self.store = store
+
+    def _run_input(self, runner: PromptRunner, config: SweepConfig, usage: RunUsage,
+                   prompt: str, input_text: str) -> CachedOutput:
+        call_usage = RunUsage()
+        with track_usage(call_usage):
+            output = runner.run_single_prompt(prompt, input_text, config.temperature)
+        usage.merge(call_usage)
+        result = CachedOutput(output, call_usage.prompt_tokens, call_usage.completion_tokens, call_usage.cost)
+        self.cache.put(OutputCache.key(config, prompt, input_text), result)
+        return result
+
+    def run(self, request: SweepRequest) -> SweepResponse:
+        start_time = time.time()
+        configs = expand_grid(request)
+        inputs = list(dict.fromkeys(test_case.input for test_case in request.test_cases))
+        usages = [RunUsage() for _ in configs]
+        runners = [PromptRunner(model=config.model, max_tokens=config.max_tokens) for config in configs]
+        outputs: List[Dict[str, CachedOutput]] = [{} for _ in configs]
+        cached: List[List[str]] = [[] for _ in configs]  # Input lấy từ cache của từng config
+        logger.info(f"Sweeping {len(configs)} config(s) over {len(inputs)} unique input(s)")
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            futures: List[Tuple[int, str, concurrent.futures.Future]] = []
+            # Xen kẽ các config để mọi config cùng tiến triển
+            for input_text in inputs:
+                for i, config in enumerate(configs):
+                    hit = self.cache.get(OutputCache.key(config, request.prompt, input_text))
+                    if hit is not None:
+                        outputs[i][input_text] = hit
+                        cached[i].append(input_text)
+                        continue
+                    futures.append((i, input_text, executor.submit(
+                        contextvars.copy_context().run,
+                        self._run_input, runners[i], config, usages[i], request.prompt, input_text
+                    )))
+            try:
+                for i, input_text, future in futures:
+                    outputs[i][input_text] = future.result()
+            except RunCancelledError:
+                for _, _, future in futures:
+                    future.cancel()
+                raise
+
+        results = []
+        for i, config in enumerate(configs):
+            cases = [
+                test_case.model_copy(update={"prompt_output": outputs[i][test_case.input].output.output})
+                for test_case in request.test_cases
+            ]
+            evaluation = self.evaluator.evaluate_testcases(cases, mode=request.mode,
+                                                           required_keys=request.required_keys)
+            latencies = [outputs[i][test_case.input].output.response_time for test_case in request.test_cases]
+            usage = usages[i]
+            # Input lấy từ cache: cộng usage lúc tạo output để cost so sánh được giữa các config
+            hits = [outputs[i][text] for text in cached[i]]
+            cache_savings = sum(hit.cost for hit in hits)
+            run_id = None
+            if self.store is not None:
+                run_id = self.store("sweep", cases, prompt=request.prompt, **config.model_dump())
+            results.append(SweepConfigResult(
+                config=config,
+                accuracy=evaluation.accuracy,
+                avg_similarity=evaluation.avg_similarity,
+                latency_p50=_percentile(latencies, 50),
+                latency_p95=_percentile(latencies, 95),
+                latency_p99=_percentile(latencies, 99),
+                requests=usage.requests,
+                cached_results=len(cached[i]),
+                prompt_tokens=usage.prompt_tokens + sum(hit.prompt_tokens for hit in hits),
+                completion_tokens=usage.completion_tokens + sum(hit.completion_tokens for hit in hits),
+                cost=round(usage.cost + cache_savings, 6),
+                cache_savings=round(cache_savings, 6),
+                run_id=run_id
+            ))
+
+        front = pareto_front(results)
+        for i in front:
+            results[i].pareto_optimal = True
+
+        cheapest = fastest = None
+        if request.target_accuracy is not None:
+            passing = [s for s in results if s.accuracy >= request.target_accuracy]
+            if passing:
+                cheapest = min(passing, key=lambda s: (s.cost, s.latency_p50)).config
+                fastest = min(passing, key=lambda s: (s.latency_p50, s.cost)).config
+
+        return SweepResponse(
+            results=results,
+            pareto=[results[i].config for i in front],
+            cheapest_at_target=cheapest,
+            fastest_at_target=fastest,
+            unique_inputs=len(inputs),
+            total_time=time.time() - start_time
+        )
@@ -1,41 +1,54 @@
 import logging
 import os
-import openai
-from openai import OpenAI
-from typing import List
+from typing import List, Optional
 from models import Sample, PromptTestCase
+from cancellation import RunCancelledError, sleep as cancellable_sleep
+from circuit_breaker import CircuitOpenError, degradation_scope, mark_degraded
+from generation_cache import generation_cache, cache_key
+import llm_client
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def call_openai_api(client, messages, max_retries=3):
+TEST_CASE_GENERATION_PARAMS = {
+    "response_format": {"type": "text"},
+    "temperature": 0.7,  # Lower temperature for more focused test cases
+    "max_tokens": 2048,
+    "top_p": 1,
+    "frequency_penalty": 0.2,  # Slight increase to encourage variety
+    "presence_penalty": 0.2
+}
+
+def call_openai_api(messages, max_retries=3, seed: Optional[int] = None):
     """Call OpenAI API with manual retry mechanism"""
+    params = dict(TEST_CASE_GENERATION_PARAMS)
+    if seed is not None:
+        params["seed"] = seed
     try_count = 0
     while try_count < max_retries:
         try:
             logger.info(f"Attempt {try_count + 1} to call OpenAI API for test cases")
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=messages,
-                response_format={"type": "text"},
-                temperature=0.7,  # Lower temperature for more focused test cases
-                max_tokens=2048,
-                top_p=1,
-                frequency_penalty=0.2,  # Slight increase to encourage variety
-                presence_penalty=0.2
-            )
+            response = llm_client.chat_completion(messages=messages, **params)
             return response
+        except (RunCancelledError, CircuitOpenError):
+            # Breaker đang mở: retry chỉ làm request chờ thêm
+            raise
         except Exception as e:
             try_count += 1
             if try_count == max_retries:
                 logger.error(f"Failed after {max_retries} attempts: {str(e)}")
                 raise
             logger.warning(f"Attempt {try_count} failed: {str(e)}. Retrying in {try_count} seconds...")
-            time.sleep(try_count)
+            cancellable_sleep(try_count)
+
+def generate_test_cases(format_output: str, samples: List[Sample], conditions: str, num_cases: int = 5,
+                        seed: Optional[int] = None, regenerate: bool = False) -> List[PromptTestCase]:
+    """Generate test cases using OpenAI API
 
-def generate_test_cases(format_output: str, samples: List[Sample], conditions: str, num_cases: int = 5) -> List[PromptTestCase]:
-    """Generate test cases using OpenAI API"""
+    Có seed thì bộ test case được cache theo (input, seed, model, tham số); regenerate=True
+    bỏ qua cache và ghi đè bằng kết quả mới.
+    """
     try:
         # Calculate number of happy/unhappy cases
         num_happy = max(1, int(num_cases * 0.3))
@@ -116,15 +129,18 @@ Tạo {num_cases} test cases ngay:
             }
         ]
 
-        # Initialize OpenAI client
-        client = OpenAI(
-            api_key=os.getenv('OPENAI_API_KEY'),
-            timeout=60.0
-        )
+        key = None
+        if seed is not None:
+            key = cache_key("test_cases", messages, seed, llm_client.DEFAULT_MODEL, TEST_CASE_GENERATION_PARAMS)
+            cached = None if regenerate else generation_cache.get(key)
+            if cached is not None:
+                logger.info(f"Using {len(cached)} cached test cases for seed {seed}")
+                return cached
 
         # Call API
         logger.info("Generating test cases...")
-        response = call_openai_api(client, messages)
+        with degradation_scope() as degraded:
+            response = call_openai_api(messages, seed=seed)
         
         # Parse response into test cases
         test_cases = []
@@ -155,6 +171,7 @@ Tạo {num_cases} test cases ngay:
         # Ensure we have at least one test case
         if not test_cases:
             logger.warning("No test cases parsed successfully, using fallback")
+            mark_degraded("placeholder_test_cases")
             return [
                 PromptTestCase(
                     input=f"Test input {i}",
@@ -167,10 +184,16 @@ Tạo {num_cases} test cases ngay:
             ]
             
         logger.info(f"Generated {len(test_cases)} test cases")
+        # Kết quả từ model dự phòng (trong call này) không cache dưới key của model mặc định
+        if key is not None and not degraded:
+            generation_cache.put(key, test_cases)
         return test_cases
         
+    except RunCancelledError:
+        raise
     except Exception as e:
         logger.error(f"Error generating test cases: {str(e)}", exc_info=True)
+        mark_degraded("placeholder_test_cases")
         # Fallback to basic test case generation
         return [
             PromptTestCase(
@@ -1,9 +1,117 @@
 import os
 import sys
+import threading
+import time
 from pathlib import Path
+import pytest
 
 # Get the absolute path to the backend directory
 backend_path = str(Path(__file__).parent.parent.absolute())
 
 # Add the backend directory to Python path
-sys.path.insert(0, backend_path) 
\ No newline at end of file
+sys.path.insert(0, backend_path)
+
+from openai.types.chat import ChatCompletion
+
+
+class FakeCompletions:
+    """Stub cho client.chat.completions: trả lời bằng responder, ghi lại mọi call.
+
+    prefix_cache=True mô phỏng prompt caching của OpenAI: system message >= 1024 token
+    đã gặp trước đó được báo trong usage.prompt_tokens_details.cached_tokens
+    (làm tròn xuống bội số 128 token).
+    Output bị cắt theo stop và max_tokens (4 ký tự / token, finish_reason="length").
+    """
+
+    def __init__(self, responder=None, delay: float = 0.0, prefix_cache: bool = False):
+        self.responder = responder or (lambda messages, **params: messages[-1]["content"])
+        self.delay = delay
+        self.prefix_cache = prefix_cache
+        self.calls = []
+        self._seen_prefixes = set()
+        self._lock = threading.Lock()
+
+    def _cached_tokens(self, messages) -> int:
+        system = messages[0]["content"] if messages[0]["role"] == "system" else ""
+        system_tokens = len(system) // 4
+        with self._lock:
+            hit = system in self._seen_prefixes
+            if system_tokens >= 1024:
+                self._seen_prefixes.add(system)
+        return system_tokens // 128 * 128 if hit and system_tokens >= 1024 else 0
+
+    def create(self, model, messages, **params):
+        with self._lock:
+            self.calls.append({"model": model, "messages": messages, **params})
+        if self.delay:
+            time.sleep(self.delay)
+        # Responder có thể trả list để mô phỏng nhiều sample (tham số n)
+        contents = self.responder(messages, model=model, **params)
+        if isinstance(contents, str):
+            contents = [contents] * params.get("n", 1)
+        contents = list(contents)
+        finish_reasons = []
+        for i, content in enumerate(contents):
+            for stop in params.get("stop") or []:
+                content = content.split(stop)[0]
+            max_chars = params.get("max_tokens", 1 << 30) * 4
+            finish_reasons.append("length" if len(content) > max_chars else "stop")
+            contents[i] = content[:max_chars]
+        prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+        completion_tokens = sum(len(content) for content in contents) // 4
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+        if self.prefix_cache:
+            usage["prompt_tokens_details"] = {"cached_tokens": self._cached_tokens(messages)}
+        return ChatCompletion(
+            id="chatcmpl-test",
+            object="chat.completion",
+            created=int(time.time()),
+            model=model,
+            choices=[
+                {
+                    "index": i,
+                    "finish_reason": finish_reasons[i],
+                    "message": {"role": "assistant", "content": content}
+                }
+                for i, content in enumerate(contents)
+            ],
+            usage=usage
+        )
+
+
+class FakeOpenAI:
+    def __init__(self, completions: FakeCompletions):
+        self.chat = type("Chat", (), {"completions": completions})()
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    """Thay OpenAI client dùng chung bằng stub (không gọi network)"""
+    import llm_client
+
+    completions = FakeCompletions()
+    monkeypatch.setenv("OPENAI_API_KEY", os.getenv("OPENAI_API_KEY", "sk-test"))
+    monkeypatch.setattr(llm_client, "get_client", lambda: FakeOpenAI(completions))
+    return completions
+
+@pytest.fixture(autouse=True)
+def isolated_result_store(tmp_path, monkeypatch):
+    """Kết quả run trong test được ghi vào thư mục tạm"""
+    from result_store import result_store
+
+    monkeypatch.setattr(result_store, "root", str(tmp_path / "results"))
+    return result_store
+@pytest.fixture(autouse=True)
+def isolated_generation_cache(tmp_path, monkeypatch):
+    """Cache generate trong test được ghi vào file tạm"""
+    from generation_cache import generation_cache
+
+    monkeypatch.setattr(generation_cache, "path", str(tmp_path / "generation_cache.db"))
+    return generation_cache
\ No newline at end of file
@@ -0,0 +1,80 @@
+import sys
+import threading
+from pathlib import Path
+import pytest
+
+# Add backend directory to Python path
+backend_path = str(Path(__file__).parent.parent.absolute())
+sys.path.insert(0, backend_path)
+
+from models import PromptTestCase
+from cancellation import CancellationToken, RunCancelledError, use_token
+from run_prompt_with_testcases import PromptTestRunner
+
+def test_runner_stops_when_token_cancelled(fake_openai):
+    token = CancellationToken()
+
+    def responder(messages, **params):
+        # Client "ngắt kết nối" sau call thứ hai
+        if len(fake_openai.calls) == 2:
+            token.cancel("client disconnected")
+        return "ok"
+
+    fake_openai.responder = responder
+    test_cases = [
+        PromptTestCase(input=f"input {i}", expected_output="ok")
+        for i in range(10)
+    ]
+
+    with use_token(token):
+        with pytest.raises(RunCancelledError):
+            PromptTestRunner(max_workers=1).run_with_testcases("prompt", test_cases)
+
+    assert len(fake_openai.calls) == 2
+
+def test_in_flight_call_is_abandoned(fake_openai):
+    fake_openai.delay = 5
+    token = CancellationToken()
+    threading.Timer(0.1, token.cancel).start()
+
+    with use_token(token):
+        with pytest.raises(RunCancelledError):
+            PromptTestRunner().run_single_prompt("prompt", "input")
+
+def test_runner_writes_output_text(fake_openai):
+    test_cases = [PromptTestCase(input="hello", expected_output="hello")]
+
+    results = PromptTestRunner().run_with_testcases("prompt", test_cases)
+
+    assert results[0].prompt_output == "hello"
+
+def test_cancelled_call_closes_its_connection():
+    import socket
+    import time
+    import llm_client
+
+    closed = threading.Event()
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+
+    def slow_backend():
+        # Đọc request rồi không trả lời: chỉ thoát khi client đóng connection
+        conn, _ = server.accept()
+        while conn.recv(65536):
+            pass
+        closed.set()
+        conn.close()
+
+    threading.Thread(target=slow_backend, daemon=True).start()
+    client = llm_client.create_http_client(base_url=f"http://127.0.0.1:{server.getsockname()[1]}", timeout=10)
+    token = CancellationToken()
+    threading.Timer(0.2, token.cancel).start()
+
+    start = time.time()
+    with use_token(token):
+        with pytest.raises(RunCancelledError):
+            client.post("/chat/completions", json={})
+    assert time.time() - start < 2
+    assert closed.wait(2)
+    server.close()
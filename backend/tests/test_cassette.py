@@ -0,0 +1,102 @@
+import sys
+import time
+from pathlib import Path
+
+# Add backend directory to Python path
+backend_path = str(Path(__file__).parent.parent.absolute())
+sys.path.insert(0, backend_path)
+
+import httpx
+import openai
+import pytest
+import cassette
+import llm_client
+from cassette import CassetteClient, CassetteMissError, CassetteReplayError
+from run_prompt import PromptRunner
+
+def test_recorded_run_replays_without_network(fake_openai, tmp_path, monkeypatch):
+    path = str(tmp_path / "traffic.jsonl.gz")
+    fake_openai.responder = lambda messages, **params: messages[-1]["content"].upper()
+    fake_openai.delay = 0.2
+    recorder = CassetteClient("record", path, llm_client.get_client())
+    monkeypatch.setattr(llm_client, "get_client", lambda: recorder)
+    recorded = [PromptRunner().run_single_prompt("system", text).output for text in ["a", "b"]]
+    recorder.close()
+
+    player = CassetteClient("replay", path, latency_scale=0)
+    monkeypatch.setattr(llm_client, "get_client", lambda: player)
+    start = time.time()
+    replayed = [PromptRunner().run_single_prompt("system", text).output for text in ["a", "b"]]
+
+    assert replayed == recorded == ["A", "B"]
+    assert time.time() - start < 0.2
+    assert len(fake_openai.calls) == 2
+
+def test_replay_keeps_original_latency_and_rejects_unknown_requests(fake_openai, tmp_path):
+    path = str(tmp_path / "traffic.jsonl.gz")
+    fake_openai.delay = 0.2
+    recorder = CassetteClient("record", path, llm_client.get_client())
+    messages = [{"role": "user", "content": "hello"}]
+    recorder.chat.completions.create(model="gpt-4o-mini", messages=messages, temperature=0)
+    recorder.close()
+
+    player = CassetteClient("replay", path, latency_scale=1.0)
+    start = time.time()
+    completion = player.chat.completions.create(model="gpt-4o-mini", messages=messages, temperature=0)
+    assert completion.choices[0].message.content == "hello"
+    assert time.time() - start >= 0.2
+
+    with pytest.raises(CassetteMissError):
+        player.chat.completions.create(model="gpt-4o-mini", messages=messages, temperature=1)
+
+def test_each_process_records_its_own_file_and_replay_merges_them(fake_openai, tmp_path, monkeypatch):
+    path = str(tmp_path / "traffic.jsonl.gz")
+    recorder = CassetteClient("record", path, llm_client.get_client())
+    recorder.chat.completions.create(model="gpt-4o-mini", messages=[{"role": "user", "content": "a"}])
+    # Process con sau fork ghi sang file của nó
+    with monkeypatch.context() as patch:
+        patch.setattr(cassette.os, "getpid", lambda: 424242)
+        recorder.chat.completions.create(model="gpt-4o-mini", messages=[{"role": "user", "content": "b"}])
+        recorder.close()
+    recorder.close()
+
+    assert len(cassette.cassette_files(path)) == 2
+    player = CassetteClient("replay", path, latency_scale=0)
+    for text in ["a", "b"]:
+        completion = player.chat.completions.create(model="gpt-4o-mini", messages=[{"role": "user", "content": text}])
+        assert completion.choices[0].message.content == text
+
+def test_replay_keeps_records_of_truncated_file(fake_openai, tmp_path, monkeypatch):
+    path = str(tmp_path / "traffic.jsonl.gz")
+    recorder = CassetteClient("record", path, llm_client.get_client())
+    monkeypatch.setattr(llm_client, "get_client", lambda: recorder)
+    PromptRunner().run_single_prompt("system", "a")
+    recorder.close()
+    # Process khác bị kill trước khi close: file không có trailer gzip
+    with open(cassette.cassette_files(path)[0], "rb") as f:
+        complete = f.read()
+    with open(f"{path}.999", "wb") as f:
+        f.write(complete[:-8])
+
+    player = CassetteClient("replay", path, latency_scale=0)
+
+    assert sum(len(entries) for entries in player._entries.values()) == 2
+    assert cassette.read_entries(f"{path}.999")
+
+def test_replay_raises_recorded_error_type(fake_openai, tmp_path):
+    path = str(tmp_path / "traffic.jsonl.gz")
+
+    def timeout(messages, **params):
+        raise openai.APITimeoutError(request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+
+    fake_openai.responder = timeout
+    recorder = CassetteClient("record", path, llm_client.get_client())
+    messages = [{"role": "user", "content": "hello"}]
+    with pytest.raises(openai.APITimeoutError):
+        recorder.chat.completions.create(model="gpt-4o-mini", messages=messages)
+    recorder.close()
+
+    player = CassetteClient("replay", path, latency_scale=0)
+    with pytest.raises(openai.APITimeoutError) as error:
+        player.chat.completions.create(model="gpt-4o-mini", messages=messages)
+    assert isinstance(error.value, CassetteReplayError)
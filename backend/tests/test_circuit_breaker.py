@@ -0,0 +1,78 @@
+import sys
+import time
+from pathlib import Path
+import httpx
+import openai
+import pytest
+from fastapi.testclient import TestClient
+
+# Add backend directory to Python path
+backend_path = str(Path(__file__).parent.parent.absolute())
+sys.path.insert(0, backend_path)
+
+import llm_client
+from circuit_breaker import BreakerRegistry, CircuitBreaker, CircuitOpenError, CLOSED, OPEN, HALF_OPEN
+from main import app
+
+def _timeout(messages, **params):
+    raise openai.APITimeoutError(request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = BreakerRegistry(min_requests=4, error_rate=0.5, open_seconds=0.2)
+    monkeypatch.setattr(llm_client, "breakers", registry)
+    return registry
+
+def test_breaker_opens_on_error_rate_and_recovers_through_half_open():
+    breaker = CircuitBreaker("m", min_requests=4, error_rate=0.5, open_seconds=0.05)
+    breaker.record_success()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow() and not breaker.allow()  # Chỉ một call thăm dò
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.allow()
+
+def test_open_breaker_fails_fast_without_calling_backend(fake_openai, registry):
+    fake_openai.responder = _timeout
+    for _ in range(4):
+        with pytest.raises(openai.APITimeoutError):
+            llm_client.chat_completion([{"role": "user", "content": "hi"}])
+    with pytest.raises(CircuitOpenError):
+        llm_client.chat_completion([{"role": "user", "content": "hi"}])
+    assert len(fake_openai.calls) == 4
+    assert registry.stats()["gpt-4o-mini"]["rejected"] == 1
+
+def test_open_breaker_routes_to_fallback_model(fake_openai, registry):
+    registry.fallback_model = "gpt-4o"
+    fake_openai.responder = lambda messages, model, **params: _timeout(messages) if model == "gpt-4o-mini" else "ok"
+    for _ in range(4):
+        with pytest.raises(openai.APITimeoutError):
+            llm_client.chat_completion([{"role": "user", "content": "hi"}])
+    completion = llm_client.chat_completion([{"role": "user", "content": "hi"}])
+    assert completion.choices[0].message.content == "ok"
+    assert fake_openai.calls[-1]["model"] == "gpt-4o"
+
+def test_responses_are_marked_degraded(fake_openai, registry):
+    fake_openai.responder = _timeout
+    client = TestClient(app)
+    response = client.post("/api/run-prompt", json={
+        "prompt": "echo",
+        "test_cases": [{"input": f"q{i}", "expected_output": "a"} for i in range(40)]
+    })
+    body = response.json()
+    assert "failed_outputs" in body["degraded"]
+    assert "circuit_open:gpt-4o-mini" in body["degraded"]
+    assert "failed_outputs" in response.headers["x-degraded"]
+    # Breaker mở sau 4 lỗi: các case còn lại không chờ backend
+    assert len(fake_openai.calls) < 40
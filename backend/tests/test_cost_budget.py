@@ -0,0 +1,97 @@
+import sys
+from pathlib import Path
+
+# Add backend directory to Python path
+backend_path = str(Path(__file__).parent.parent.absolute())
+sys.path.insert(0, backend_path)
+
+from fastapi.testclient import TestClient
+import cost_estimator
+from cost_estimator import estimate_run
+from main import app
+from models import PromptTestCase
+from run_prompt_with_testcases import PromptTestRunner
+from usage_tracker import track_usage
+
+def _cases(count):
+    return [PromptTestCase(input=f"câu hỏi số {i}", expected_output=f"câu trả lời {i}") for i in range(count)]
+
+def test_estimate_counts_requests_and_tokens():
+    prompt = "Bạn là trợ lý chấm phát âm tiếng Anh cho học sinh tiểu học. " * 20
+    single = estimate_run(prompt, _cases(10), "gpt-4o-mini")
+    packed = estimate_run(prompt, _cases(10), "gpt-4o-mini", pack_size=5)
+
+    assert single.requests == 10 and packed.requests == 2
+    assert single.prompt_tokens > 0 and single.completion_tokens > 0
+    assert single.total_tokens == single.prompt_tokens + single.completion_tokens
+    assert single.cost > 0
+    # Gộp input: system prompt chỉ tính một lần mỗi request
+    assert packed.prompt_tokens < single.prompt_tokens
+
+def test_estimate_applies_output_budget_caps():
+    # Case không có expected_output được ước lượng DEFAULT_OUTPUT_TOKENS, trừ khi bị cap
+    cases = _cases(4) + [PromptTestCase(input="không có đáp án", expected_output="")]
+    with TestClient(app) as client:
+        full = client.post("/api/estimate", json={"prompt": "p", "test_cases": [c.model_dump() for c in cases]}).json()
+        capped = client.post("/api/estimate", json={
+            "prompt": "p", "test_cases": [c.model_dump() for c in cases], "output_budget": "suite"
+        }).json()
+
+    assert capped["completion_tokens"] < full["completion_tokens"]
+    assert full["completion_tokens"] - capped["completion_tokens"] > cost_estimator.DEFAULT_OUTPUT_TOKENS // 2
+
+class _FakeTiktoken:
+    """tiktoken cũ: không biết gpt-4o và không có encoding mới"""
+
+    def __init__(self, encodings):
+        self.encodings = encodings
+
+    def encoding_for_model(self, model):
+        raise KeyError(model)
+
+    def get_encoding(self, name):
+        if name not in self.encodings:
+            raise ValueError(f"Unknown encoding {name}")
+        return self.encodings[name]
+
+class _WordEncoding:
+    def encode(self, text):
+        return text.split()
+
+def test_unknown_model_falls_back_to_cl100k_then_approx(monkeypatch):
+    cost_estimator._encoding.cache_clear()
+    monkeypatch.setattr(cost_estimator, "tiktoken", _FakeTiktoken({"cl100k_base": _WordEncoding()}))
+    assert cost_estimator.count_tokens("một hai ba", "gpt-4o-mini") == 3
+    assert estimate_run("p", _cases(2), "gpt-4o-mini").tokenizer == "tiktoken"
+
+    cost_estimator._encoding.cache_clear()
+    monkeypatch.setattr(cost_estimator, "tiktoken", _FakeTiktoken({}))
+    assert cost_estimator.count_tokens("abcdefgh", "gpt-4o-mini") == 2
+    assert estimate_run("p", _cases(2), "gpt-4o-mini").tokenizer == "approx"
+    cost_estimator._encoding.cache_clear()
+
+def test_budget_stops_run_with_partial_results(fake_openai):
+    fake_openai.responder = lambda messages, **params: "ok"
+    test_cases = _cases(40)
+
+    with track_usage(budget_tokens=300) as usage:
+        PromptTestRunner(max_workers=1).run_with_testcases("p" * 400, test_cases)
+
+    assert usage.budget_exceeded and usage.rejected_calls > 0
+    assert len(fake_openai.calls) < 40
+    assert test_cases[0].prompt_output == "ok"
+
+def test_run_prompt_reports_usage(fake_openai):
+    fake_openai.responder = lambda messages, **params: "ok"
+    response = TestClient(app).post("/api/run-prompt", json={
+        "prompt": "p" * 400,
+        "test_cases": [case.model_dump() for case in _cases(20)],
+        "budget_tokens": 300
+    })
+    body = response.json()
+
+    assert response.status_code == 200
+    assert body["usage"]["budget_exceeded"] is True
+    assert body["usage"]["requests"] == len(fake_openai.calls) < 20
+    assert "budget_exceeded" in body["degraded"]
+    assert len(body["test_cases"]) == 20
@@ -0,0 +1,117 @@
+import sys
+import threading
+from pathlib import Path
+import pytest
+
+# Add backend directory to Python path
+backend_path = str(Path(__file__).parent.parent.absolute())
+sys.path.insert(0, backend_path)
+
+import work_queue
+from work_queue import MemoryQueue, SQLiteQueue, SpoolQueue, DONE, FAILED
+from distributed import Coordinator, Worker
+from models import PromptTestCase
+from run_prompt_with_testcases import PromptTestRunner
+from run_prompt_evaluate import PromptEvaluator
+from fastapi.testclient import TestClient
+
+@pytest.fixture(params=["memory", "sqlite", "spool"])
+def queue(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteQueue(str(tmp_path / "queue.db"))
+    if request.param == "spool":
+        return SpoolQueue(str(tmp_path / "spool"))
+    return MemoryQueue()
+
+def test_duplicate_completion_is_ignored(queue):
+    queue.publish("run1", [{"n": 0}, {"n": 1}])
+    first = queue.claim("w1")
+    assert queue.complete(first, {"by": "w1"})
+    assert not queue.complete(first, {"by": "w2"})
+    assert queue.results("run1") == {0: {"by": "w1"}}
+    assert queue.progress("run1")[DONE] == 1
+
+def test_older_runs_are_claimed_first(queue):
+    # run_id là uuid ngẫu nhiên: thứ tự claim theo lúc publish, không theo run_id
+    queue.publish("zzz", [{"n": 0}, {"n": 1}])
+    queue.publish("aaa", [{"n": 0}])
+    claimed = [queue.claim("w1") for _ in range(3)]
+    assert [(task.run_id, task.chunk_id) for task in claimed] == [("zzz", 0), ("zzz", 1), ("aaa", 0)]
+
+def test_expired_lease_is_reclaimed_by_another_worker(queue):
+    queue.publish("run1", [{"n": 0}])
+    lost = queue.claim("w1", lease_seconds=-1)
+    retry = queue.claim("w2")
+    assert retry.chunk_id == lost.chunk_id and retry.attempt == 2
+    assert queue.claim("w3") is None
+
+def test_failing_chunk_stops_after_max_attempts(queue, monkeypatch):
+    monkeypatch.setattr(work_queue, "MAX_ATTEMPTS", 2)
+    queue.publish("run1", [{"n": 0}])
+    for _ in range(3):
+        task = queue.claim("w1")
+        if task is None:
+            break
+        queue.release(task)
+    assert queue.claim("w1") is None
+    assert queue.progress("run1")[FAILED] == 1
+
+def test_workers_process_run_and_results_keep_input_order(fake_openai, tmp_path):
+    queue = SQLiteQueue(str(tmp_path / "queue.db"))
+    coordinator = Coordinator(queue)
+    cases = [PromptTestCase(input=f"case {i}", expected_output=f"case {i}") for i in range(7)]
+    run_id = coordinator.submit("echo", cases, chunk_size=3)
+    assert coordinator.status(run_id).total_chunks == 3
+
+    workers = [Worker(queue, PromptTestRunner(max_workers=2), PromptEvaluator(), worker_id=f"w{i}") for i in range(2)]
+    threads = [threading.Thread(target=lambda w=w: [None for _ in iter(w.process_one, False)]) for w in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    status = coordinator.status(run_id)
+    assert status.done and status.completed_chunks == 3
+    assert [case.input for case in status.test_cases] == [case.input for case in cases]
+    assert all(case.is_correct for case in status.test_cases)
+    assert sum(w.processed for w in workers) == 3
+
+def test_work_queue_is_abstract():
+    with pytest.raises(TypeError):
+        work_queue.WorkQueue()
+
+def test_failed_chunk_cases_are_returned_with_error(fake_openai, monkeypatch):
+    monkeypatch.setattr(work_queue, "MAX_ATTEMPTS", 1)
+    queue = MemoryQueue()
+    coordinator = Coordinator(queue)
+    cases = [PromptTestCase(input=f"case {i}", expected_output=f"case {i}") for i in range(4)]
+    run_id = coordinator.submit("echo", cases, chunk_size=2)
+
+    queue.release(queue.claim("w1"))
+    Worker(queue, PromptTestRunner(), PromptEvaluator()).process_one()
+
+    status = coordinator.status(run_id)
+    assert status.done and status.failed_chunks == 1
+    assert [case.input for case in status.test_cases] == [case.input for case in cases]
+    assert [case.error is not None for case in status.test_cases] == [True, True, False, False]
+
+def test_distributed_run_forwards_output_budget_and_rejects_run_budget(fake_openai, monkeypatch):
+    import main
+    queue = MemoryQueue()
+    monkeypatch.setattr(main, "_coordinator", Coordinator(queue))
+    client = TestClient(main.app)
+    cases = [{"input": f"case {i}", "expected_output": "ok"} for i in range(3)]
+
+    rejected = client.post("/api/distributed/runs", json={"prompt": "p", "test_cases": cases, "budget_usd": 1})
+    assert rejected.status_code == 422
+
+    response = client.post("/api/distributed/runs", json={"prompt": "p", "test_cases": cases, "output_budget": "suite",
+                                                         "chunk_size": 2})
+    worker = Worker(queue, PromptTestRunner())
+    while worker.process_one():
+        pass
+    status = client.get(f"/api/distributed/runs/{response.json()['run_id']}").json()
+
+    assert response.status_code == 200
+    assert all(call["max_tokens"] < 2048 and call["stop"] == ["\n"] for call in fake_openai.calls)
+    assert status["output_budget"]["requests"] == 3
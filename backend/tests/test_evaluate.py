@@ -0,0 +1,107 @@
+import sys
+from pathlib import Path
+
+# Add backend directory to Python path
+backend_path = str(Path(__file__).parent.parent.absolute())
+sys.path.insert(0, backend_path)
+
+from models import PromptTestCase
+from run_prompt_evaluate import PromptEvaluator
+from json_compare import compare_json, parse_json_output
+
+def test_json_mode_ignores_key_order_and_whitespace():
+    test_case = PromptTestCase(
+        input="hello",
+        expected_output='{"score": 9, "label": "Phát âm chuẩn"}',
+        prompt_output='```json\n{\n  "label": "Phát âm chuẩn",\n  "score": 9\n}\n```'
+    )
+
+    result = PromptEvaluator().evaluate_testcases([test_case], mode="json")
+
+    assert result.accuracy == 1.0
+    assert test_case.field_scores == {"score": 1.0, "label": 1.0}
+    assert test_case.missing_keys == []
+
+def test_json_mode_reports_per_path_scores_and_missing_keys():
+    expected = {"open": {"title": "Mở đoạn", "text": "abc"}, "main_ideas": [{"header": "Ý chính 1"}]}
+    actual = {"open": {"title": "Mở đoạn"}, "main_ideas": [{"header": "Ý chính 1"}, {"header": "x"}]}
+
+    score, field_scores, missing = compare_json(expected, actual, required_keys=["open.text"])
+
+    assert field_scores == {
+        "open.title": 1.0,
+        "open.text": 0.0,
+        "main_ideas[0].header": 1.0,
+        "main_ideas[1]": 0.0
+    }
+    assert score == 0.5
+    assert missing == ["open.text"]
+
+def test_json_mode_penalises_extra_keys_like_extra_items():
+    expected = {"label": "ok", "meta": {"lang": "vi"}}
+    actual = {"label": "ok", "meta": {"lang": "vi", "debug": True}, "extra": 1}
+
+    score, field_scores, missing = compare_json(expected, actual)
+
+    assert field_scores == {"label": 1.0, "meta.lang": 1.0, "meta.debug": 0.0, "extra": 0.0}
+    assert score == 0.5
+    assert missing == []
+
+def test_required_keys_can_index_into_lists():
+    actual = {"main_ideas": [{"header": "Ý chính 1"}, {"text": "abc"}]}
+
+    _, _, missing = compare_json(
+        {"main_ideas": []}, actual,
+        required_keys=["main_ideas[0].header", "main_ideas.1.text", "main_ideas[1].header", "main_ideas[2]"]
+    )
+
+    assert missing == ["main_ideas[1].header", "main_ideas[2]"]
+
+def test_missing_required_key_is_never_correct():
+    test_case = PromptTestCase(
+        input="hello",
+        expected_output='{"label": "ok", "note": null}',
+        prompt_output='{"label": "ok", "note": null, "extra": 1}'
+    )
+
+    PromptEvaluator().evaluate_testcases([test_case], mode="json", required_keys=["label", "reason"])
+
+    assert test_case.missing_keys == ["reason"]
+    assert test_case.is_correct is False
+
+def test_json_mode_falls_back_to_text_similarity():
+    test_case = PromptTestCase(
+        input="hello",
+        expected_output='{"label": "ok"}',
+        prompt_output='label: ok'
+    )
+
+    PromptEvaluator().evaluate_testcases([test_case], mode="json")
+
+    assert test_case.field_scores is None
+    assert 0 < test_case.similarity_score < 1
+    assert parse_json_output("not json") == (False, None)
+
+def test_consistency_metrics_from_samples():
+    test_cases = [
+        PromptTestCase(
+            input="hello",
+            expected_output="Phát âm chuẩn",
+            prompt_output="Phát âm chuẩn",
+            samples=["Phát âm chuẩn", "Phát âm chuẩn", "Phát âm không chuẩn", "Phát  âm chuẩn"]
+        ),
+        PromptTestCase(
+            input="world",
+            expected_output="Phát âm không chuẩn",
+            prompt_output="Phát âm chuẩn",
+            samples=["Phát âm chuẩn", "Phát âm không chuẩn", "Phát âm chuẩn", "Phát âm chuẩn"]
+        )
+    ]
+
+    result = PromptEvaluator().evaluate_testcases(test_cases)
+
+    assert test_cases[0].agreement_rate == 0.75
+    assert result.majority_vote_accuracy == 0.5
+    assert result.avg_agreement == 0.75
+    # Case 1: 3/4 sample đúng ("Phát  âm chuẩn" vẫn > 0.95 similarity), case 2: 1/4
+    assert result.sample_accuracy == (0.75 + 0.25) / 2
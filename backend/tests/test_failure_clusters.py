@@ -0,0 +1,55 @@
+import sys
+from pathlib import Path
+
+# Add backend directory to Python path
+backend_path = str(Path(__file__).parent.parent.absolute())
+sys.path.insert(0, backend_path)
+
+from fastapi.testclient import TestClient
+from failure_clusters import cluster_failures
+from main import app
+from models import PromptTestCase
+
+def _failures(count_per_mode):
+    modes = [
+        ("Đánh giá phát âm: 'word{i}'", "Tôi không thể nghe được âm thanh"),
+        ("Translate sentence {i} to French", "Sorry, I only answer in English"),
+        ("Trả về JSON cho user {i}", ""),
+    ]
+    cases = []
+    for i in range(count_per_mode):
+        for template, output in modes:
+            cases.append(PromptTestCase(input=template.format(i=i), expected_output="x",
+                                        prompt_output=output, is_correct=False))
+    return cases
+
+def test_failures_group_by_failure_mode():
+    cases = _failures(200) + [PromptTestCase(input="ok", expected_output="ok", prompt_output="ok", is_correct=True)]
+    result = cluster_failures(cases, k=3)
+
+    assert result.total_cases == 601 and result.failures == 600
+    assert sorted(cluster.size for cluster in result.clusters) == [200, 200, 200]
+    empty = [cluster for cluster in result.clusters if cluster.empty_outputs]
+    assert len(empty) == 1 and empty[0].empty_outputs == 200
+    assert "json" in empty[0].input_terms
+    for cluster in result.clusters:
+        members = {cases[position].prompt_output for position in cluster.positions}
+        assert members == {cluster.representative.prompt_output}
+
+def test_no_failures_returns_no_clusters():
+    cases = [PromptTestCase(input="a", expected_output="a", prompt_output="a", is_correct=True)]
+    assert cluster_failures(cases).clusters == []
+
+def test_cluster_endpoints(fake_openai):
+    cases = [case.model_copy(update={"expected_output": "đúng"}) for case in _failures(20)]
+    with TestClient(app) as client:
+        evaluated = client.post("/api/evaluate-results", json={
+            "test_cases": [case.model_dump() for case in cases],
+            "cluster_failures": True
+        }).json()
+        stored = client.get(f"/api/runs/{evaluated['run_id']}/clusters", params={"k": 3}).json()
+        missing = client.get(f"/api/runs/{'0' * 32}/clusters")
+
+    assert evaluated["failure_clusters"]["failures"] == 60
+    assert stored["failures"] == 60 and len(stored["clusters"]) == 3
+    assert missing.status_code == 404
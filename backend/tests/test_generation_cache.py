@@ -0,0 +1,117 @@
+import sys
+from pathlib import Path
+import pytest
+from fastapi.testclient import TestClient
+
+# Add backend directory to Python path
+backend_path = str(Path(__file__).parent.parent.absolute())
+sys.path.insert(0, backend_path)
+
+from circuit_breaker import mark_degraded, track_degradation
+from generation_cache import GenerationCache, generation_cache
+from models import PromptTestCase, Sample
+from prompt_generator import generate_prompt
+from test_case_generator import generate_test_cases
+from main import app
+
+SAMPLES = [Sample(input="hello", output="Phát âm chuẩn")]
+TEST_CASES_OUTPUT = "---\nInput: a\nExpected: b\n---\nInput: c\nExpected: d\n---\n"
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    generation_cache.clear()
+    yield
+    generation_cache.clear()
+
+def test_seeded_prompt_is_generated_once(fake_openai):
+    first = generate_prompt("json", SAMPLES, "ngắn gọn", seed=7)
+    again = generate_prompt("json", SAMPLES, "ngắn gọn", seed=7)
+    assert first == again
+    assert len(fake_openai.calls) == 1
+    assert fake_openai.calls[0]["seed"] == 7
+
+    # Seed khác, input khác, hoặc regenerate đều gọi model
+    generate_prompt("json", SAMPLES, "ngắn gọn", seed=8)
+    generate_prompt("json", SAMPLES, "dài", seed=7)
+    generate_prompt("json", SAMPLES, "ngắn gọn", seed=7, regenerate=True)
+    assert len(fake_openai.calls) == 4
+
+def test_unseeded_generation_is_not_cached(fake_openai):
+    generate_prompt("json", SAMPLES, "ngắn gọn")
+    generate_prompt("json", SAMPLES, "ngắn gọn")
+    assert len(fake_openai.calls) == 2
+    assert "seed" not in fake_openai.calls[0]
+    assert generation_cache.stats()["entries"] == 0
+
+def _degrade_calls(monkeypatch):
+    # Như circuit breaker chuyển sang model dự phòng trong lúc gọi
+    import llm_client
+
+    chat_completion = llm_client.chat_completion
+
+    def degraded_completion(**kwargs):
+        mark_degraded("fallback_model:gpt-4o-mini->gpt-4o")
+        return chat_completion(**kwargs)
+
+    monkeypatch.setattr(llm_client, "chat_completion", degraded_completion)
+
+def test_degraded_generation_is_not_cached_outside_request(fake_openai, monkeypatch):
+    fake_openai.responder = lambda messages, **params: TEST_CASES_OUTPUT
+    with monkeypatch.context() as patch:
+        _degrade_calls(patch)
+        generate_prompt("json", SAMPLES, "ngắn gọn", seed=7)
+        generate_test_cases("json", SAMPLES, "", num_cases=2, seed=7)
+    assert generation_cache.stats()["entries"] == 0
+
+    generate_prompt("json", SAMPLES, "ngắn gọn", seed=7)
+    assert len(fake_openai.calls) == 3
+    assert generation_cache.stats()["entries"] == 1
+
+def test_degradation_is_scoped_to_the_generation(fake_openai, monkeypatch):
+    fake_openai.responder = lambda messages, **params: TEST_CASES_OUTPUT
+    with track_degradation() as reasons:
+        with monkeypatch.context() as patch:
+            _degrade_calls(patch)
+            generate_prompt("json", SAMPLES, "ngắn gọn", seed=7)
+        # Bước trước bị degraded không chặn cache của bước sau trong cùng request
+        generate_test_cases("json", SAMPLES, "", num_cases=2, seed=7)
+    assert reasons == ["fallback_model:gpt-4o-mini->gpt-4o"]
+    assert generation_cache.stats()["entries"] == 1
+    generate_test_cases("json", SAMPLES, "", num_cases=2, seed=7)
+    assert len(fake_openai.calls) == 2
+
+def test_cached_test_cases_are_copies(fake_openai):
+    fake_openai.responder = lambda messages, **params: TEST_CASES_OUTPUT
+    cases = generate_test_cases("text", SAMPLES, "", num_cases=2, seed=1)
+    cases[0].prompt_output = "đã chạy"
+
+    cached = generate_test_cases("text", SAMPLES, "", num_cases=2, seed=1)
+    assert len(fake_openai.calls) == 1
+    assert [case.input for case in cached] == ["a", "c"]
+    assert cached[0].prompt_output == ""
+
+def test_lru_eviction_and_invalidation(tmp_path):
+    cache = GenerationCache(max_size=2, path=str(tmp_path / "cache.db"))
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None and cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+    assert cache.invalidate("a") and cache.get("a") is None
+
+def test_workers_share_entries_and_invalidation(tmp_path):
+    # Hai instance trên cùng file: như hai gunicorn worker
+    path = str(tmp_path / "cache.db")
+    first, second = GenerationCache(path=path), GenerationCache(path=path)
+    first.put("k", [PromptTestCase(input="a", expected_output="b")])
+    assert second.get("k") == [PromptTestCase(input="a", expected_output="b")]
+    assert second.clear() == 1 and first.get("k") is None
+
+def test_clear_endpoint(fake_openai):
+    generate_prompt("json", SAMPLES, "ngắn gọn", seed=7)
+    client = TestClient(app)
+    assert client.get("/api/generation-cache").json()["entries"] == 1
+    assert client.delete("/api/generation-cache").json()["cleared"] == 1
+    generate_prompt("json", SAMPLES, "ngắn gọn", seed=7)
+    assert len(fake_openai.calls) == 2
@@ -0,0 +1,65 @@
+import sys
+import time
+from pathlib import Path
+
+# Add backend directory to Python path
+backend_path = str(Path(__file__).parent.parent.absolute())
+sys.path.insert(0, backend_path)
+
+import llm_client
+from hedging import HedgingPolicy
+from usage_tracker import track_usage
+
+def _straggler_responder(fake_openai):
+    def responder(messages, **params):
+        # Call đầu tiên là straggler, bản hedge trả về ngay
+        if len(fake_openai.calls) == 1:
+            time.sleep(1.0)
+            return "slow"
+        return "fast"
+    return responder
+
+def test_slow_call_is_hedged_and_first_response_wins(fake_openai, monkeypatch):
+    policy = HedgingPolicy(enabled=True, budget=1.0, min_delay=0.0, default_delay=0.1)
+    monkeypatch.setattr(llm_client, "hedging_policy", policy)
+    fake_openai.responder = _straggler_responder(fake_openai)
+
+    start = time.time()
+    completion = llm_client.chat_completion(
+        messages=[{"role": "user", "content": "hello"}],
+        temperature=0
+    )
+
+    assert completion.choices[0].message.content == "fast"
+    assert time.time() - start < 0.8
+    stats = policy.stats()
+    assert stats["hedged"] == 1
+    assert stats["win_rate"] == 1.0
+
+def test_losing_duplicate_usage_is_recorded(fake_openai, monkeypatch):
+    policy = HedgingPolicy(enabled=True, budget=1.0, min_delay=0.0, default_delay=0.1)
+    monkeypatch.setattr(llm_client, "hedging_policy", policy)
+    fake_openai.responder = _straggler_responder(fake_openai)
+
+    with track_usage() as usage:
+        llm_client.chat_completion(messages=[{"role": "user", "content": "hello"}], temperature=0)
+        assert usage.requests == 1
+        # Bản chậm (thua) xong sau đó vẫn được tính token / cost
+        deadline = time.time() + 2
+        while usage.requests < 2 and time.time() < deadline:
+            time.sleep(0.05)
+    assert usage.requests == 2
+
+def test_hedging_respects_budget_and_temperature(fake_openai, monkeypatch):
+    policy = HedgingPolicy(enabled=True, budget=0.0, min_delay=0.0, default_delay=0.1)
+    monkeypatch.setattr(llm_client, "hedging_policy", policy)
+    fake_openai.responder = _straggler_responder(fake_openai)
+
+    completion = llm_client.chat_completion(
+        messages=[{"role": "user", "content": "hello"}],
+        temperature=0
+    )
+
+    assert completion.choices[0].message.content == "slow"
+    assert policy.stats()["budget_denied"] == 1
+    assert not policy.applies({"temperature": 0.7})
@@ -0,0 +1,64 @@
+import json
+import sys
+from pathlib import Path
+
+# Add backend directory to Python path
+backend_path = str(Path(__file__).parent.parent.absolute())
+sys.path.insert(0, backend_path)
+
+from judge import LLMJudge
+from models import PromptTestCase
+from run_prompt_evaluate import PromptEvaluator
+
+def _judge_responder(messages, **params):
+    # Judge giả: đúng nếu khác nhau chỉ ở chữ hoa / thường
+    items = json.loads(messages[-1]["content"])["items"]
+    return json.dumps({"verdicts": [
+        {
+            "index": item["index"],
+            "score": 1.0 if item["actual"].lower() == item["expected"].lower() else 0.25,
+            "correct": item["actual"].lower() == item["expected"].lower(),
+            "reason": "ok"
+        }
+        for item in items
+    ]})
+
+def _cases(count):
+    return [
+        PromptTestCase(input=f"q{i}", expected_output=f"Đáp án {i}",
+                       prompt_output=f"ĐÁP ÁN {i}" if i % 2 else f"sai {i}")
+        for i in range(count)
+    ]
+
+def test_judge_batches_pairs_and_caches_verdicts(fake_openai):
+    fake_openai.responder = _judge_responder
+    evaluator = PromptEvaluator(LLMJudge(batch_size=40, max_concurrency=4))
+
+    result = evaluator.evaluate_testcases(_cases(100), mode="judge")
+    assert len(fake_openai.calls) == 3
+    assert result.accuracy == 0.5
+    assert result.judge.requests == 3 and result.judge.judged == 100
+    assert result.test_cases[1].is_correct and result.test_cases[1].judge_reason == "ok"
+    assert result.test_cases[0].similarity_score == 0.25
+
+    # Cặp không đổi không bị chấm lại
+    again = evaluator.evaluate_testcases(_cases(100), mode="judge")
+    assert len(fake_openai.calls) == 3
+    assert again.judge.cached == 100 and again.accuracy == 0.5
+
+def test_exact_and_empty_outputs_skip_the_judge(fake_openai):
+    cases = [
+        PromptTestCase(input="a", expected_output="same", prompt_output="same"),
+        PromptTestCase(input="b", expected_output="x", prompt_output="")
+    ]
+    result = PromptEvaluator(LLMJudge()).evaluate_testcases(cases, mode="judge")
+    assert fake_openai.calls == []
+    assert [case.is_correct for case in result.test_cases] == [True, False]
+
+def test_falls_back_to_text_similarity_when_judge_fails(fake_openai):
+    fake_openai.responder = lambda messages, **params: "not json"
+    cases = [PromptTestCase(input="a", expected_output="hello world", prompt_output="hello world!")]
+    result = PromptEvaluator(LLMJudge()).evaluate_testcases(cases, mode="judge")
+    assert result.judge.failed == 1
+    assert 0.9 < result.test_cases[0].similarity_score < 1.0
+    assert result.test_cases[0].judge_reason is None
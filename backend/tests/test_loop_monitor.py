@@ -0,0 +1,45 @@
+import sys
+import asyncio
+import time
+from pathlib import Path
+from fastapi.testclient import TestClient
+
+# Add backend directory to Python path
+backend_path = str(Path(__file__).parent.parent.absolute())
+sys.path.insert(0, backend_path)
+
+from loop_monitor import LoopLagMonitor
+from main import app
+
+def blocking_handler():
+    time.sleep(0.4)
+
+def test_blocking_call_is_detected_with_handler_and_stack():
+    monitor = LoopLagMonitor(interval=0.02, threshold=0.2)
+
+    async def scenario():
+        monitor.start()
+        await asyncio.sleep(0.1)
+        blocking_handler()
+        await asyncio.sleep(0.1)
+        await monitor.stop()
+
+    asyncio.run(scenario())
+    stats = monitor.stats()
+
+    assert stats["blocked_events"] == 1
+    block = stats["recent_blocks"][0]
+    assert block["handler"] == "test_loop_monitor.blocking_handler"
+    assert block["duration"] >= 0.3
+    assert any("blocking_handler" in line for line in block["stack"])
+    assert stats["max_lag"] >= 0.3
+    assert stats["lag_histogram"]["+Inf"] == stats["samples"]
+
+def test_health_and_metrics_export_loop_lag():
+    with TestClient(app) as client:
+        health = client.get("/health").json()
+        metrics = client.get("/metrics").json()
+
+    assert "lag_histogram" in health["event_loop"]
+    assert "recent_blocks" not in health["event_loop"]
+    assert "recent_blocks" in metrics["event_loop"]
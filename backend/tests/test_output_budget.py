@@ -0,0 +1,78 @@
+import sys
+from pathlib import Path
+
+# Add backend directory to Python path
+backend_path = str(Path(__file__).parent.parent.absolute())
+sys.path.insert(0, backend_path)
+
+from fastapi.testclient import TestClient
+from main import app
+from models import PromptTestCase
+from output_budget import derive_stop_sequences, plan_output_budget
+from run_prompt_with_testcases import PromptTestRunner
+
+VERBOSE = "Phát âm chuẩn\n\nGiải thích: " + "âm cuối được phát âm rõ ràng. " * 200
+
+def _cases(count, expected="Phát âm chuẩn"):
+    return [PromptTestCase(input=f"Đánh giá phát âm: 'word {i}'", expected_output=expected) for i in range(count)]
+
+def test_cap_follows_expected_output_lengths():
+    cases = _cases(9) + [PromptTestCase(input="dài", expected_output="x" * 400)]
+    suite = plan_output_budget(cases, "gpt-4o-mini", 2048, percentile=0.5)
+    per_case = plan_output_budget(cases, "gpt-4o-mini", 2048, mode="case")
+
+    assert 16 <= suite.cap < 100
+    assert per_case.cap_for(9) > per_case.cap_for(0)
+    assert per_case.cap_for(None) == per_case.cap
+    assert plan_output_budget([PromptTestCase(input="a", expected_output="")], "gpt-4o-mini", 2048) is None
+
+def test_stop_sequences_are_derived_conservatively():
+    assert derive_stop_sequences(["Phát âm chuẩn", "Phát âm không chuẩn"]) == ["\n"]
+    assert derive_stop_sequences(["dòng 1\ndòng 2"]) == ["\n\n"]
+    assert derive_stop_sequences(['{"score": 1}']) is None
+
+def test_stop_sequence_trims_verbose_outputs(fake_openai):
+    fake_openai.responder = lambda messages, **params: VERBOSE
+    test_cases = _cases(4)
+    budget = plan_output_budget(test_cases, "gpt-4o-mini", 2048)
+
+    PromptTestRunner().run_with_testcases("prompt", test_cases, output_budget=budget)
+
+    assert all(call["stop"] == ["\n"] and call["max_tokens"] == budget.cap for call in fake_openai.calls)
+    assert [case.prompt_output for case in test_cases] == ["Phát âm chuẩn"] * 4
+    stats = budget.stats()
+    assert stats.truncated == 0
+    assert stats.estimated_tokens_saved > 0 and stats.estimated_latency_saved >= 0
+
+def test_case_caps_are_keyed_by_position():
+    cases = [PromptTestCase(input="cùng input", expected_output="ngắn"),
+             PromptTestCase(input="cùng input", expected_output="y" * 400)]
+    budget = plan_output_budget(cases, "gpt-4o-mini", 2048, mode="case")
+
+    assert budget.cap_for(1) > budget.cap_for(0)
+
+def test_truncated_outputs_are_retried_without_cap(fake_openai):
+    fake_openai.responder = lambda messages, **params: VERBOSE.replace("\n", " ")
+    test_cases = _cases(3)
+    budget = plan_output_budget(test_cases, "gpt-4o-mini", 2048)
+
+    PromptTestRunner().run_with_testcases("prompt", test_cases, output_budget=budget)
+
+    assert len(fake_openai.calls) == 6
+    assert all(case.prompt_output == VERBOSE.replace("\n", " ").strip() for case in test_cases)
+    stats = budget.stats()
+    assert stats.truncated == stats.retried == 3 and stats.truncation_rate == 1.0
+
+def test_run_prompt_reports_output_budget(fake_openai):
+    fake_openai.responder = lambda messages, **params: VERBOSE
+    response = TestClient(app).post("/api/run-prompt", json={
+        "prompt": "prompt",
+        "test_cases": [case.model_dump() for case in _cases(5)],
+        "output_budget": "suite",
+        "retry_truncated": False
+    })
+    body = response.json()
+
+    assert body["output_budget"]["requests"] == 5
+    assert body["output_budget"]["stop"] == ["\n"]
+    assert all(case["prompt_output"] == "Phát âm chuẩn" for case in body["test_cases"])
@@ -0,0 +1,70 @@
+import sys
+import time
+from pathlib import Path
+from fastapi.testclient import TestClient
+
+# Add backend directory to Python path
+backend_path = str(Path(__file__).parent.parent.absolute())
+sys.path.insert(0, backend_path)
+
+import profiling
+from main import app
+
+def _payload():
+    return {
+        "test_cases": [
+            {"id": i, "input": "x", "expected_output": "a b c " * 300, "prompt_output": "a c b " * 300}
+            for i in range(100)
+        ]
+    }
+
+def test_admin_can_profile_a_single_request(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILING_ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_INTERVAL", 0.001)
+
+    with TestClient(app) as client:
+        response = client.post(
+            "/api/evaluate-results",
+            json=_payload(),
+            headers={"x-profile": "1", "x-admin-token": "secret"}
+        )
+        assert response.status_code == 200
+        profile_id = response.headers["x-profile-id"]
+
+        speedscope = client.get(f"/api/admin/profiles/{profile_id}", headers={"x-admin-token": "secret"})
+        summary = client.get(
+            f"/api/admin/profiles/{profile_id}?summary=true", headers={"x-admin-token": "secret"}
+        )
+        forbidden = client.get(f"/api/admin/profiles/{profile_id}")
+
+    assert speedscope.json()["$schema"].startswith("https://www.speedscope.app")
+    assert speedscope.json()["profiles"]
+    assert summary.json()["request"] == "POST /api/evaluate-results"
+    assert "event_loop" in summary.json()
+    assert forbidden.status_code == 403
+
+def test_profiling_ignored_without_valid_admin_token(tmp_path, monkeypatch):
+    profile_dir = tmp_path / "profiles"
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(profile_dir))
+
+    with TestClient(app) as client:
+        monkeypatch.setattr(profiling, "PROFILING_ADMIN_TOKEN", "")
+        disabled = client.post("/api/evaluate-results?profile=1", json=_payload())
+        monkeypatch.setattr(profiling, "PROFILING_ADMIN_TOKEN", "secret")
+        wrong_token = client.post(
+            "/api/evaluate-results", json=_payload(), headers={"x-profile": "1", "x-admin-token": "guess"}
+        )
+
+    assert "x-profile-id" not in disabled.headers
+    assert "x-profile-id" not in wrong_token.headers
+    assert not profile_dir.exists()
+
+def test_is_admin_checks_token(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILING_ADMIN_TOKEN", "secret")
+    assert profiling.is_admin("secret")
+    assert not profiling.is_admin("secre")
+    assert not profiling.is_admin("sécret")
+    assert not profiling.is_admin(None)
+    monkeypatch.setattr(profiling, "PROFILING_ADMIN_TOKEN", "")
+    assert not profiling.is_admin("")
@@ -0,0 +1,67 @@
+import sys
+from pathlib import Path
+
+# Add backend directory to Python path
+backend_path = str(Path(__file__).parent.parent.absolute())
+sys.path.insert(0, backend_path)
+
+from models import PromptTestCase
+from prompt_optimizer import PromptOptimizer, OPTIMIZER_SYSTEM_PROMPT
+from run_prompt_with_testcases import PromptTestRunner
+from run_prompt_evaluate import PromptEvaluator
+
+def _responder(messages, **params):
+    system = messages[0]["content"]
+    if system == OPTIMIZER_SYSTEM_PROMPT:
+        return ["BAD prompt 1", "GOOD prompt", "BAD prompt 2", "BAD prompt 3"]
+    if system == "GOOD prompt":
+        return messages[-1]["content"].upper()
+    return "wrong"
+
+def test_optimizer_finds_better_prompt_with_fewer_calls(fake_openai):
+    fake_openai.responder = _responder
+    test_cases = [PromptTestCase(input=f"case {i}", expected_output=f"CASE {i}") for i in range(16)]
+    optimizer = PromptOptimizer(PromptTestRunner(), PromptEvaluator(), num_candidates=4, seed=0)
+
+    result = optimizer.optimize("start prompt", test_cases, target_accuracy=0.9, max_iterations=3)
+
+    assert result.prompt == "GOOD prompt"
+    assert result.accuracy == 1.0
+    assert result.iterations == 1
+    assert [history.accuracy for history in result.history] == [0.0, 1.0]
+    run_calls = [call for call in fake_openai.calls if call["messages"][0]["content"] != OPTIMIZER_SYSTEM_PROMPT]
+    # Chấm full suite cho cả 4 candidate sẽ tốn 16 + 4 * 16 call
+    assert len(run_calls) < 16 + 4 * 16
+    # Suite gốc không bị sửa khi chấm candidate
+    assert all(case.prompt_output == "" for case in test_cases)
+
+def test_propose_edits_returns_distinct_new_prompts(fake_openai):
+    fake_openai.responder = lambda messages, **params: [
+        "```\nFixed prompt\n```", "Fixed prompt", "Original prompt", "Other prompt"
+    ]
+    failing = [PromptTestCase(input="test1", expected_output="output1", prompt_output="wrong")]
+
+    candidates = PromptOptimizer(PromptTestRunner(), PromptEvaluator()).propose_edits("Original prompt", failing, 4)
+
+    assert candidates == ["Fixed prompt", "Other prompt"]
+    assert fake_openai.calls[0]["n"] == 4
+    assert "Got: wrong" in fake_openai.calls[0]["messages"][1]["content"]
+
+def test_propose_edits_returns_nothing_when_api_fails(fake_openai):
+    def fail(messages, **params):
+        raise RuntimeError("API down")
+    fake_openai.responder = fail
+
+    assert PromptOptimizer(PromptTestRunner(), PromptEvaluator()).propose_edits("Original prompt", [], 2) == []
+
+def test_optimizer_stops_when_no_candidates(fake_openai):
+    fake_openai.responder = lambda messages, **params: (
+        ["start prompt"] if messages[0]["content"] == OPTIMIZER_SYSTEM_PROMPT else "wrong"
+    )
+    test_cases = [PromptTestCase(input="a", expected_output="A")]
+
+    result = PromptOptimizer(PromptTestRunner(), PromptEvaluator()).optimize("start prompt", test_cases)
+
+    assert result.prompt == "start prompt"
+    assert result.iterations == 0
+    assert len(result.history) == 1
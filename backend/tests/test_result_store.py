@@ -0,0 +1,159 @@
+import sys
+from pathlib import Path
+from fastapi.testclient import TestClient
+
+# Add backend directory to Python path
+backend_path = str(Path(__file__).parent.parent.absolute())
+sys.path.insert(0, backend_path)
+
+import result_store
+from models import PromptTestCase
+from main import app
+
+def _cases(count):
+    return [
+        PromptTestCase(
+            input=f"input {i}" + (" đặc biệt" if i % 10 == 0 else ""),
+            expected_output="x",
+            prompt_output="x" if i % 2 == 0 else "y",
+            is_correct=i % 2 == 0,
+            similarity_score=i / count
+        )
+        for i in range(count)
+    ]
+
+def test_store_appends_and_queries_pages(isolated_result_store):
+    run_id, writer = isolated_result_store.create_run("test")
+    cases = _cases(100)
+    writer.append(cases[:60])
+    # Run đang ghi vẫn đọc được phần đã flush
+    assert isolated_result_store.query(run_id).total == 60
+    writer.append(cases[60:])
+    writer.close()
+
+    page = isolated_result_store.query(run_id, offset=10, limit=5, is_correct=False)
+    assert page.total == 100
+    assert page.matched == 50
+    assert [item.position for item in page.items] == [21, 23, 25, 27, 29]
+    assert page.items[0].input == "input 21"
+
+    ranged = isolated_result_store.query(run_id, min_similarity=0.5, max_similarity=0.6, limit=1000)
+    assert [item.position for item in ranged.items] == list(range(50, 61))
+
+    search = isolated_result_store.query(run_id, input_contains="ĐẶC BIỆT", is_correct=True)
+    assert search.matched == 10
+    assert search.items[-1].position == 90
+
+    positions, failures = isolated_result_store.failures(run_id)
+    assert positions == list(range(1, 100, 2))
+    assert all(not case.is_correct for case in failures)
+
+def test_legacy_run_builds_position_index(isolated_result_store):
+    import os
+
+    run_id, writer = isolated_result_store.create_run("test")
+    writer.append(_cases(20))
+    writer.close()
+    directory = isolated_result_store._run_dir(run_id)
+    os.remove(os.path.join(directory, "pass.idx"))
+    os.remove(os.path.join(directory, "fail.idx"))
+
+    page = isolated_result_store.query(run_id, is_correct=True, offset=2, limit=3)
+    assert page.matched == 10
+    assert [item.position for item in page.items] == [4, 6, 8]
+    assert os.path.exists(os.path.join(directory, "fail.idx"))
+
+def test_retention_prunes_oldest_runs(isolated_result_store, monkeypatch):
+    import json
+    import os
+
+    monkeypatch.setattr(isolated_result_store, "max_runs", 2)
+    monkeypatch.setattr(isolated_result_store, "max_age_days", 1)
+    stale, writer = isolated_result_store.create_run("test")
+    writer.close()
+    meta_path = os.path.join(isolated_result_store._run_dir(stale), "meta.json")
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+    meta["created_at"] -= 2 * 86400
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    run_ids = []
+    for _ in range(3):
+        run_id, writer = isolated_result_store.create_run("test")
+        writer.close()
+        run_ids.append(run_id)
+
+    assert [run["run_id"] for run in isolated_result_store.list_runs()] == run_ids[:0:-1]
+
+def test_run_results_are_browsable_through_api(fake_openai):
+    with TestClient(app) as client:
+        run = client.post("/api/run-prompt", json={
+            "prompt": "echo",
+            "test_cases": [case.model_dump() for case in _cases(5)]
+        }).json()
+        page = client.get(f"/api/runs/{run['run_id']}/results", params={"limit": 2, "offset": 1}).json()
+        runs = client.get("/api/runs").json()
+        deleted = client.delete(f"/api/runs/{run['run_id']}")
+        missing = client.get(f"/api/runs/{run['run_id']}/results")
+
+    assert page["total"] == 5
+    assert [item["input"] for item in page["items"]] == ["input 1", "input 2"]
+    assert runs[0]["run_id"] == run["run_id"]
+    assert runs[0]["prompt"] == "echo"
+    assert deleted.status_code == 200
+    assert missing.status_code == 404
+
+def test_diff_pairs_cases_by_input_hash(isolated_result_store):
+    base = _cases(20)
+    head = [case.model_copy() for case in _cases(20)]
+    head[3] = head[3].model_copy(update={"prompt_output": "x", "is_correct": True})    # fixed
+    head[4] = head[4].model_copy(update={"prompt_output": "z", "is_correct": False})   # regressed
+    head[5] = head[5].model_copy(update={"prompt_output": "z"})                        # changed
+    head.insert(0, PromptTestCase(input="mới", expected_output="x"))                   # added, lệch vị trí
+    del head[-1]                                                                       # removed
+    base_id = isolated_result_store.save("run-prompt", base)
+    head_id = isolated_result_store.save("run-prompt", head)
+
+    diff = isolated_result_store.diff(base_id, head_id)
+    assert diff.counts == {"regressed": 1, "fixed": 1, "changed": 1, "added": 1, "removed": 1, "unchanged": 16}
+    assert [(item.status, item.input) for item in diff.items] == [
+        ("added", "mới"), ("fixed", "input 3"), ("regressed", "input 4"), ("changed", "input 5"),
+        ("removed", "input 19")
+    ]
+    changed = diff.items[3]
+    assert (changed.base_position, changed.head_position) == (5, 6)
+    assert changed.diff.endswith("-y\n+z")
+
+    unchanged = isolated_result_store.diff(base_id, head_id, status=["unchanged"], limit=5)
+    assert unchanged.matched == 16 and len(unchanged.items) == 5
+
+def test_diff_skips_identical_blocks(isolated_result_store, monkeypatch):
+    monkeypatch.setattr(result_store, "DIFF_BLOCK_ENTRIES", 4)
+    base = _cases(20)
+    head = [case.model_copy() for case in base]
+    head[9] = head[9].model_copy(update={"prompt_output": "z"})
+    base_id = isolated_result_store.save("run-prompt", base)
+    head_id = isolated_result_store.save("run-prompt", head)
+    store = isolated_result_store
+
+    pairs, unchanged = store._pair(store._diff_blob(base_id), store._diff_blob(head_id))
+    assert pairs == [("changed", 9, 9)]
+    assert unchanged == [(0, 9), (10, 20)]
+
+    diff = store.diff(base_id, head_id, status=["unchanged"], limit=100)
+    assert diff.counts["unchanged"] == 19
+    assert [item.head_position for item in diff.items] == [p for p in range(20) if p != 9]
+
+def test_diff_endpoint(fake_openai):
+    with TestClient(app) as client:
+        cases = [case.model_dump() for case in _cases(5)]
+        first = client.post("/api/run-prompt", json={"prompt": "a", "test_cases": cases}).json()
+        fake_openai.responder = lambda messages, **params: "khác" if messages[-1]["content"] == "input 2" else messages[-1]["content"]
+        second = client.post("/api/run-prompt", json={"prompt": "b", "test_cases": cases}).json()
+        diff = client.get(f"/api/runs/{first['run_id']}/diff/{second['run_id']}").json()
+        invalid = client.get(f"/api/runs/{first['run_id']}/diff/{second['run_id']}", params={"status": "weird"})
+
+    assert diff["counts"]["changed"] == 1 and diff["counts"]["unchanged"] == 4
+    assert diff["items"][0]["head_output"] == "khác"
+    assert invalid.status_code == 400
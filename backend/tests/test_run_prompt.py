@@ -0,0 +1,89 @@
+import json
+import sys
+from pathlib import Path
+
+# Add backend directory to Python path
+backend_path = str(Path(__file__).parent.parent.absolute())
+sys.path.insert(0, backend_path)
+
+from models import PromptTestCase, PackingStats
+from run_prompt_with_testcases import PromptTestRunner
+from usage_tracker import track_usage
+
+def _packed_responder(skip_index=None):
+    def responder(messages, **params):
+        if params.get("response_format") == {"type": "json_object"}:
+            items = json.loads(messages[-1]["content"])["items"]
+            answers = [
+                {"index": item["index"], "output": item["input"].upper()}
+                for item in items if item["index"] != skip_index
+            ]
+            return json.dumps({"answers": answers}, ensure_ascii=False)
+        return messages[-1]["content"].upper()
+    return responder
+
+def test_packed_run_uses_k_times_fewer_requests(fake_openai):
+    fake_openai.responder = _packed_responder()
+    test_cases = [PromptTestCase(input=f"phát âm {i}", expected_output="") for i in range(10)]
+    stats = PackingStats()
+
+    PromptTestRunner().run_with_testcases("prompt", test_cases, pack_size=5, packing_stats=stats)
+
+    assert len(fake_openai.calls) == 2
+    assert [tc.prompt_output for tc in test_cases] == [f"PHÁT ÂM {i}" for i in range(10)]
+    assert stats == PackingStats(packed_requests=2, packed_items=10, fallback_items=0)
+
+def test_unmapped_answers_are_rerun_individually(fake_openai):
+    fake_openai.responder = _packed_responder(skip_index=1)
+    test_cases = [PromptTestCase(input=f"input {i}", expected_output="") for i in range(3)]
+    stats = PackingStats()
+
+    PromptTestRunner().run_with_testcases("prompt", test_cases, pack_size=3, packing_stats=stats)
+
+    assert len(fake_openai.calls) == 2
+    assert test_cases[1].prompt_output == "INPUT 1"
+    assert stats.fallback_items == 1
+
+def test_unparseable_packed_response_falls_back(fake_openai):
+    fake_openai.responder = lambda messages, **params: "not json"
+    test_cases = [PromptTestCase(input=f"input {i}", expected_output="") for i in range(2)]
+
+    PromptTestRunner().run_with_testcases("prompt", test_cases, pack_size=2)
+
+    assert len(fake_openai.calls) == 3
+    assert all(tc.prompt_output == "not json" for tc in test_cases)
+
+def test_consistency_mode_uses_one_request_per_case(fake_openai):
+    fake_openai.responder = lambda messages, **params: ["Phát âm chuẩn", "Phát âm không chuẩn", "Phát âm chuẩn"]
+    test_cases = [PromptTestCase(input=f"input {i}", expected_output="Phát âm chuẩn") for i in range(4)]
+
+    PromptTestRunner().run_with_testcases("prompt", test_cases, num_samples=3, temperature=1.0)
+
+    assert len(fake_openai.calls) == 4
+    assert all(call["n"] == 3 and call["temperature"] == 1.0 for call in fake_openai.calls)
+    assert test_cases[0].samples == ["Phát âm chuẩn", "Phát âm không chuẩn", "Phát âm chuẩn"]
+    assert test_cases[0].prompt_output == "Phát âm chuẩn"
+
+def test_long_prompt_primes_prefix_cache(fake_openai):
+    fake_openai.prefix_cache = True
+    prompt = "Bạn là một chuyên gia đánh giá phát âm. " * 200
+    test_cases = [PromptTestCase(input=f"input {i}", expected_output="") for i in range(8)]
+
+    with track_usage() as usage:
+        PromptTestRunner(max_workers=8).run_with_testcases(prompt, test_cases)
+
+    stats = usage.cache_stats()
+    # Chỉ request đầu tiên trả đủ prompt token, 7 request còn lại dùng lại prefix đã cache
+    assert stats["requests"] == 8
+    assert stats["cached_tokens"] == 7 * (len(prompt) // 4 // 128 * 128)
+    assert 0.8 < stats["cache_hit_ratio"] < 1
+    assert stats["estimated_savings"] > 0
+
+def test_missing_cached_tokens_field_reports_zero(fake_openai):
+    test_cases = [PromptTestCase(input="hello", expected_output="")]
+
+    with track_usage() as usage:
+        PromptTestRunner().run_with_testcases("prompt", test_cases)
+
+    assert usage.cache_stats()["cached_tokens"] == 0
+    assert usage.cache_stats()["prompt_tokens"] > 0
@@ -0,0 +1,74 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+# Add backend directory to Python path
+backend_path = str(Path(__file__).parent.parent.absolute())
+sys.path.insert(0, backend_path)
+
+import run_suite
+
+def _write_suite(path, count, header=None):
+    lines = [json.dumps(header)] if header else []
+    lines += [json.dumps({"input": f"q{i}", "expected_output": f"q{i}" if i % 4 else "khác"}) for i in range(count)]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+def test_cli_streams_results_and_gates_on_accuracy(fake_openai, tmp_path, capsys):
+    suite = tmp_path / "suite.jsonl"
+    _write_suite(suite, 20, header={"prompt": "echo"})
+    output = tmp_path / "results.jsonl"
+
+    code = run_suite.main([str(suite), "-o", str(output), "--batch-size", "8", "--min-accuracy", "0.9"])
+
+    results = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+    summary = json.loads(capsys.readouterr().err.strip().splitlines()[-2])
+    assert code == 1
+    assert [case["input"] for case in results] == [f"q{i}" for i in range(20)]
+    assert summary["cases"] == 20 and summary["accuracy"] == 0.75
+    assert summary["requests"] == 20 and summary["latency_p95"] >= summary["latency_p50"]
+
+def test_cli_cache_skips_model_calls_on_rerun(fake_openai, tmp_path, capsys):
+    suite = tmp_path / "suite.jsonl"
+    _write_suite(suite, 10)
+    prompt = tmp_path / "prompt.txt"
+    prompt.write_text("echo", encoding="utf-8")
+    args = [str(suite), "--prompt-file", str(prompt), "-o", str(tmp_path / "out.jsonl"),
+            "--cache", str(tmp_path / "cache.jsonl")]
+
+    assert run_suite.main(args) == 0
+    assert len(fake_openai.calls) == 10
+    assert run_suite.main(args) == 0
+    assert len(fake_openai.calls) == 10
+    summary = json.loads(capsys.readouterr().err.strip().splitlines()[-1])
+    assert summary["cache_hits"] == 10 and summary["accuracy"] == 0.7
+
+def test_cli_cache_skips_degraded_batches_and_keys_on_pack_size(fake_openai, tmp_path, monkeypatch):
+    import llm_client
+    from circuit_breaker import mark_degraded
+
+    suite = tmp_path / "suite.jsonl"
+    _write_suite(suite, 4, header={"prompt": "echo"})
+    cache = tmp_path / "cache.jsonl"
+    args = [str(suite), "-o", str(tmp_path / "out.jsonl"), "--cache", str(cache)]
+    chat_completion = llm_client.chat_completion
+
+    def fallback_completion(**kwargs):
+        mark_degraded("fallback_model:gpt-4o-mini->gpt-4o")
+        return chat_completion(**kwargs)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(llm_client, "chat_completion", fallback_completion)
+        run_suite.main(args)
+    assert not cache.exists() or cache.read_text(encoding="utf-8") == ""
+
+    run_suite.main(args)
+    assert len(fake_openai.calls) == 8
+    run_suite.main(args + ["--pack-size", "2"])
+    assert len(fake_openai.calls) > 8
+
+def test_help_does_not_import_heavy_modules():
+    code = ("import sys, run_suite; run_suite.parse_args(['suite.jsonl']); "
+            "print(any(name in sys.modules for name in ('openai', 'pydantic', 'starlette')))")
+    result = subprocess.run([sys.executable, "-c", code], cwd=backend_path, capture_output=True, text=True)
+    assert result.stdout.strip() == "False"
@@ -0,0 +1,52 @@
+import sys
+import asyncio
+from pathlib import Path
+from fastapi.testclient import TestClient
+
+# Add backend directory to Python path
+backend_path = str(Path(__file__).parent.parent.absolute())
+sys.path.insert(0, backend_path)
+
+import llm_client
+from main import app
+from runtime import ServerStats
+
+def test_app_imports_without_api_key(monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    llm_client.reset_client()
+
+    with TestClient(app) as client:
+        response = client.get("/health")
+
+    assert response.status_code == 200
+    server = response.json()["server"]
+    assert server["cold_start"] is not None
+    assert server["first_request_latency"] is not None
+
+def test_client_is_lazy_and_cached(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    llm_client.reset_client()
+
+    first = llm_client.get_client()
+    second = llm_client.get_client()
+
+    assert first is second
+    llm_client.reset_client()
+
+def test_drain_waits_for_in_flight_requests():
+    stats = ServerStats()
+    stats.request_started()
+
+    async def finish_later():
+        await asyncio.sleep(0.2)
+        stats.request_finished(0.2)
+
+    async def scenario():
+        task = asyncio.create_task(finish_later())
+        drained = await stats.drain(timeout=2)
+        await task
+        return drained
+
+    assert asyncio.run(scenario()) is True
+    assert stats.in_flight == 0
+    assert stats.first_request_latency == 0.2
@@ -0,0 +1,88 @@
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Add backend directory to Python path
+backend_path = str(Path(__file__).parent.parent.absolute())
+sys.path.insert(0, backend_path)
+
+from scheduler import ModelScheduler, Workload, BULK, INTERACTIVE, _ClassQueue, _Ticket
+
+def _wait_for_depth(sched, priority, depth):
+    deadline = time.time() + 2
+    while sched.stats()["classes"][priority]["queue_depth"] < depth and time.time() < deadline:
+        time.sleep(0.005)
+
+def test_interactive_uses_reserved_slot_while_bulk_saturates():
+    sched = ModelScheduler(max_concurrency=2, interactive_reserved=1)
+    bulk = Workload(BULK, "regression-run")
+    sched.acquire(bulk)
+
+    # Bulk thứ hai phải chờ vì slot còn lại là của interactive
+    waiter = threading.Thread(target=lambda: sched.release(sched.acquire(bulk)))
+    waiter.start()
+    _wait_for_depth(sched, BULK, 1)
+
+    start = time.time()
+    interactive = sched.acquire(Workload(INTERACTIVE, "other-user"))
+    assert time.time() - start < 0.5
+
+    stats = sched.stats()["classes"]
+    assert stats[BULK]["queue_depth"] == 1
+    assert stats[INTERACTIVE]["in_flight"] == 1
+
+    sched.release(interactive)
+    sched.release(bulk)
+    waiter.join(timeout=2)
+    assert sched.stats()["classes"][BULK]["dispatched"] == 2
+
+def test_tenants_share_slots_fairly():
+    sched = ModelScheduler(max_concurrency=1, interactive_reserved=0)
+    blocker = sched.acquire(Workload(BULK, "blocker"))
+    order = []
+    threads = []
+
+    for i, tenant in enumerate(["a", "a", "a", "a", "b", "b"]):
+        def run(tenant=tenant):
+            workload = sched.acquire(Workload(BULK, tenant))
+            order.append(tenant)
+            sched.release(workload)
+        thread = threading.Thread(target=run)
+        thread.start()
+        threads.append(thread)
+        _wait_for_depth(sched, BULK, i + 1)
+
+    sched.release(blocker)
+    for thread in threads:
+        thread.join(timeout=2)
+
+    assert order == ["a", "b", "a", "b", "a", "a"]
+
+def test_rate_limit_spaces_out_calls():
+    # 600 RPM = 10 call/giây, burst tối đa 10 call
+    sched = ModelScheduler(max_concurrency=50, interactive_reserved=0, rate_limit_rpm=600)
+    start = time.time()
+    for _ in range(13):
+        sched.release(sched.acquire(Workload(BULK, "sweep")))
+
+    # 10 call đầu dùng burst, 3 call sau phải chờ quota hồi lại (~0.1s mỗi call)
+    assert time.time() - start >= 0.25
+    assert sched.try_acquire(Workload(BULK, "sweep")) is None
+
+def test_idle_tenants_do_not_hold_back_new_tenants():
+    queue = _ClassQueue()
+    for seq, tenant in enumerate(["b", "b", "b", "a"]):
+        queue.push(_Ticket(seq, Workload(BULK, tenant)))
+    assert [queue.pop().workload.tenant for _ in range(3)] == ["b", "a", "b"]
+    # "a" đã idle với virtual time nhỏ hơn "b": tenant mới bắt đầu từ mốc của "b" (tenant đang chờ)
+    queue.push(_Ticket(4, Workload(BULK, "c")))
+    assert queue.virtual_time["c"] == queue.virtual_time["b"] == 2.0
+    assert "a" not in queue.virtual_time
+    queue.pop(); queue.pop()
+    assert queue.virtual_time == {}
+
+def test_limits_are_split_across_workers():
+    sched = ModelScheduler(max_concurrency=16, interactive_reserved=4, rate_limit_rpm=600, workers=4)
+    stats = sched.stats()
+    assert (stats["workers"], stats["max_concurrency"], stats["bulk_limit"], stats["rate_limit_rpm"]) == (4, 4, 3, 150)
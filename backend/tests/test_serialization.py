@@ -0,0 +1,69 @@
+import gzip
+import json
+import sys
+from pathlib import Path
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+# Add backend directory to Python path
+backend_path = str(Path(__file__).parent.parent.absolute())
+sys.path.insert(0, backend_path)
+
+from compression import CompressionMiddleware, negotiate
+from serialization import FastJSONResponse
+from bench_serialization import make_response, default_path
+
+def _app():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware)
+
+    @app.get("/suite")
+    async def suite():
+        return FastJSONResponse(make_response(50))
+
+    @app.get("/small")
+    async def small():
+        return {"status": "ok"}
+
+    @app.get("/stream")
+    async def stream():
+        async def rows():
+            for i in range(3):
+                yield json.dumps({"row": i, "text": "Phát âm chuẩn " * 100}) + "\n"
+        return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+    return TestClient(app)
+
+def test_fast_response_matches_default_encoding():
+    response = make_response(20)
+    assert json.loads(FastJSONResponse(response).body) == json.loads(default_path(response))
+
+def test_negotiate_honours_q_values():
+    assert negotiate("gzip, br", ["br", "gzip"]) == "br"
+    assert negotiate("br;q=0.5, gzip", ["br", "gzip"]) == "gzip"
+    assert negotiate("*", ["br", "gzip"]) == "br"
+    assert negotiate("identity", ["br", "gzip"]) is None
+    assert negotiate("gzip;q=0", ["br", "gzip"]) is None
+
+def test_large_responses_are_compressed_small_ones_are_not():
+    client = _app()
+    br = client.get("/suite", headers={"accept-encoding": "br"})
+    assert br.headers["content-encoding"] == "br"
+    assert "Accept-Encoding" in br.headers["vary"]
+    assert br.json()["test_cases"][0]["similarity_score"] == 0.87
+
+    response = client.get("/suite", headers={"accept-encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.json()["test_cases"]) == 50
+
+    small = client.get("/small", headers={"accept-encoding": "gzip, br"})
+    assert "content-encoding" not in small.headers
+
+def test_streamed_responses_are_compressed_per_chunk():
+    client = _app()
+    with client.stream("GET", "/stream", headers={"accept-encoding": "gzip"}) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        body = gzip.decompress(b"".join(response.iter_raw()))
+    assert [json.loads(line)["row"] for line in body.decode().splitlines()] == [0, 1, 2]
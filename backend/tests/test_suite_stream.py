@@ -0,0 +1,121 @@
+import sys
+import csv
+import io
+import json
+import pytest
+from pathlib import Path
+from fastapi.testclient import TestClient
+
+# Add backend directory to Python path
+backend_path = str(Path(__file__).parent.parent.absolute())
+sys.path.insert(0, backend_path)
+
+import suite_stream
+from main import app
+
+def _chunked(text: str, size: int = 7):
+    data = text.encode("utf-8")
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+def test_jsonl_suite_runs_while_streaming_and_keeps_order(fake_openai, monkeypatch):
+    monkeypatch.setattr(suite_stream, "SUITE_BATCH_SIZE", 3)
+    lines = [json.dumps({"prompt": "Lặp lại input"})] + [
+        json.dumps({"input": f"câu {i}", "expected_output": f"câu {i}" if i % 2 else "khác"})
+        for i in range(10)
+    ]
+
+    with TestClient(app) as client:
+        response = client.post(
+            "/api/suites/run",
+            content=_chunked("\n".join(lines) + "\n"),
+            headers={"content-type": "application/x-ndjson"}
+        )
+
+    assert response.status_code == 200
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert [case["input"] for case in results] == [f"câu {i}" for i in range(10)]
+    assert all(case["prompt_output"] == case["input"] for case in results)
+    assert [case["is_correct"] for case in results] == [bool(i % 2) for i in range(10)]
+    assert fake_openai.calls[0]["messages"][0]["content"] == "Lặp lại input"
+
+def test_csv_suite_evaluates_and_exports_csv(monkeypatch):
+    monkeypatch.setattr(suite_stream, "SUITE_BATCH_SIZE", 2)
+    body = io.StringIO()
+    writer = csv.writer(body)
+    writer.writerow(["input", "expected_output", "prompt_output"])
+    writer.writerow(["a", "dòng 1\ndòng 2", "dòng 1\ndòng 2"])
+    writer.writerow(["b", "có, dấu phẩy", "sai"])
+    writer.writerow(["c", "x", "x"])
+
+    with TestClient(app) as client:
+        response = client.post(
+            "/api/suites/evaluate",
+            content=_chunked(body.getvalue()),
+            headers={"content-type": "text/csv"}
+        )
+
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["input"] for row in rows] == ["a", "b", "c"]
+    assert rows[0]["expected_output"] == "dòng 1\ndòng 2"
+    assert [row["is_correct"] for row in rows] == ["True", "False", "True"]
+
+def test_invalid_record_mid_stream_emits_error_line(fake_openai, monkeypatch):
+    monkeypatch.setattr(suite_stream, "SUITE_BATCH_SIZE", 2)
+    lines = [json.dumps({"prompt": "Lặp lại input"})] + [
+        json.dumps({"input": f"câu {i}", "expected_output": f"câu {i}"}) for i in range(3)
+    ] + ["{hỏng", json.dumps({"input": "không chạy", "expected_output": "x"})]
+
+    with TestClient(app) as client:
+        response = client.post("/api/suites/run", content="\n".join(lines) + "\n",
+                               headers={"content-type": "application/x-ndjson"})
+
+    assert response.status_code == 200
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert [case["input"] for case in results[:-1]] == ["câu 0", "câu 1", "câu 2"]
+    assert "line 5" in results[-1]["error"]
+    assert len(fake_openai.calls) == 3
+
+def test_suite_rejects_unknown_mode():
+    with TestClient(app) as client:
+        response = client.post(
+            "/api/suites/evaluate",
+            content=json.dumps({"mode": "fuzzy"}) + "\n" + json.dumps({"input": "a", "expected_output": "a"}) + "\n"
+        )
+
+    assert response.status_code == 400
+
+def test_disconnect_after_upload_cancels_run():
+    import asyncio
+    import threading
+    from cancellation import CancellationToken, RunCancelledError
+
+    token = CancellationToken()
+    started = threading.Event()
+
+    def process(batch):
+        started.set()
+        token.sleep(5)
+        return batch
+
+    async def cases():
+        yield suite_stream.PromptTestCase(input="a", expected_output="a")
+
+    async def is_disconnected():
+        return started.is_set()
+
+    async def consume():
+        return [batch async for batch in suite_stream.process_in_batches(
+            cases(), process, token, is_disconnected=is_disconnected)]
+
+    with pytest.raises(RunCancelledError):
+        asyncio.run(consume())
+    assert token.cancelled
+    assert token.reason == "client disconnected"
+
+def test_run_suite_requires_prompt():
+    with TestClient(app) as client:
+        response = client.post("/api/suites/run", content=b'{"input": "a", "expected_output": "a"}\n')
+
+    assert response.status_code == 400
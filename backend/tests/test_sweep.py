@@ -0,0 +1,82 @@
+import sys
+from pathlib import Path
+from fastapi.testclient import TestClient
+
+# Add backend directory to Python path
+backend_path = str(Path(__file__).parent.parent.absolute())
+sys.path.insert(0, backend_path)
+
+from models import PromptTestCase, SweepConfig, SweepConfigResult, SweepRequest
+from run_prompt_evaluate import PromptEvaluator
+from sweep import OutputCache, PromptSweep, pareto_front
+from main import app
+
+def _responder(messages, model, **params):
+    # gpt-4o trả đúng mọi case, gpt-4o-mini chỉ đúng input "a"
+    text = messages[-1]["content"]
+    return text if model == "gpt-4o" or text == "a" else "sai"
+
+def _request(**overrides):
+    cases = [PromptTestCase(input=text, expected_output=text) for text in ["a", "b", "a", "c"]]
+    return SweepRequest(prompt="echo " * 1000, test_cases=cases, models=["gpt-4o-mini", "gpt-4o"], **overrides)
+
+def test_sweep_scores_each_config_and_dedupes_inputs(fake_openai):
+    fake_openai.responder = _responder
+    sweep = PromptSweep(PromptEvaluator(), cache=OutputCache(), max_concurrency=4)
+
+    response = sweep.run(_request(target_accuracy=0.9))
+
+    mini, large = response.results
+    assert response.unique_inputs == 3
+    assert len(fake_openai.calls) == 6
+    assert mini.accuracy == 0.5 and large.accuracy == 1.0
+    assert mini.requests == 3
+    assert 0 < mini.cost < large.cost
+    assert response.cheapest_at_target == SweepConfig(model="gpt-4o")
+    # Model rẻ hơn nhưng kém hơn: cả hai đều nằm trên Pareto front
+    assert [config.model for config in response.pareto] == ["gpt-4o-mini", "gpt-4o"]
+
+def test_deterministic_outputs_are_reused_across_sweeps(fake_openai):
+    cache = OutputCache()
+    PromptSweep(PromptEvaluator(), cache=cache).run(_request())
+    calls = len(fake_openai.calls)
+
+    response = PromptSweep(PromptEvaluator(), cache=cache).run(_request(temperatures=[0.0, 1.0]))
+
+    # Chỉ các config temperature=1 phải gọi model
+    assert len(fake_openai.calls) - calls == 6
+    assert [result.cached_results for result in response.results] == [3, 0, 3, 0]
+    # Config dùng cache vẫn báo cost thật, phần không phải trả nằm ở cache_savings
+    cached_mini, fresh_mini = response.results[0], response.results[1]
+    assert cached_mini.requests == 0 and cached_mini.cost == fresh_mini.cost > 0
+    assert cached_mini.cache_savings == cached_mini.cost and fresh_mini.cache_savings == 0
+    assert cached_mini.prompt_tokens == fresh_mini.prompt_tokens
+
+def test_sweep_rejects_invalid_concurrency():
+    case = PromptTestCase(input="a", expected_output="a").model_dump()
+    response = TestClient(app).post("/api/sweep", json={"prompt": "p", "test_cases": [case], "max_concurrency": 0})
+
+    assert response.status_code == 422
+
+def test_sweep_rejects_empty_suite():
+    response = TestClient(app).post("/api/sweep", json={"prompt": "p", "test_cases": []})
+
+    assert response.status_code == 422
+    assert PromptEvaluator().evaluate_testcases([]).accuracy == 0.0
+
+def test_pareto_front_drops_dominated_configs():
+    def result(accuracy, cost, latency):
+        return SweepConfigResult(
+            config=SweepConfig(), accuracy=accuracy, avg_similarity=accuracy,
+            latency_p50=latency, latency_p95=latency, latency_p99=latency,
+            requests=1, cached_results=0, prompt_tokens=0, completion_tokens=0, cost=cost
+        )
+
+    assert pareto_front([result(0.9, 1.0, 1.0), result(0.8, 2.0, 2.0), result(0.7, 0.5, 1.0)]) == [0, 2]
+
+def test_sweep_endpoint_stores_each_config(fake_openai):
+    with TestClient(app) as client:
+        response = client.post("/api/sweep", json=_request().model_dump())
+
+    assert response.status_code == 200
+    assert all(result["run_id"] for result in response.json()["results"])
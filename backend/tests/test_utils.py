@@ -10,8 +10,7 @@ from models import Sample, PromptTestCase
 from utils import (
     generate_prompt_from_samples,
     generate_test_cases,
-    evaluate_prompt,
-    update_prompt
+    evaluate_prompt
 )
 
 def test_generate_prompt_from_samples():
@@ -64,22 +63,4 @@ def test_evaluate_prompt():
     accuracy, response_time = evaluate_prompt(prompt, test_cases)
     
     assert accuracy == 0.5  # 1 out of 2 correct
-    assert response_time > 0
-
-def test_update_prompt():
-    current_prompt = "Original prompt"
-    test_cases = [
-        PromptTestCase(
-            input="test1",
-            expected_output="output1",
-            actual_output="output1",
-            is_correct=True,
-            similarity_score=1.0
-        )
-    ]
-    accuracy = 0.75
-    
-    updated_prompt = update_prompt(current_prompt, test_cases, accuracy)
-    
-    assert current_prompt in updated_prompt
-    assert "0.75" in updated_prompt 
\ No newline at end of file
+    assert response_time > 0
\ No newline at end of file
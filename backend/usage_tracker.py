@@ -0,0 +1,174 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+from cancellation import RunCancelledError
+
+# Giá USD / 1M token (input, cached input, output)
+MODEL_PRICES = {
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+    "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+}
+DEFAULT_PRICE = MODEL_PRICES["gpt-4o-mini"]
+
+
+def _field(obj: Any, name: str) -> Any:
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def cached_prompt_tokens(usage: Any) -> int:
+    """Đọc usage.prompt_tokens_details.cached_tokens, trả 0 nếu API không trả field này"""
+    cached = _field(_field(usage, "prompt_tokens_details"), "cached_tokens")
+    return int(cached) if isinstance(cached, (int, float)) else 0
+
+
+def price_for(model: str) -> Dict[str, float]:
+    return MODEL_PRICES.get(model, DEFAULT_PRICE)
+
+
+class BudgetExceededError(RunCancelledError):
+    """Run đã dùng hết budget token / USD: không gửi thêm call mới"""
+
+
+class RunUsage:
+    """Token usage cộng dồn của một run (thread-safe).
+
+    budget_tokens / budget_usd: khi tổng đã dùng chạm budget, call mới của run bị từ chối
+    bằng BudgetExceededError (call đang chạy vẫn được tính nên có thể vượt budget một chút).
+    """
+
+    def __init__(self, budget_tokens: Optional[int] = None, budget_usd: Optional[float] = None,
+                 label: Optional[str] = None):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.savings = 0.0
+        self.cost = 0.0
+        self.budget_tokens = budget_tokens
+        self.budget_usd = budget_usd
+        self.budget_exceeded = False
+        self.rejected_calls = 0
+        self.label = label
+        self.started_at = time.time()
+
+    def check_budget(self) -> None:
+        """Gọi trước mỗi model call; raise BudgetExceededError nếu budget đã hết"""
+        with self._lock:
+            exhausted = (
+                (self.budget_tokens is not None and self.prompt_tokens + self.completion_tokens >= self.budget_tokens)
+                or (self.budget_usd is not None and self.cost >= self.budget_usd)
+            )
+            if not exhausted:
+                return
+            self.budget_exceeded = True
+            self.rejected_calls += 1
+        raise BudgetExceededError("Run budget exhausted")
+
+    def record(self, model: str, usage: Any) -> None:
+        if usage is None:
+            return
+        prompt_tokens = _field(usage, "prompt_tokens") or 0
+        completion_tokens = _field(usage, "completion_tokens") or 0
+        cached = cached_prompt_tokens(usage)
+        price = price_for(model)
+
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.cached_tokens += cached
+            self.savings += cached * (price["input"] - price["cached_input"]) / 1_000_000
+            self.cost += (
+                (prompt_tokens - cached) * price["input"]
+                + cached * price["cached_input"]
+                + completion_tokens * price["output"]
+            ) / 1_000_000
+
+    def merge(self, other: "RunUsage") -> None:
+        """Cộng usage của other vào run này"""
+        with other._lock:
+            snapshot = (other.requests, other.prompt_tokens, other.completion_tokens,
+                        other.cached_tokens, other.savings, other.cost)
+        requests, prompt_tokens, completion_tokens, cached, savings, cost = snapshot
+        with self._lock:
+            self.requests += requests
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.cached_tokens += cached
+            self.savings += savings
+            self.cost += cost
+
+    def cache_stats(self) -> Dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_tokens": self.cached_tokens,
+                "cache_hit_ratio": self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+                "estimated_savings": round(self.savings, 6)
+            }
+
+    def summary(self) -> Dict:
+        """Usage của run cho response (UsageStats) và /api/usage/active"""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "cached_tokens": self.cached_tokens,
+                "cost": round(self.cost, 6),
+                "budget_tokens": self.budget_tokens,
+                "budget_usd": self.budget_usd,
+                "budget_exceeded": self.budget_exceeded,
+                "rejected_calls": self.rejected_calls
+            }
+
+
+_current_usage: contextvars.ContextVar[Optional[RunUsage]] = contextvars.ContextVar(
+    "run_usage", default=None
+)
+
+
+def current_usage() -> Optional[RunUsage]:
+    return _current_usage.get()
+
+
+_active_lock = threading.Lock()
+_active_runs: Dict[int, RunUsage] = {}
+
+
+def active_runs() -> List[Dict]:
+    """Counter trực tiếp của các run có label đang chạy trong worker"""
+    with _active_lock:
+        runs = list(_active_runs.values())
+    return [
+        {"label": usage.label, "elapsed": time.time() - usage.started_at, **usage.summary()}
+        for usage in runs
+    ]
+
+
+@contextmanager
+def track_usage(usage: Optional[RunUsage] = None, **options):
+    """Gom usage của mọi model call trong block (kể cả thread con dùng copy_context).
+
+    options (budget_tokens, budget_usd, label) dùng khi tạo RunUsage mới; run có label
+    được liệt kê trong active_runs() cho tới khi block kết thúc.
+    """
+    usage = usage if usage is not None else RunUsage(**options)
+    reset = _current_usage.set(usage)
+    if usage.label:
+        with _active_lock:
+            _active_runs[id(usage)] = usage
+    try:
+        yield usage
+    finally:
+        _current_usage.reset(reset)
+        with _active_lock:
+            _active_runs.pop(id(usage), None)
@@ -3,10 +3,12 @@ import time
 import os
 from openai import OpenAI
 import logging
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 from models import Sample, PromptTestCase
 from prompt_generator import generate_prompt
 from test_case_generator import generate_test_cases as gen_test_cases
+from cancellation import RunCancelledError
+import llm_client
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -46,9 +48,10 @@ def call_openai_api(client, messages, max_retries=3):
             logger.warning(f"Attempt {try_count} failed: {str(e)}. Retrying in {try_count} seconds...")
             time.sleep(try_count)  # Linear backoff
 
-def generate_prompt_from_samples(format_output: str, samples: List[Sample], conditions: str) -> str:
+def generate_prompt_from_samples(format_output: str, samples: List[Sample], conditions: str,
+                                 seed: Optional[int] = None, regenerate: bool = False) -> str:
     """Generate a prompt based on format, samples and conditions"""
-    return generate_prompt(format_output, samples, conditions)
+    return generate_prompt(format_output, samples, conditions, seed=seed, regenerate=regenerate)
 
 def generate_test_cases(prompt: str, num_cases: int = 5) -> List[PromptTestCase]:
     """Generate test cases for the given prompt"""
@@ -76,12 +79,6 @@ def evaluate_prompt(prompt: str, test_cases: List[PromptTestCase]) -> Tuple[floa
     try:
         start = time.time()
         
-        # Initialize OpenAI client
-        client = OpenAI(
-            api_key=os.getenv('OPENAI_API_KEY'),
-            timeout=60.0
-        )
-        
         correct_cases = 0
         
         for test_case in test_cases:
@@ -98,8 +95,7 @@ def evaluate_prompt(prompt: str, test_cases: List[PromptTestCase]) -> Tuple[floa
                     }
                 ]
                 
-                response = client.chat.completions.create(
-                    model="gpt-4o-mini",
+                response = llm_client.chat_completion(
                     messages=messages,
                     temperature=0.7,
                     max_tokens=1024
@@ -115,6 +111,8 @@ def evaluate_prompt(prompt: str, test_cases: List[PromptTestCase]) -> Tuple[floa
                 if test_case.is_correct:
                     correct_cases += 1
                     
+            except RunCancelledError:
+                raise
             except Exception as e:
                 logger.error(f"Error evaluating test case: {str(e)}")
                 continue
@@ -124,10 +122,8 @@ def evaluate_prompt(prompt: str, test_cases: List[PromptTestCase]) -> Tuple[floa
         
         return accuracy, response_time
         
+    except RunCancelledError:
+        raise
     except Exception as e:
         logger.error(f"Error in evaluate_prompt: {str(e)}", exc_info=True)
-        return 0.0, 0.0
-
-def update_prompt(current_prompt: str, test_cases: List[PromptTestCase], accuracy: float) -> str:
-    """Update prompt based on evaluation results"""
-    return current_prompt + f"\n[Updated based on accuracy: {accuracy:.2f}]" 
\ No newline at end of file
+        return 0.0, 0.0
\ No newline at end of file
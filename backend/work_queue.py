@@ -0,0 +1,395 @@
+import itertools
+import json
+import logging
+from abc import ABC, abstractmethod
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# sqlite:///path/to/queue.db | spool:///path/to/dir | memory://
+WORK_QUEUE_URL = os.getenv("WORK_QUEUE_URL", "sqlite:///work_queue.db")
+# Worker giữ chunk trong thời gian này; quá hạn chưa xong thì worker khác nhận lại
+LEASE_SECONDS = float(os.getenv("WORK_QUEUE_LEASE_SECONDS", "300"))
+MAX_ATTEMPTS = int(os.getenv("WORK_QUEUE_MAX_ATTEMPTS", "5"))
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+class Task(NamedTuple):
+    run_id: str
+    chunk_id: int
+    payload: Dict[str, Any]
+    attempt: int
+
+
+class WorkQueue(ABC):
+    """Hàng đợi chunk giữa coordinator và worker.
+
+    Ngữ nghĩa at-least-once: chunk được lease cho một worker, lease hết hạn thì
+    chunk được giao lại. complete() là idempotent: kết quả đầu tiên của một chunk
+    được giữ, các lần hoàn thành trùng sau đó bị bỏ qua. claim() giao chunk theo thứ
+    tự publish (FIFO giữa các run), run_id ngẫu nhiên không ảnh hưởng thứ tự.
+    """
+
+    @abstractmethod
+    def publish(self, run_id: str, chunks: List[Dict[str, Any]]) -> None:
+        ...
+
+    @abstractmethod
+    def claim(self, worker_id: str, lease_seconds: float = LEASE_SECONDS) -> Optional[Task]:
+        ...
+
+    @abstractmethod
+    def complete(self, task: Task, result: Dict[str, Any]) -> bool:
+        """Trả về False nếu chunk đã có kết quả từ trước (bản trùng)"""
+
+    @abstractmethod
+    def release(self, task: Task) -> None:
+        """Trả chunk lại hàng đợi (worker lỗi nhưng vẫn còn sống)"""
+
+    @abstractmethod
+    def progress(self, run_id: str) -> Dict[str, int]:
+        ...
+
+    @abstractmethod
+    def results(self, run_id: str) -> Dict[int, Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def failed(self, run_id: str) -> Dict[int, Dict[str, Any]]:
+        """Payload của các chunk đã quá số lần thử (không có kết quả)"""
+
+
+class SQLiteQueue(WorkQueue):
+    """Queue trên một file SQLite (WAL), dùng được từ nhiều process / node chung ổ đĩa"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS chunks (
+                    run_id TEXT NOT NULL,
+                    chunk_id INTEGER NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_until REAL,
+                    worker TEXT,
+                    result TEXT,
+                    PRIMARY KEY (run_id, chunk_id)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS chunks_status ON chunks (status, lease_until)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # Mỗi thao tác một connection: an toàn giữa các thread và process
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def publish(self, run_id: str, chunks: List[Dict[str, Any]]) -> None:
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT OR IGNORE INTO chunks (run_id, chunk_id, payload, status) VALUES (?, ?, ?, ?)",
+                [(run_id, i, json.dumps(chunk, ensure_ascii=False), PENDING) for i, chunk in enumerate(chunks)]
+            )
+            conn.execute("COMMIT")
+
+    def claim(self, worker_id: str, lease_seconds: float = LEASE_SECONDS) -> Optional[Task]:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # Chunk quá số lần thử thì đánh dấu failed thay vì giao lại mãi
+            conn.execute(
+                "UPDATE chunks SET status = ? WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                (FAILED, LEASED, now, MAX_ATTEMPTS)
+            )
+            # rowid tăng theo thứ tự insert: run publish trước được nhận trước
+            row = conn.execute(
+                """SELECT run_id, chunk_id, payload, attempts FROM chunks
+                   WHERE status = ? OR (status = ? AND lease_until < ?)
+                   ORDER BY rowid LIMIT 1""",
+                (PENDING, LEASED, now)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                """UPDATE chunks SET status = ?, attempts = attempts + 1, lease_until = ?, worker = ?
+                   WHERE run_id = ? AND chunk_id = ?""",
+                (LEASED, now + lease_seconds, worker_id, row["run_id"], row["chunk_id"])
+            )
+            conn.execute("COMMIT")
+        return Task(row["run_id"], row["chunk_id"], json.loads(row["payload"]), row["attempts"] + 1)
+
+    def complete(self, task: Task, result: Dict[str, Any]) -> bool:
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE chunks SET status = ?, result = ? WHERE run_id = ? AND chunk_id = ? AND status != ?",
+                (DONE, json.dumps(result, ensure_ascii=False), task.run_id, task.chunk_id, DONE)
+            )
+            return cursor.rowcount == 1
+
+    def release(self, task: Task) -> None:
+        with self._connect() as conn:
+            # Chunk lỗi quá số lần thử thì failed, tránh giao lại mãi một chunk hỏng
+            conn.execute(
+                """UPDATE chunks SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, lease_until = NULL
+                   WHERE run_id = ? AND chunk_id = ? AND status = ?""",
+                (MAX_ATTEMPTS, FAILED, PENDING, task.run_id, task.chunk_id, LEASED)
+            )
+
+    def progress(self, run_id: str) -> Dict[str, int]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT status, COUNT(*) AS count FROM chunks WHERE run_id = ? GROUP BY status", (run_id,)
+            ).fetchall()
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        counts.update({row["status"]: row["count"] for row in rows})
+        return counts
+
+    def results(self, run_id: str) -> Dict[int, Dict[str, Any]]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT chunk_id, result FROM chunks WHERE run_id = ? AND status = ?", (run_id, DONE)
+            ).fetchall()
+        return {row["chunk_id"]: json.loads(row["result"]) for row in rows}
+
+    def failed(self, run_id: str) -> Dict[int, Dict[str, Any]]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT chunk_id, payload FROM chunks WHERE run_id = ? AND status = ?", (run_id, FAILED)
+            ).fetchall()
+        return {row["chunk_id"]: json.loads(row["payload"]) for row in rows}
+
+
+class SpoolQueue(WorkQueue):
+    """Queue trên thư mục (ví dụ NFS): claim bằng os.rename nguyên tử, kết quả ghi
+    bằng os.link (chỉ bản đầu tiên thành công)."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        for name in ("pending", "leased", "done", "failed"):
+            os.makedirs(os.path.join(directory, name), exist_ok=True)
+
+    def _path(self, state: str, name: str) -> str:
+        return os.path.join(self.directory, state, name)
+
+    @staticmethod
+    def _name(run_id: str, chunk_id: int) -> str:
+        return f"{run_id}__{chunk_id:08d}.json"
+
+    def _write(self, path: str, data: Dict[str, Any]) -> None:
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def publish(self, run_id: str, chunks: List[Dict[str, Any]]) -> None:
+        for i, chunk in enumerate(chunks):
+            self._write(self._path("pending", self._name(run_id, i)),
+                        {"run_id": run_id, "chunk_id": i, "attempts": 0, "payload": chunk})
+
+    def _reclaim_expired(self) -> None:
+        now = time.time()
+        for name in os.listdir(os.path.join(self.directory, "leased")):
+            # leased/<chunk file>@<lease_until>
+            base, _, lease_until = name.rpartition("@")
+            if base and not name.endswith(".tmp") and float(lease_until) < now:
+                try:
+                    os.rename(self._path("leased", name), self._path("pending", base))
+                except FileNotFoundError:
+                    pass
+
+    def _published_at(self, name: str) -> int:
+        # mtime của file chunk là lúc publish (giữ nguyên qua rename và khi claim ghi lại)
+        try:
+            return os.stat(self._path("pending", name)).st_mtime_ns
+        except FileNotFoundError:
+            return 0  # Đã bị worker khác nhận, rename bên dưới sẽ bỏ qua
+
+    def claim(self, worker_id: str, lease_seconds: float = LEASE_SECONDS) -> Optional[Task]:
+        self._reclaim_expired()
+        names = [name for name in os.listdir(os.path.join(self.directory, "pending")) if name.endswith(".json")]
+        for name in sorted(names, key=lambda name: (self._published_at(name), name)):
+            leased = self._path("leased", f"{name}@{time.time() + lease_seconds:.3f}")
+            try:
+                os.rename(self._path("pending", name), leased)
+            except FileNotFoundError:
+                continue  # Worker khác đã nhận chunk này
+            published_at = os.stat(leased).st_mtime_ns
+            with open(leased, encoding="utf-8") as f:
+                data = json.load(f)
+            data["attempts"] += 1
+            done = os.path.exists(self._path("done", name))
+            if done or data["attempts"] > MAX_ATTEMPTS:
+                # Bản trùng của chunk đã xong (lease cũ hết hạn) hoặc đã quá số lần thử
+                if not done:
+                    self._write(self._path("failed", name), data)
+                os.remove(leased)
+                continue
+            self._write(leased, data)
+            os.utime(leased, ns=(published_at, published_at))
+            return Task(data["run_id"], data["chunk_id"], data["payload"], data["attempts"])
+        return None
+
+    def _leased_files(self, task: Task) -> List[str]:
+        prefix = self._name(task.run_id, task.chunk_id) + "@"
+        return [
+            name for name in os.listdir(os.path.join(self.directory, "leased"))
+            if name.startswith(prefix) and not name.endswith(".tmp")
+        ]
+
+    def complete(self, task: Task, result: Dict[str, Any]) -> bool:
+        name = self._name(task.run_id, task.chunk_id)
+        tmp = self._path("done", f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False)
+        try:
+            os.link(tmp, self._path("done", name))
+            first = True
+        except FileExistsError:
+            first = False
+        finally:
+            os.remove(tmp)
+        for leased in self._leased_files(task):
+            try:
+                os.remove(self._path("leased", leased))
+            except FileNotFoundError:
+                pass
+        return first
+
+    def release(self, task: Task) -> None:
+        for leased in self._leased_files(task):
+            try:
+                os.rename(self._path("leased", leased), self._path("pending", leased.rpartition("@")[0]))
+            except FileNotFoundError:
+                pass
+
+    def progress(self, run_id: str) -> Dict[str, int]:
+        counts = {}
+        for state in (PENDING, LEASED, DONE, FAILED):
+            counts[state] = sum(
+                1 for name in os.listdir(os.path.join(self.directory, state))
+                if name.startswith(f"{run_id}__") and not name.endswith(".tmp")
+            )
+        return counts
+
+    def results(self, run_id: str) -> Dict[int, Dict[str, Any]]:
+        results = {}
+        for name in os.listdir(os.path.join(self.directory, "done")):
+            if name.startswith(f"{run_id}__") and name.endswith(".json"):
+                with open(self._path("done", name), encoding="utf-8") as f:
+                    results[int(name[len(run_id) + 2:-5])] = json.load(f)
+        return results
+
+    def failed(self, run_id: str) -> Dict[int, Dict[str, Any]]:
+        payloads = {}
+        for name in os.listdir(os.path.join(self.directory, "failed")):
+            if name.startswith(f"{run_id}__") and name.endswith(".json"):
+                with open(self._path("failed", name), encoding="utf-8") as f:
+                    data = json.load(f)
+                payloads[data["chunk_id"]] = data["payload"]
+        return payloads
+
+
+class MemoryQueue(WorkQueue):
+    """Queue trong process, đứng thay cho Redis khi chạy local / test.
+
+    Chỉ dùng được khi coordinator và worker thread cùng một process: worker.py và các
+    gunicorn worker khác không thấy queue này (open_queue từ chối khi WEB_CONCURRENCY > 1).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._chunks: Dict[tuple, Dict[str, Any]] = {}
+        self._sequence = itertools.count()
+
+    def publish(self, run_id: str, chunks: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            for i, chunk in enumerate(chunks):
+                self._chunks.setdefault((run_id, i), {
+                    "payload": chunk, "status": PENDING, "attempts": 0, "lease_until": 0.0, "result": None,
+                    "sequence": next(self._sequence)
+                })
+
+    def claim(self, worker_id: str, lease_seconds: float = LEASE_SECONDS) -> Optional[Task]:
+        now = time.time()
+        with self._lock:
+            for (run_id, chunk_id), chunk in sorted(self._chunks.items(), key=lambda item: item[1]["sequence"]):
+                expired = chunk["status"] == LEASED and chunk["lease_until"] < now
+                if expired and chunk["attempts"] >= MAX_ATTEMPTS:
+                    chunk["status"] = FAILED
+                    continue
+                if chunk["status"] == PENDING or expired:
+                    chunk.update(status=LEASED, lease_until=now + lease_seconds, attempts=chunk["attempts"] + 1)
+                    return Task(run_id, chunk_id, chunk["payload"], chunk["attempts"])
+        return None
+
+    def complete(self, task: Task, result: Dict[str, Any]) -> bool:
+        with self._lock:
+            chunk = self._chunks[(task.run_id, task.chunk_id)]
+            if chunk["status"] == DONE:
+                return False
+            chunk.update(status=DONE, result=result)
+            return True
+
+    def release(self, task: Task) -> None:
+        with self._lock:
+            chunk = self._chunks[(task.run_id, task.chunk_id)]
+            if chunk["status"] == LEASED:
+                chunk["status"] = FAILED if chunk["attempts"] >= MAX_ATTEMPTS else PENDING
+
+    def progress(self, run_id: str) -> Dict[str, int]:
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        with self._lock:
+            for (chunk_run, _), chunk in self._chunks.items():
+                if chunk_run == run_id:
+                    counts[chunk["status"]] += 1
+        return counts
+
+    def results(self, run_id: str) -> Dict[int, Dict[str, Any]]:
+        with self._lock:
+            return {
+                chunk_id: chunk["result"]
+                for (chunk_run, chunk_id), chunk in self._chunks.items()
+                if chunk_run == run_id and chunk["status"] == DONE
+            }
+
+    def failed(self, run_id: str) -> Dict[int, Dict[str, Any]]:
+        with self._lock:
+            return {
+                chunk_id: chunk["payload"]
+                for (chunk_run, chunk_id), chunk in self._chunks.items()
+                if chunk_run == run_id and chunk["status"] == FAILED
+            }
+
+
+def open_queue(url: str = WORK_QUEUE_URL) -> WorkQueue:
+    if url.startswith("sqlite:///"):
+        return SQLiteQueue(url[len("sqlite:///"):])
+    if url.startswith("spool:///"):
+        return SpoolQueue(url[len("spool:///"):])
+    if url.startswith("memory://"):
+        if int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+            raise ValueError("memory:// work queue only works in a single process, use sqlite:/// or spool:///")
+        return MemoryQueue()
+    raise ValueError(f"Unsupported work queue URL: {url}")
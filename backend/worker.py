@@ -0,0 +1,25 @@
+import argparse
+import logging
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Worker chạy các chunk của distributed run")
+    parser.add_argument("--queue", default=None, help="URL queue (mặc định WORK_QUEUE_URL)")
+    parser.add_argument("--concurrency", type=int, default=None, help="Số test case chạy song song mỗi chunk")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    from work_queue import open_queue, WORK_QUEUE_URL
+    from distributed import Worker
+    from run_prompt_with_testcases import PromptTestRunner, RUN_CONCURRENCY
+    from run_prompt_evaluate import PromptEvaluator
+
+    logging.basicConfig(level=logging.INFO)
+    url = args.queue or WORK_QUEUE_URL
+    if url.startswith("memory://"):
+        # Queue trong bộ nhớ không chia sẻ được với process của API server
+        parser.error("memory:// queue cannot be shared with a separate worker process")
+    queue = open_queue(url)
+    worker = Worker(queue, PromptTestRunner(max_workers=args.concurrency or RUN_CONCURRENCY), PromptEvaluator())
+    worker.run_forever()